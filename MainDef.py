@@ -3,23 +3,183 @@ SQL血缘分析工具
 用于分析SQL语句中的表和字段之间的血缘关系,并提供可视化功能
 """
 
-import textwrap
-from typing import Union, Set, List
+import bisect
+import bz2
+import contextlib
+import fnmatch
+import functools
+import glob
+import gzip
+import hashlib
+import html
+import io
+import itertools
+import json
+import lzma
+import os
+import pickle
+import re
+import signal
+import sqlite3
+import sys
+import threading
+import time
+import types
+import weakref
+from array import array
+from collections import OrderedDict, defaultdict
+from datetime import datetime, timezone
+from typing import Union, Set, List, Tuple, Iterator, IO, TYPE_CHECKING
 
 import sqlparse
-from sqlparse.sql import Parenthesis, Function, Identifier, IdentifierList
-from sqlparse.tokens import Keyword, Name
-import pyecharts
-from pyecharts import options as opts
-from pyecharts.charts import Tree, Sankey
+from sqlparse import keywords
+from sqlparse.sql import Parenthesis, Function, Identifier, IdentifierList, Where
+from sqlparse.engine import grouping
+from sqlparse.engine.statement_splitter import StatementSplitter
+from sqlparse.exceptions import SQLParseError
+from sqlparse.lexer import Lexer
+from sqlparse.tokens import (Keyword, Name, Comment, Whitespace, Newline,
+                             Punctuation, String, Number, Operator, Wildcard,
+                             Assignment, Generic, Error)
+if TYPE_CHECKING:  # pyecharts只在可视化时导入，见 load_pyecharts
+    from pyecharts.charts import Tree, Sankey
 
 
 # 常量定义
+ANALYZER_VERSION = '9'  # 分析逻辑变化时递增，使已有缓存失效
 COLUMN_OPERATIONS = {'SELECT', 'FROM'}
 FUNCTION_OPERATIONS = {'SELECT', 'DROP', 'INSERT', 'UPDATE', 'CREATE'}
 RESULT_OPERATIONS = {'UNION', 'INTERSECT', 'EXCEPT', 'SELECT'}
 PRECEDES_TABLE_NAME = {'FROM', 'JOIN', 'DESC', 'DESCRIBE', 'WITH'}
 ON_KEYWORD = 'ON'
+SELECT_MODIFIERS = frozenset({'DISTINCT', 'ALL', 'TOP'})
+REPORT_HEAD = '''<!DOCTYPE html>
+<html>
+<head>
+<meta charset="UTF-8">
+<title>{title}</title>
+<script src="{script}"></script>
+<style>
+body {{ font-family: sans-serif; margin: 20px; }}
+.chart {{ width: 100%; height: {height}px; }}
+pre {{ white-space: pre-wrap; background: #f6f8fa; padding: 8px; }}
+</style>
+</head>
+<body>
+<h1>{title}</h1>
+'''
+REPORT_TAIL = '''<script>
+(function () {
+  var charts = [];
+  function show(div) {
+    var option = JSON.parse(div.firstElementChild.textContent);
+    var chart = echarts.init(div);
+    chart.setOption(option);
+    charts.push(chart);
+  }
+  var divs = document.querySelectorAll('.chart');
+  if (!('IntersectionObserver' in window)) {
+    divs.forEach(show);
+  } else {
+    var observer = new IntersectionObserver(function (entries) {
+      entries.forEach(function (entry) {
+        if (entry.isIntersecting) {
+          observer.unobserve(entry.target);
+          show(entry.target);
+        }
+      });
+    }, {rootMargin: '200px'});
+    divs.forEach(function (div) { observer.observe(div); });
+  }
+  window.addEventListener('resize', function () {
+    charts.forEach(function (chart) { chart.resize(); });
+  });
+})();
+</script>
+</body>
+</html>
+'''
+COMMENT_TTYPES = frozenset({Comment, Comment.Single, Comment.Multiline})
+WHERE_CLOSE_KEYWORDS = frozenset(Where.M_CLOSE[1])
+# 快速路径不处理的过程块关键字和语法，遇到时回退到完整解析
+FAST_PATH_BLOCK_KEYWORDS = frozenset({'BEGIN', 'DECLARE', 'IF', 'FOR', 'FOREACH', 'LOOP', 'WHILE'})
+FAST_PATH_PUNCTUATION = frozenset({'::', '[', ']'})
+FAST_PATH_MAX_TOKENS = 10000  # sqlparse 单层分组的token上限
+FAST_PATH_MAX_DEPTH = 15      # 括号嵌套上限，保证低于 sqlparse 的分组深度限制
+# 运算符链上限: sqlparse 把 "a + b + c" 分组为逐层嵌套的运算，每层括号约占4层，
+# 超过分组深度时完整解析跳过该语句，接近上限的语句交给完整解析
+FAST_PATH_MAX_CHAIN = 60
+FAST_PATH_PAREN_FRAMES = 4
+# 语句预分类: 按首个关键字分流，'full' 分析表和字段血缘，'tables' 只分析表血缘，'skip' 跳过，
+# 未列出的语句按 'full' 处理，CREATE 和 WITH 见 classify_statement
+STATEMENT_ROUTES = {
+    'INSERT': 'full', 'REPLACE': 'full', 'UPSERT': 'full', 'MERGE': 'full', 'UPDATE': 'full',
+    'SELECT': 'tables', 'DELETE': 'tables',
+    'SET': 'skip', 'USE': 'skip', 'DROP': 'skip', 'ALTER': 'skip', 'TRUNCATE': 'skip',
+    'GRANT': 'skip', 'REVOKE': 'skip', 'SHOW': 'skip', 'DESC': 'skip', 'DESCRIBE': 'skip',
+    'EXPLAIN': 'skip', 'ANALYZE': 'skip', 'COMMENT': 'skip', 'COMMIT': 'skip',
+    'ROLLBACK': 'skip', 'START': 'skip', 'RESET': 'skip', 'VACUUM': 'skip',
+    'REFRESH': 'skip', 'MSCK': 'skip',
+}
+# 关键字判定的查找表，按关键字规范值缓存子串匹配结果
+TABLE_NAME_CACHE = {}
+FUNCTION_NAME_CACHE = {}
+RESULT_OPERATION_CACHE = {}
+COMPRESSED_OPENERS = {'.gz': gzip.open, '.bz2': bz2.open, '.xz': lzma.open}
+SQL_FILE_SUFFIXES = ('.sql', '.sql.gz', '.sql.bz2', '.sql.xz', '.hql')
+CACHE_FILE_NAME = 'bloodline_cache.sqlite3'
+TEMPORARY_TABLE_PATTERN = re.compile(r'^(#|tmp_|temp_)', re.IGNORECASE)
+# 美元符号引用($$ 或 $tag$)紧跟在标识符之后时不是引用(如 v$session)，在切分时判断
+STATEMENT_BOUNDARY = re.compile(r"\\.|--|/\*|\*/|['\"`;()]|\$(?:[A-Za-z_]\w*)?\$")
+# 可能开始存储过程语句块的关键字，块内的分号不结束语句
+BLOCK_KEYWORD = re.compile(r'\b(?:BEGIN|DECLARE)\b', re.IGNORECASE)
+# 语法树遍历的默认最大深度，None 为不限制。遍历使用显式栈，不受递归限制，
+# 语法树的深度已由 sqlparse 的分组深度上限(100层)约束
+MAX_WALK_DEPTH = None
+NULL_PHASE = contextlib.nullcontext()  # 未开启性能统计时使用的空计时上下文
+LEXER_PROFILES = ('default', 'lineage')
+_lexer_profile = 'default'           # 见 set_lexer_profile
+QUERY_LOG_SQL_FIELD = 'query'        # 查询日志JSONL中语句文本的字段
+QUERY_LOG_TIME_FIELD = 'timestamp'   # 查询日志JSONL中执行时间的字段
+FINGERPRINT_CACHE_SIZE = 100000      # 读取单个日志时复用指纹的语句文本数上限
+EPOCH_MILLIS_THRESHOLD = 1e11        # 数值时间戳超过该值时按毫秒处理(1e11秒已是5138年)
+_lineage_lexer = None               # 首次使用时创建的 LineageLexer 实例
+
+class Scope:
+    """查询作用域
+
+    每个SELECT/CTE/子查询对应一个作用域，保存本层的 别名->表 映射和待解析的列引用，
+    限定列名通过逐层向外查找别名直接定位到表。
+    """
+    __slots__ = ('parent', 'aliases', 'tables', 'columns', 'outputs',
+                 'output_aliases', 'top_level')
+
+    def __init__(self, parent=None, top_level=False):
+        self.parent = parent
+        self.aliases = {}            # 别名/表名(小写) -> 表下标，派生表为None
+        self.tables = []             # 本层FROM/JOIN中的表下标
+        self.columns = []            # 待解析的列引用 (限定名, 列名)
+        self.outputs = []            # SELECT列表的输出列名
+        self.output_aliases = set()  # SELECT列表中的别名(小写)
+        self.top_level = top_level   # 是否为语句最外层的SELECT
+
+    def lookup(self, qualifier: str):
+        """由内向外查找限定名，返回 (是否找到, 表下标)"""
+        scope = self
+        while scope is not None:
+            if qualifier in scope.aliases:
+                return True, scope.aliases[qualifier]
+            scope = scope.parent
+        return False, None
+
+    def default_table(self):
+        """未限定列默认归属的表: 由内向外第一个有表的作用域中的第一个表"""
+        scope = self
+        while scope is not None:
+            if scope.tables:
+                return scope.tables[0]
+            scope = scope.parent
+        return None
 
 class GlobalState:
     """全局状态管理类"""
@@ -28,7 +188,12 @@ class GlobalState:
         self.column_names = []    # 存储列名
         self.function_names = []  # 存储函数名
         self.alias_names = []     # 存储别名
-        self.columns_rank = 0     # 列的层级
+        self.cte_tables = {}      # WITH子句名称 -> 其定义中引用的表名
+        self.table_columns = defaultdict(dict)  # 表下标 -> 有序去重的列名
+        self.target_index = None  # 目标表下标
+        self.target_token = None  # 目标表所在的第一层标识符
+        self.scope = Scope()      # 当前作用域
+        self.truncated = False    # 是否因超过最大深度跳过了子树
 
     def reset(self):
         """重置所有状态"""
@@ -61,51 +226,854 @@ class TokenUtils:
         """判断是否为括号"""
         return isinstance(token, Parenthesis)
 
+    @staticmethod
+    def has_parenthesis(token):
+        """判断标识符中是否包含括号，按语法树结构判断而不拼接文本"""
+        stack = [token]
+        while stack:
+            token = stack.pop()
+            if isinstance(token, Parenthesis):
+                return True
+            if token.is_group:
+                stack.extend(token.tokens)
+            elif token.ttype is Punctuation and token.value == '(':
+                return True
+        return False
+
+    @staticmethod
+    def _keyword_match(cache, keywords, token_value):
+        """查表判断关键字是否包含 keywords 中的任一项，每个关键字只做一次子串匹配"""
+        result = cache.get(token_value)
+        if result is None:
+            upper_value = token_value.upper()
+            result = cache[token_value] = any(keyword in upper_value for keyword in keywords)
+        return result
+
     @staticmethod
     def precedes_function_name(token_value):
         """判断是否为函数名前缀"""
-        return any(keyword in token_value for keyword in FUNCTION_OPERATIONS)
+        return TokenUtils._keyword_match(FUNCTION_NAME_CACHE, FUNCTION_OPERATIONS, token_value)
 
     @staticmethod
     def precedes_table_name(token_value):
         """判断是否为表名前缀"""
-        return any(keyword in token_value for keyword in PRECEDES_TABLE_NAME)
+        return TokenUtils._keyword_match(TABLE_NAME_CACHE, PRECEDES_TABLE_NAME, token_value)
+
+    @staticmethod
+    def is_cte_definition(identifier):
+        """判断是否为WITH子句的定义 "name AS (...)" """
+        tokens = identifier.tokens
+        return (len(tokens) > 2 and TokenUtils.is_parenthesis(tokens[-1]) and
+                any(token.is_keyword and token.normalized == 'AS'
+                    for token in tokens[1:-1]))
+
+    @staticmethod
+    def expression_tokens(identifier, alias):
+        """去掉别名部分(" AS alias" 或 " alias")后的表达式token"""
+        tokens = identifier.tokens
+        if not alias:
+            return tokens
+        end = len(tokens) - 1
+        while end > 0 and (tokens[end - 1].is_whitespace or
+                           (tokens[end - 1].is_keyword and
+                            tokens[end - 1].normalized == 'AS')):
+            end -= 1
+        return tokens[:end]
+
+    @staticmethod
+    def column_reference(tokens):
+        """解析 "列"、"表.列"、"库.表.列" 形式的列引用
+
+        Returns:
+            (限定名或None, 列名)，不是简单列引用或为通配符时返回None
+        """
+        parts = []
+        for position, token in enumerate(tokens):
+            if position % 2:
+                if token.ttype is not Punctuation or token.value != '.':
+                    return None
+            elif token.ttype in Name or token.ttype in String.Symbol or (
+                    position and token.ttype in Keyword):
+                parts.append(token.value)
+            else:
+                return None
+        if not parts or len(tokens) % 2 == 0:
+            return None
+        return ('.'.join(parts[:-1]) or None), parts[-1]
 
     @staticmethod
     def is_result_operation(keyword):
         """判断是否为结果操作"""
-        return any(op in keyword.upper() for op in RESULT_OPERATIONS)
+        return TokenUtils._keyword_match(RESULT_OPERATION_CACHE, RESULT_OPERATIONS, keyword)
 
-class BloodlineAnalyzer:
-    """血缘分析核心类"""
+class TokenStreamFilter:
+    """词法流预处理过滤器
+
+    在分组之前丢弃注释并把连续空白合并为单个空格，使原始SQL直接解析后的
+    语法树与格式化后再解析的结构一致，省去 format 带来的重复词法分析。
+    """
+    def process(self, stream):
+        """处理 (ttype, value) 词法流"""
+        pending_space = False
+        for ttype, value in stream:
+            if ttype in Comment or ttype in Whitespace or ttype in Newline:
+                pending_space = True
+                continue
+            if pending_space:
+                yield Whitespace, ' '
+                pending_space = False
+            yield ttype, value
+
+class LineageLexer(Lexer):
+    """血缘分析用的词法器配置，输出与 sqlparse 默认词法器完全相同
+
+    默认词法器对每个位置依次尝试约50条正则，关键字再依次查找9个方言词典。
+    这里通过 Lexer 的配置接口把规则表编译为一条按原顺序排列的分支正则(分支按
+    顺序匹配，结果与逐条尝试相同)，词典按查找优先级合并为一个。规则和关键字
+    不做删减: 分组依赖 WHERE、ON、AS 等关键字的token类型，删减后血缘结果会变化。
+    """
     def __init__(self):
+        self.default_initialization()
+
+    def set_SQL_REGEX(self, SQL_REGEX):
+        """设置规则表，同时编译为一条分支正则，分组序号对应规则的token类型"""
+        super().set_SQL_REGEX(SQL_REGEX)
+        self._actions = [None]  # 外层分组序号 -> token类型，内层分组为None
+        branches = []
+        for regex, action in SQL_REGEX:
+            branches.append(f'({regex})')
+            self._actions.append(action)
+            self._actions.extend([None] * re.compile(regex).groups)
+        self._pattern = re.compile('|'.join(branches), re.IGNORECASE | re.UNICODE)
+
+    def clear(self):
+        super().clear()
+        self._lookup = {}
+
+    def add_keywords(self, keywords_dict):
+        """添加关键字词典，合并后先添加的词典优先"""
+        super().add_keywords(keywords_dict)
+        for key, value in keywords_dict.items():
+            self._lookup.setdefault(key, value)
+
+    def is_keyword(self, value):
+        """查合并后的关键字词典，不是关键字时为Name"""
+        return self._lookup.get(value.upper(), Name), value
+
+    def get_tokens(self, text, encoding=None):
+        """与 Lexer.get_tokens 相同的流程，每个位置只做一次分支正则匹配"""
+        if not isinstance(text, str):
+            # 文件对象和字节串按基类的方式读取和解码，逐条规则匹配
+            yield from super().get_tokens(text, encoding)
+            return
+        yield from self._iter_tokens(text)
+
+    def _iter_tokens(self, text):
+        """按分支正则逐个位置匹配，美元符号引用和多行注释与基类相同地先行识别"""
+        delimited_spans = keywords.find_delimited_spans(text)
+        span_openers = delimited_spans.openers
+        match, actions, lookup = self._pattern.match, self._actions, self._lookup
+        pos, length = 0, len(text)
+        while pos < length:
+            if pos in span_openers:
+                resolved = delimited_spans.resolve(pos)
+                if resolved is not None:
+                    end, ttype = resolved
+                    yield ttype, text[pos:end]
+                    pos = end
+                    continue
+
+            m = match(text, pos)
+            if m is None:
+                yield Error, text[pos]
+                pos += 1
+                continue
+            action = actions[m.lastindex]
+            if action is keywords.PROCESS_AS_KEYWORD:
+                value = m.group()
+                yield lookup.get(value.upper(), Name), value
+            else:
+                yield action, m.group()
+            pos = max(m.end(), pos + 1)
+
+def set_lexer_profile(profile: str):
+    """设置当前进程使用的词法器配置
+
+    Args:
+        profile: 'default' 为 sqlparse 默认词法器，'lineage' 为 LineageLexer
+    """
+    global _lexer_profile
+    if profile not in LEXER_PROFILES:
+        raise ValueError(f'未知的词法器配置: {profile}')
+    _lexer_profile = profile
+
+def get_lexer_profile() -> str:
+    """当前进程使用的词法器配置"""
+    return _lexer_profile
+
+def get_lexer() -> Lexer:
+    """取得当前配置的词法器"""
+    global _lineage_lexer
+    if _lexer_profile == 'default':
+        return Lexer.get_default_instance()
+    if _lineage_lexer is None:
+        _lineage_lexer = LineageLexer()
+    return _lineage_lexer
+
+class StatementLimitError(Exception):
+    """语句超过大小或时间限制"""
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+class TokenLimitFilter:
+    """词法流限制过滤器，token数超过上限或超过截止时间时抛出 StatementLimitError
+
+    位于 TokenStreamFilter 之后，注释已丢弃，连续空白合并为一个token计数。
+    """
+    def __init__(self, max_tokens: int = None, deadline: float = None):
+        self.max_tokens = max_tokens
+        self.deadline = deadline
+
+    def process(self, stream):
+        """处理 (ttype, value) 词法流"""
+        max_tokens, deadline = self.max_tokens, self.deadline
+        for count, token in enumerate(stream, 1):
+            if max_tokens is not None and count > max_tokens:
+                raise StatementLimitError(f'max_tokens (> {max_tokens})')
+            # 每1024个token检查一次时间
+            if deadline is not None and not count & 1023 and time.perf_counter() > deadline:
+                raise StatementLimitError('timeout')
+            yield token
+
+class StatementLimits:
+    """单条语句的大小和时间限制
+
+    超过字节数或token数的语句不做分组解析，按fallback用词法快速路径只分析表血缘或跳过；
+    分析超时的语句在已解析时退化为只分析表血缘(先用词法快速路径，再在新的时间预算内
+    遍历语法树)，仍然超时或未解析时跳过。结果的status和reason记录退化原因。
+
+    Args:
+        max_bytes: 语句文本的最大字节数(UTF-8)
+        max_tokens: 语句的最大token数(不计注释，连续空白计为一个token)
+        timeout: 每段语句文本的解析和分析时间上限(秒)
+        fallback: 超过限制后的处理方式，'tables' 退化为只分析表血缘，'skip' 直接跳过
+    """
+    __slots__ = ('max_bytes', 'max_tokens', 'timeout', 'fallback')
+
+    def __init__(self, max_bytes: int = None, max_tokens: int = None,
+                 timeout: float = None, fallback: str = 'tables'):
+        self.max_bytes = max_bytes
+        self.max_tokens = max_tokens
+        self.timeout = timeout
+        self.fallback = fallback
+
+    def check_size(self, sql_text: str) -> Union[str, None]:
+        """检查语句文本大小，超过限制时返回原因"""
+        if self.max_bytes is not None and len(sql_text) > self.max_bytes // 4:
+            size = len(sql_text.encode('utf-8'))
+            if size > self.max_bytes:
+                return f'max_bytes ({size} > {self.max_bytes})'
+        return None
+
+    @contextlib.contextmanager
+    def budget(self):
+        """时间预算上下文，生成截止时间(perf_counter)
+
+        在主线程中同时设置SIGALRM定时器，以便打断无法协作检查的分组阶段；
+        其它线程中只依赖词法过滤器和遍历中的协作检查。
+        """
+        if self.timeout is None:
+            yield None
+            return
+
+        deadline = time.perf_counter() + self.timeout
+        use_alarm = (hasattr(signal, 'setitimer') and
+                     threading.current_thread() is threading.main_thread())
+        if not use_alarm:
+            yield deadline
+            return
+
+        def on_alarm(signum, frame):
+            raise StatementLimitError('timeout')
+
+        previous = signal.signal(signal.SIGALRM, on_alarm)
+        signal.setitimer(signal.ITIMER_REAL, self.timeout)
+        try:
+            yield deadline
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous)
+
+class StatementTexts:
+    """SQL文本中每条语句自己的文本，首次取用时才切分，同一文本的延迟结果共享一次切分
+
+    与 iter_grouped_statements 的切分方式相同(词法流经 StatementSplitter 切分)，
+    但保留原始文本，只含注释和空白的部分不计入序号。
+    指定缓存时，同一文本的延迟结果全部分析完字段血缘后写入缓存，见 loaded。
+
+    Args:
+        sql_text: SQL文本
+        count: 文本中的语句数，只有一条时不切分
+        cache: 血缘结果缓存
+        key: 完整结果的缓存键
+    """
+    __slots__ = ('sql_text', '_texts', 'count', 'results', 'cache', 'key')
+
+    def __init__(self, sql_text: str, count: int = None, cache: 'BloodlineCache' = None,
+                 key: str = None):
+        self.sql_text = sql_text
+        self._texts = None
+        self.count = count
+        self.results = None  # 等待写入缓存的结果列表
+        self.cache = cache
+        self.key = key
+
+    def __getitem__(self, index: int) -> str:
+        if self.count == 1:
+            return self.sql_text
+        if self._texts is None:
+            self._texts = []
+            for stmt in StatementSplitter().process(get_lexer().get_tokens(self.sql_text)):
+                if any(not (token.ttype in Comment or token.ttype in Whitespace
+                            or token.ttype in Newline) for token in stmt.tokens):
+                    self._texts.append(str(stmt))
+            self.sql_text = None
+        return self._texts[index]
+
+    def track(self, results: List['BloodlineResult']):
+        """登记同一文本的结果，字段血缘全部分析完后写入缓存"""
+        if self.cache is not None:
+            self.results = results
+
+    def loaded(self):
+        """某条结果的字段血缘分析完成时调用，全部完成且都成功时写入缓存"""
+        results = self.results
+        if results is None or any(result.columns_pending for result in results):
+            return
+        self.results = None
+        if all(result.status == 'ok' for result in results):
+            self.cache.put(self.key, results)
+
+class BloodlineResult:
+    """单条语句的血缘分析结果
+
+    表名与列名列表按下标一一对应，可序列化为元组或JSON，
+    原有的字符串形式通过 render_* 方法按需生成。
+    调用 defer_columns 后，列名、函数名和别名在首次访问时才分析，见 analyze_sql_text。
+    """
+    __slots__ = ('statement_type', 'table_names', '_column_names', '_function_names',
+                 '_alias_names', 'truncated', 'status', 'reason', 'cte_names', 'cte_tables',
+                 '_columns_source')
+
+    def __init__(self, statement_type: str, table_names=(), column_names=(),
+                 function_names=(), alias_names=(), truncated: bool = False,
+                 status: str = 'ok', reason: str = None, cte_names=(), cte_tables=()):
+        self.statement_type = statement_type
+        self.table_names = tuple(table_names)
+        self._column_names = tuple(tuple(columns) for columns in column_names)
+        self._function_names = tuple(function_names)
+        self._alias_names = tuple(alias_names)
+        self.truncated = truncated  # 语句嵌套过深，结果只包含最大深度以内的部分
+        # 'ok'、'tables_only'(只有表血缘)、'truncated'(超过遍历深度)、'skipped' 或 'error'
+        self.status = status
+        self.reason = reason        # 结果不完整的原因(见 StatementLimits)或失败的异常信息
+        # WITH子句名称及其定义中引用的表名，按下标一一对应；别名中还包含列别名，不能用来识别CTE
+        self.cte_names = tuple(cte_names)
+        self.cte_tables = tuple(tuple(tables) for tables in cte_tables)
+        self._columns_source = None  # 延迟分析字段血缘的 (语法树, SQL文本, 语句序号)
+
+    def __reduce__(self):
+        """序列化时不保存语法树，延迟的字段血缘只带上语句自己的文本，还原后仍按需分析"""
+        if self._columns_source is None:
+            return self.from_tuple, (self.to_tuple(),)
+        data = (self.statement_type, self.table_names, (), (), (), self.truncated,
+                self.status, self.reason, self.cte_names, self.cte_tables)
+        return self._from_pending, (data, self._statement_text())
+
+    @classmethod
+    def _from_pending(cls, data: tuple, sql_text: str) -> 'BloodlineResult':
+        """还原字段血缘尚未分析的结果"""
+        result = cls.from_tuple(data)
+        result.defer_columns(sql_text=sql_text)
+        return result
+
+    @property
+    def column_names(self) -> Tuple[Tuple[str, ...], ...]:
+        """每个表的列名，延迟分析时在首次访问时计算"""
+        if self._columns_source is not None:
+            self._load_columns()
+        return self._column_names
+
+    @property
+    def function_names(self) -> Tuple[str, ...]:
+        """函数名，延迟分析时在首次访问时计算"""
+        if self._columns_source is not None:
+            self._load_columns()
+        return self._function_names
+
+    @property
+    def alias_names(self) -> Tuple[str, ...]:
+        """别名，延迟分析时在首次访问时计算"""
+        if self._columns_source is not None:
+            self._load_columns()
+        return self._alias_names
+
+    @property
+    def columns_pending(self) -> bool:
+        """字段血缘是否尚未分析"""
+        return self._columns_source is not None
+
+    def defer_columns(self, statement=None, sql_text: str = None, index: int = 0):
+        """将字段血缘改为首次访问时分析
+
+        Args:
+            statement: 保留的语法树，为None时从 sql_text 重新解析
+            sql_text: 语句所在的SQL文本，或同一文本各结果共享的 StatementTexts
+            index: 语句在 sql_text 中的序号(不含空语句)
+        """
+        self._columns_source = (statement, sql_text, index)
+
+    def _statement_text(self) -> str:
+        """延迟分析的语句自己的文本，只解析这一条语句"""
+        statement, sql_text, index = self._columns_source
+        if statement is not None:
+            return str(statement)
+        if isinstance(sql_text, str):
+            if not index:
+                return sql_text
+            sql_text = StatementTexts(sql_text)
+        return sql_text[index]
+
+    def _load_columns(self):
+        """分析延迟的字段血缘，表血缘保持不变，同一文本的结果全部分析完后写入缓存"""
+        statement, texts, _ = self._columns_source
+        if statement is None:
+            statement = next(parse_statements(self._statement_text()))
+        self._columns_source = None
+        result = BloodlineAnalyzer().analyze(statement)
+        self._column_names = result.column_names
+        self._function_names = result.function_names
+        self._alias_names = result.alias_names
+        if result.truncated and not self.truncated:
+            self.truncated = True
+            self.status, self.reason = result.status, result.reason
+        if isinstance(texts, StatementTexts):
+            texts.loaded()
+
+    @classmethod
+    def from_state(cls, statement_type: str, state: GlobalState) -> 'BloodlineResult':
+        """从分析器状态创建结果，超过遍历深度的结果status为truncated，不写入缓存"""
+        status, reason = ('truncated', 'max_depth') if state.truncated else ('ok', None)
+        return cls(statement_type, state.table_names, state.column_names,
+                   state.function_names, state.alias_names, state.truncated, status, reason,
+                   state.cte_tables.keys(), state.cte_tables.values())
+
+    @classmethod
+    def skipped(cls, reason: str, statement_type: str = 'UNKNOWN') -> 'BloodlineResult':
+        """创建因超过限制而跳过的空结果"""
+        return cls(statement_type, status='skipped', reason=reason)
+
+    @classmethod
+    def failed(cls, error: str) -> 'BloodlineResult':
+        """创建分析失败的空结果，reason为异常信息"""
+        return cls('UNKNOWN', status='error', reason=error)
+
+    @property
+    def target_table(self) -> Union[str, None]:
+        """目标表，SELECT语句或没有表时为None"""
+        if self.statement_type == 'SELECT' or not self.table_names:
+            return None
+        return self.table_names[0]
+
+    @property
+    def source_tables(self) -> Tuple[str, ...]:
+        """源表，按首次出现顺序去重"""
+        tables = self.table_names if self.target_table is None else self.table_names[1:]
+        return tuple(dict.fromkeys(tables))
+
+    @property
+    def table_columns(self) -> Tuple[Tuple[str, Tuple[str, ...]], ...]:
+        """每个表对应的列 (表名, 列名元组)"""
+        return tuple(zip(self.table_names, self.column_names))
+
+    def to_tuple(self) -> tuple:
+        """序列化为元组"""
+        return (self.statement_type, self.table_names, self.column_names,
+                self.function_names, self.alias_names, self.truncated,
+                self.status, self.reason, self.cte_names, self.cte_tables)
+
+    @classmethod
+    def from_tuple(cls, data: tuple) -> 'BloodlineResult':
+        """从元组还原"""
+        return cls(*data)
+
+    def to_dict(self) -> dict:
+        """序列化为可JSON编码的字典"""
+        return {
+            'statement_type': self.statement_type,
+            'target_table': self.target_table,
+            'source_tables': list(self.source_tables),
+            'table_names': list(self.table_names),
+            'column_names': [list(columns) for columns in self.column_names],
+            'function_names': list(self.function_names),
+            'alias_names': list(self.alias_names),
+            'truncated': self.truncated,
+            'status': self.status,
+            'reason': self.reason,
+            'cte_names': list(self.cte_names),
+            'cte_tables': [list(tables) for tables in self.cte_tables],
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'BloodlineResult':
+        """从字典还原"""
+        return cls(data['statement_type'], data['table_names'], data['column_names'],
+                   data['function_names'], data['alias_names'], data.get('truncated', False),
+                   data.get('status', 'ok'), data.get('reason'), data.get('cte_names', ()),
+                   data.get('cte_tables', ()))
+
+    def to_json(self) -> str:
+        """序列化为JSON字符串"""
+        return json.dumps(self.to_dict(), ensure_ascii=False)
+
+    def render_table_bloodline(self) -> Union[str, Set[str]]:
+        """生成原有格式的表血缘结果
+
+        非SELECT语句为 "目标表->源表集合" 字符串，SELECT语句为表名集合，
+        没有表时为空集合。
+        """
+        if not self.table_names:
+            return set()
+        if self.statement_type != 'SELECT':
+            return f'{self.table_names[0]}->{set(self.table_names[1:])}'
+        return set(self.table_names)
+
+    def render_column_bloodline(self) -> Union[str, List[List[str]]]:
+        """生成原有格式的字段血缘结果
+
+        非SELECT语句为 "目标列->[源列]" 字符串，SELECT语句为列名二维列表，
+        没有列时为空列表。
+        """
+        if not self.table_names or not any(self.column_names):
+            return []
+        if self.statement_type != 'SELECT':
+            zipped = [(table, list(columns)) for table, columns in self.table_columns]
+            return f'{zipped[0]}->{zipped[1:]}'
+        return [list(columns) for columns in self.column_names]
+
+    def __eq__(self, other):
+        if not isinstance(other, BloodlineResult):
+            return NotImplemented
+        return self.to_tuple() == other.to_tuple()
+
+    def __repr__(self):
+        return (f'BloodlineResult({self.statement_type!r}, '
+                f'target={self.target_table!r}, sources={self.source_tables!r})')
+
+class StatementProfile:
+    """单条语句的性能统计"""
+    __slots__ = ('index', 'text', 'phases', 'tokens', 'depth', 'max_depth', 'identifiers')
+
+    def __init__(self, index: int, text: str = ''):
+        self.index = index
+        self.text = text
+        self.phases = defaultdict(float)  # 阶段名 -> 耗时(秒)
+        self.tokens = 0                   # 访问的token数
+        self.depth = 0                    # 当前递归深度
+        self.max_depth = 0                # 最大递归深度
+        self.identifiers = 0              # 处理的标识符数
+
+    @property
+    def seconds(self) -> float:
+        return sum(self.phases.values())
+
+    def enter(self, token_count: int):
+        """进入一层token分组"""
+        self.tokens += token_count
+        self.depth += 1
+        if self.depth > self.max_depth:
+            self.max_depth = self.depth
+
+    def leave(self):
+        """离开一层token分组"""
+        self.depth -= 1
+
+    def to_dict(self) -> dict:
+        return {
+            'index': self.index,
+            'seconds': self.seconds,
+            'phases': dict(self.phases),
+            'tokens': self.tokens,
+            'max_depth': self.max_depth,
+            'identifiers': self.identifiers,
+            'text': self.text,
+        }
+
+class BloodlineProfiler:
+    """可选的分阶段性能统计
+
+    传给 BloodlineAnalyzer、parse_statements 等加载函数后，按语句记录
+    读取(read)、词法与切分(format)、分组(parse)、只分析表血缘时的表遍历(table_walk)、
+    同时提取表和列的单次遍历(column_walk)、别名整理(alias_cleanup)和可视化(visualize)
+    的耗时，以及访问的token数、递归深度和标识符数。
+
+    Args:
+        slow_threshold: 慢语句阈值(秒)
+        trace: 是否保留逐阶段事件，用于导出Chrome trace
+        text_limit: 每条语句保留的文本长度
+    """
+    def __init__(self, slow_threshold: float = 1.0, trace: bool = True, text_limit: int = 200):
+        self.slow_threshold = slow_threshold
+        self.trace = trace
+        self.text_limit = text_limit
+        self.statements = []        # StatementProfile列表
+        self.events = []            # (阶段名, 开始时间, 耗时, 语句序号)
+        self.last = None            # 最近开始的语句
+        self._pending = defaultdict(float)  # 尚未对应到语句的耗时，计入下一条语句
+        # 语句对象 -> StatementProfile，语句对象释放后记录自动移除，不会误取复用id的新语句
+        self._records = weakref.WeakKeyDictionary()
+        self._origin = time.perf_counter()
+
+    def begin_statement(self, statement) -> StatementProfile:
+        """开始记录一条语句，之前未归属的耗时计入该语句"""
+        record = StatementProfile(len(self.statements), str(statement)[:self.text_limit])
+        for name, seconds in self._pending.items():
+            record.phases[name] += seconds
+        self._pending.clear()
+        self.statements.append(record)
+        self._records[statement] = record
+        self.last = record
+        return record
+
+    def statement(self, statement) -> StatementProfile:
+        """获取语句对应的记录，加载阶段未记录过的语句新建记录"""
+        record = self._records.get(statement)
+        if record is None:
+            record = self.begin_statement(statement)
+        return record
+
+    def add(self, name: str, start: float, record: StatementProfile = None):
+        """记录从start到当前的耗时
+
+        Args:
+            name: 阶段名
+            start: time.perf_counter() 的开始时间
+            record: 所属语句，为None时计入下一条开始记录的语句
+        """
+        elapsed = time.perf_counter() - start
+        if record is None:
+            self._pending[name] += elapsed
+        else:
+            record.phases[name] += elapsed
+        if self.trace:
+            self.events.append((name, start, elapsed, record.index if record else None))
+
+    @contextlib.contextmanager
+    def phase(self, name: str, record: StatementProfile = None):
+        """计时上下文，record的含义同 add"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, start, record)
+
+    def visualize_phase(self, statement=None):
+        """可视化阶段的计时上下文，耗时计入 statement 对应的语句
+
+        Args:
+            statement: 图表所属的语句对象，为None时计入下一条开始记录的语句
+        """
+        return self.phase('visualize', None if statement is None else self.statement(statement))
+
+    def summary(self) -> dict:
+        """汇总各阶段耗时和遍历计数
+
+        Returns:
+            dict: 语句数、各阶段的总耗时/次数/均值/最大值及计数的合计和最大值
+        """
+        phases = {}
+        for record in self.statements:
+            for name, seconds in record.phases.items():
+                stats = phases.setdefault(name, {'total': 0.0, 'count': 0, 'max': 0.0})
+                stats['total'] += seconds
+                stats['count'] += 1
+                stats['max'] = max(stats['max'], seconds)
+        for stats in phases.values():
+            stats['mean'] = stats['total'] / stats['count']
+
+        return {
+            'statements': len(self.statements),
+            'seconds': sum(stats['total'] for stats in phases.values()),
+            'phases': phases,
+            'tokens': sum(record.tokens for record in self.statements),
+            'max_depth': max((record.max_depth for record in self.statements), default=0),
+            'identifiers': sum(record.identifiers for record in self.statements),
+            'slow_statements': len(self.slow_statements()),
+        }
+
+    def slow_statements(self, threshold: float = None) -> List[StatementProfile]:
+        """按耗时从高到低返回超过阈值的语句"""
+        threshold = self.slow_threshold if threshold is None else threshold
+        slow = [record for record in self.statements if record.seconds >= threshold]
+        return sorted(slow, key=lambda record: record.seconds, reverse=True)
+
+    def write_slow_log(self, file_path: str, threshold: float = None):
+        """将慢语句按JSON Lines写入文件，每行包含各阶段耗时和语句文本"""
+        with open(file_path, 'w', encoding='utf-8') as file:
+            for record in self.slow_statements(threshold):
+                file.write(json.dumps(record.to_dict(), ensure_ascii=False) + '\n')
+
+    def to_chrome_trace(self) -> dict:
+        """生成Chrome trace格式的数据，可在 chrome://tracing 或 Perfetto 中打开"""
+        pid = os.getpid()
+        events = []
+        for name, start, elapsed, index in self.events:
+            events.append({
+                'name': name,
+                'cat': 'bloodline',
+                'ph': 'X',
+                'ts': (start - self._origin) * 1e6,
+                'dur': elapsed * 1e6,
+                'pid': pid,
+                'tid': 0,
+                'args': {'statement': index},
+            })
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def write_chrome_trace(self, file_path: str):
+        """将Chrome trace写入JSON文件"""
+        with open(file_path, 'w', encoding='utf-8') as file:
+            json.dump(self.to_chrome_trace(), file)
+
+class BloodlineAnalyzer:
+    """血缘分析核心类
+
+    Args:
+        profiler: 可选的 BloodlineProfiler，为None时不做任何统计
+        max_depth: 语法树遍历的最大深度，超过时跳过更深的子树，结果的truncated为True、
+            status为truncated；默认为None，不限制
+    """
+    def __init__(self, profiler: BloodlineProfiler = None, max_depth: int = MAX_WALK_DEPTH):
         self.state = GlobalState()
+        self.profiler = profiler
+        self.max_depth = max_depth
+        self.deadline = None  # 遍历截止时间(perf_counter)，超过时抛出 StatementLimitError
+        self._profile = None  # 当前语句的 StatementProfile
 
     def reset(self):
         """重置分析器状态"""
         self.state.reset()
 
-    def _process_identifier(self, identifier):
-        """处理标识符"""
-        if '(' not in str(identifier):
-            self._get_identifier_tables(identifier)
+    def _start_profile(self, statement):
+        """开启性能统计时，取得语句对应的记录"""
+        if self.profiler is not None:
+            self._profile = self.profiler.statement(statement)
+            self._profile.depth = 0
+
+    def _phase(self, name):
+        """当前语句的阶段计时上下文，未开启统计时为空操作"""
+        if self._profile is None:
+            return NULL_PHASE
+        return self.profiler.phase(name, self._profile)
+
+    def _identifier_steps(self, identifier, in_table, columns, in_select=False, in_from=False):
+        """处理标识符，需要遍历的子节点交给 _run 调度
+
+        Args:
+            identifier: 标识符或标识符列表
+            in_table: 是否从该标识符中提取表名
+            columns: 是否提取列信息
+            in_select: 标识符是否位于SELECT列表中
+            in_from: 标识符是否位于表名位置(FROM/JOIN等之后)
+        """
+        if self._profile is not None:
+            self._profile.identifiers += 1
+        if TokenUtils.is_identifier_list(identifier):
+            for token in identifier.tokens:
+                if TokenUtils.is_identifier(token):
+                    yield self._identifier_steps(token, in_table, columns, in_select, in_from)
+                elif columns and token.is_group:
+                    yield self._walk_steps(token.tokens, False, columns)
             return
-        self._extract_tables(identifier)
 
-    def _process_column_identifier(self, identifier):
-        """处理列标识符"""
-        self._get_identifier_columns(identifier)
-        self._extract_columns(identifier)
+        # WITH 子句的定义 "name AS (...)"，名称为别名
+        if TokenUtils.is_cte_definition(identifier):
+            name = identifier.tokens[0].value
+            self.state.alias_names.append(name)
+            start = len(self.state.table_names)
+            yield self._walk_steps(identifier.tokens[-1].tokens, in_table, columns)
+            self.state.cte_tables.setdefault(name, self.state.table_names[start:])
+            return
 
-    def _process_function_identifier(self, func):
-        """处理函数标识符"""
-        for item in func.tokens:
-            if TokenUtils.is_identifier_single(item):
-                self.state.function_names.append(item.value)
-            self._extract_columns(item)
+        table_walk = False
+        if in_table or in_from:
+            if not TokenUtils.has_parenthesis(identifier):
+                if in_table:
+                    self._add_identifier_table(identifier)
+                elif identifier is not self.state.target_token:
+                    self._register_alias(identifier.get_alias(),
+                                         self._find_table(identifier.get_real_name().lower()))
+                return
+            table_walk = in_table
+            self._register_alias(identifier.get_alias(), None)
+        elif identifier is self.state.target_token:
+            return
+
+        if not columns:
+            if table_walk:
+                yield self._walk_steps(identifier.tokens, table_walk, columns)
+            return
+
+        if isinstance(identifier.parent, Function):
+            self.state.function_names.append(identifier.value)
+            return
+
+        # 列位置上的标识符: 记录列引用、输出列名和列别名
+        scope = self.state.scope
+        alias = identifier.get_alias() if len(identifier.tokens) > 1 else None
+        expression = TokenUtils.expression_tokens(identifier, alias)
+
+        reference = TokenUtils.column_reference(expression)
+        if reference is not None:
+            scope.columns.append(reference)
+            if in_select:
+                scope.outputs.append(alias or reference[1])
+        else:
+            yield self._walk_steps(expression, table_walk, True)
+            if in_select and alias:
+                scope.outputs.append(alias)
+
+        if alias:
+            self.state.alias_names.append(alias)
+            scope.output_aliases.add(alias.lower())
+
+    def _add_identifier_table(self, identifier):
+        """提取标识符中的表名，并登记到当前作用域"""
+        index = len(self.state.table_names)
+        self._get_identifier_tables(identifier)
+        if len(self.state.table_names) > index:
+            self._register_table(index, identifier.get_alias())
+
+    def _register_table(self, index, alias):
+        """在当前作用域中登记表名及其别名"""
+        scope = self.state.scope
+        name = self.state.table_names[index].lower()
+        scope.aliases[name] = index
+        scope.aliases[name.rsplit('.', 1)[-1]] = index
+        self._register_alias(alias, index)
+        scope.tables.append(index)
+
+    def _register_alias(self, alias, index):
+        """在当前作用域中登记别名，派生表的下标为None"""
+        if alias:
+            self.state.scope.aliases[alias.lower()] = index
 
     def _get_identifier_tables(self, identifier):
-        """从标识符中提取表名"""
+        """从标识符中提取表名
+
+        "INSERT INTO db.t (a, b)" 中点号之后的一段被分组为函数 t (a, b)，取函数名。
+        """
         tokens = identifier.tokens
         if len(tokens) == 1:
             self.state.table_names.append(tokens[0].value)
@@ -116,6 +1084,8 @@ class BloodlineAnalyzer:
             return
 
         if len(tokens) > 1 and tokens[1].value == '.':
+            tokens = [token.tokens[0] if TokenUtils.is_function(token) else token
+                      for token in tokens]
             db = tokens[0].value
             table = tokens[2].value
             full_name = f"{db}.{table}"
@@ -129,124 +1099,166 @@ class BloodlineAnalyzer:
                     schema = tokens[4].value
                     self.state.table_names.append(f"{db}.{table}.{schema}")
 
-    def _get_identifier_columns(self, identifier):
-        """从标识符中提取列名"""
-        if len(identifier.tokens) == 1:
-            if not isinstance(identifier.parent, Function):
-                if self.state.columns_rank > 0:
-                    self.state.column_names[self.state.columns_rank - 1].append(
-                        identifier.tokens[0].value
-                    )
-            else:
-                self.state.function_names.append(identifier.value)
-
-        elif len(identifier.tokens) == 5:
-            if identifier.tokens[0].ttype == Name:
-                if self.state.columns_rank > 0:
-                    self.state.column_names[self.state.columns_rank - 1].append(
-                        identifier.tokens[0].value
-                    )
-
-        elif len(identifier.tokens) == 7:
-            self.state.alias_names.append(identifier.tokens[0].value)
-
-    def _create_column_lists(self):
-        """创建列名列表"""
-        if self.state.table_names:
-            self.state.column_names = [[] for _ in range(len(self.state.table_names))]
-        else:
-            self.state.column_names = []
-
-    def _clean_alias_columns(self):
-        """清理别名列"""
-        # 1. 确保有列数据
-        if not self.state.column_names:
-            return
-
-        # 2. 对每个表的列去重
-        for i in range(len(self.state.table_names)):
-            if i < len(self.state.column_names):
-                self.state.column_names[i] = list(set(self.state.column_names[i]))
-
-        # 3. 移除别名
-        cleaned_columns = []
-        for cols in self.state.column_names:
-            cleaned_columns.append(list(set(cols) - set(self.state.alias_names)))
-        self.state.column_names = cleaned_columns
+    def _open_scope(self, top_level):
+        """进入新的SELECT作用域"""
+        self.state.scope = Scope(self.state.scope, top_level)
+        return self.state.scope
 
-    def _extract_columns(self, statement):
-        """提取列信息"""
-        if not hasattr(statement, 'tokens'):
-            return
-
-        for item in statement.tokens:
-            # 跳过空白和注释
-            if (item.is_whitespace or
-                item.ttype == sqlparse.tokens.Comment or
-                item.ttype == sqlparse.tokens.Comment.Single or
-                item.ttype == sqlparse.tokens.Comment.Multiline):
-                continue
+    def _close_scope(self, scope):
+        """解析作用域内的列引用并退出作用域"""
+        self._resolve_columns(scope)
+        self.state.scope = scope.parent
 
-            if item.is_group and not TokenUtils.is_identifier(item):
-                self._extract_columns(item)
+    def _resolve_columns(self, scope):
+        """将作用域内的列引用归属到表
 
-            if item.ttype in Keyword and item.value.upper() == 'SELECT':
-                self.state.columns_rank += 1
+        限定列按别名表逐层查找，未限定列归属本层第一个表，
+        与本层SELECT别名同名的未限定列视为别名引用而跳过。
+        """
+        table_columns = self.state.table_columns
+        for qualifier, column in scope.columns:
+            if qualifier is None:
+                if column.lower() in scope.output_aliases:
+                    continue
+                index = scope.default_table()
+            else:
+                found, index = scope.lookup(qualifier.lower())
+                if not found:
+                    index = self._find_table(qualifier.lower())
+            if index is not None:
+                table_columns[index][column] = None
+
+        # 最外层SELECT的输出列即目标表的列
+        if scope.top_level and self.state.target_index is not None:
+            for column in scope.outputs:
+                table_columns[self.state.target_index][column] = None
+
+    def _find_table(self, qualifier):
+        """按表名或不带库名的表名查找表下标"""
+        for index, name in enumerate(self.state.table_names):
+            name = name.lower()
+            if name == qualifier or name.rsplit('.', 1)[-1] == qualifier:
+                return index
+        return None
+
+    def _walk(self, statement, tables=True, columns=True, top_level=False):
+        """单次遍历语法树，同时提取表、列、函数和别名信息
+
+        表和列共用同一次遍历，不再分别对语法树做两次完整遍历。
 
-            if isinstance(item, Identifier):
-                self._process_column_identifier(item)
+        Args:
+            statement: SQL语句解析后的语法树对象
+            tables: 是否在本层及子节点中提取表名
+            columns: 是否在本层及子节点中提取列名
+            top_level: 是否为语句最外层
+        """
+        if statement.is_group:
+            self._run(self._walk_steps(statement.tokens, tables, columns, top_level))
 
-            if isinstance(item, IdentifierList):
-                for token in item.tokens:
-                    if TokenUtils.is_function(token):
-                        self._process_function_identifier(token)
-                    if TokenUtils.is_identifier(token):
-                        self._process_column_identifier(token)
+    def _run(self, steps):
+        """用显式栈驱动遍历，嵌套深度不受Python递归限制
 
-    def _extract_tables(self, statement):
-        """提取表信息
+        每层遍历是一个生成器，产出需要先处理的子层生成器；子层处理完后
+        再恢复父层，执行顺序与递归实现相同。超过 max_depth 的子层被跳过，
+        并在状态中标记truncated。
 
         Args:
-            statement: SQL语句解析后的语法树对象
+            steps: 最外层的遍历生成器
         """
-        if not hasattr(statement, 'tokens'):
-            return
+        stack = [steps]
+        max_depth = self.max_depth
+        deadline = self.deadline
+        count = 0
+        while stack:
+            if deadline is not None:
+                count += 1
+                if not count & 255 and time.perf_counter() > deadline:
+                    raise StatementLimitError('timeout')
+            child = next(stack[-1], None)
+            if child is None:
+                stack.pop()
+            elif max_depth is not None and len(stack) >= max_depth:
+                child.close()
+                self.state.truncated = True
+            else:
+                stack.append(child)
+
+    def _walk_steps(self, tokens, tables=True, columns=True, top_level=False):
+        """遍历同一层级的token，参数含义同 _walk，子节点交给 _run 调度"""
+        profile = self._profile
+        if profile is not None:
+            profile.enter(len(tokens))
 
         table_name_preceding = False
+        from_preceding = False
+        in_select = False
+        scope = None
 
-        for item in statement.tokens:
+        for item in tokens:
             # 跳过空白和注释
-            if (item.is_whitespace or
-                item.ttype == sqlparse.tokens.Comment or
-                item.ttype == sqlparse.tokens.Comment.Single or
-                item.ttype == sqlparse.tokens.Comment.Multiline):
+            if item.is_whitespace or item.ttype in COMMENT_TTYPES:
                 continue
 
             if item.is_group and not TokenUtils.is_identifier(item):
-                self._extract_tables(item)
-
-            if item.ttype in Keyword:
-                if TokenUtils.precedes_table_name(item.value.upper()):
+                yield self._walk_steps(item.tokens, tables, columns)
+
+            # 关键字直接使用词法阶段已规范化的大写值
+            is_keyword = item.is_keyword
+            keyword = item.normalized if is_keyword else None
+            table_prefix = is_keyword and TokenUtils.precedes_table_name(keyword)
+
+            # 每个SELECT开启一个作用域，UNION等后续SELECT替换同层的前一个作用域
+            if columns and is_keyword:
+                if keyword == 'SELECT':
+                    if scope is not None:
+                        self._close_scope(scope)
+                    scope = self._open_scope(top_level)
+                    in_select = True
+                elif keyword not in SELECT_MODIFIERS:
+                    in_select = False
+
+            # 表名前缀状态机: 遇到非结果操作的关键字或逗号后，本层不再提取表名；
+            # WITH子句之后的 INSERT 等DML关键字开始主语句，继续提取表名
+            in_table = False
+            if tables:
+                if table_prefix:
                     table_name_preceding = True
-                    continue
+                elif table_name_preceding:
+                    if is_keyword or item.value == ',':
+                        if is_keyword and (TokenUtils.is_result_operation(keyword) or
+                                           keyword == ON_KEYWORD or item.ttype is Keyword.DML):
+                            table_name_preceding = False
+                        else:
+                            tables = False
+                    else:
+                        in_table = True
+
+            # 表名位置: 与上面的状态机相同，但不因提取中止而停止，避免把表名当作列
+            in_from = False
+            if columns:
+                if table_prefix:
+                    from_preceding = True
+                elif from_preceding:
+                    if is_keyword or item.value == ',':
+                        from_preceding = False
+                    else:
+                        in_from = True
+
+            if TokenUtils.is_identifier(item):
+                yield self._identifier_steps(item, in_table, columns, in_select, in_from)
+
+        if scope is not None:
+            self._close_scope(scope)
+        if profile is not None:
+            profile.leave()
 
-            if not table_name_preceding:
-                continue
-
-            if item.ttype in Keyword or item.value == ',':
-                if (TokenUtils.is_result_operation(item.value) or
-                        item.value.upper() == ON_KEYWORD):
-                    table_name_preceding = False
-                    continue
-                break
-
-            if isinstance(item, Identifier):
-                self._process_identifier(item)
+    def _extract_tables(self, statement):
+        """提取表信息
 
-            if isinstance(item, IdentifierList):
-                for token in item.tokens:
-                    if TokenUtils.is_identifier(token):
-                        self._process_identifier(token)
+        Args:
+            statement: SQL语句解析后的语法树对象
+        """
+        self._walk(statement, columns=False)
 
     def analyze_table_bloodline(self, statement) -> Union[str, Set[str]]:
         """分析SQL语句中的表血缘关系
@@ -263,33 +1275,31 @@ class BloodlineAnalyzer:
             INSERT语句: "target_table->{source_table1, source_table2}"
             SELECT语句: {"table1", "table2", "table3"}
         """
-        # 1. 获取SQL语句类型(SELECT/INSERT/UPDATE等)
-        type_name = statement.get_type()
+        return self.analyze_tables(statement).render_table_bloodline()
 
-        # 2. 处理函数操作(INSERT/UPDATE等)
-        if TokenUtils.precedes_function_name(type_name):
-            # 获取第一层标识符(通常是目标表)
-            idfr_list = self._get_first_level_identifiers(statement)
-            if idfr_list:
-                # 将目标表添加到table_names列表
-                self._get_identifier_tables(idfr_list[0])
+    def analyze_tables(self, statement) -> BloodlineResult:
+        """只分析表血缘，不提取列，比 analyze 开销小
+
+        Args:
+            statement: SQL语句解析后的语法树对象
+
+        Returns:
+            BloodlineResult: 列名为空，别名只包含WITH子句名称
+        """
+        self._start_profile(statement)
+        with self._phase('table_walk'):
+            # 1. 获取SQL语句类型(SELECT/INSERT/UPDATE等)
+            type_name = statement.get_type()
 
-        # 3. 提取语句中涉及的所有表名
-        self._extract_tables(statement)
+            # 2. 处理函数操作(INSERT/UPDATE等)的目标表
+            self._add_target_table(statement, type_name)
 
-        # 4. 检查是否找到任何表名
-        if not self.state.table_names:
-            return set()  # 如果没有找到表名，返回空集合
+            # 3. 提取语句中涉及的所有表名
+            self._extract_tables(statement)
 
-        # 5. 根据语句类型返回不同格式的结果
-        if type_name != 'SELECT':
-            # 非SELECT语句: 第一个表为目标表,其余为源表
-            inherit_table = self.state.table_names[0]  # 目标表
-            root_tables = set(self.state.table_names[1:])  # 源表集合
-            return f'{inherit_table}->{root_tables}'
-        else:
-            # SELECT语句: 返回所有涉及的表集合
-            return set(self.state.table_names)
+        # 4. 生成结果
+        self.state.alias_names = list(dict.fromkeys(self.state.alias_names))
+        return BloodlineResult.from_state(type_name, self.state)
 
     def analyze_column_bloodline(self, statement) -> Union[str, List[List[str]]]:
         """分析字段血缘关系
@@ -306,94 +1316,854 @@ class BloodlineAnalyzer:
         if not self.state.table_names:
             return []
 
-        # 2. 创建列名列表并提取列
-        self._create_column_lists()
-        self._extract_columns(statement)
+        # 2. 在作用域中重新解析表和列，生成结果
+        self.reset()
+        return self.analyze(statement).render_column_bloodline()
 
-        # 3. 处理函数名和别名
-        self.state.function_names = list(set(self.state.function_names))
-        self.state.alias_names = list(set(self.state.alias_names))
-        self._clean_alias_columns()
+    def analyze(self, statement) -> BloodlineResult:
+        """单次遍历同时分析表血缘和字段血缘
 
-        # 4. 检查是否有列
-        if not any(self.state.column_names):
-            return []
+        Args:
+            statement: SQL语句解析后的语法树对象
 
-        # 5. 构建血缘关系
-        zipped = list(zip(self.state.table_names, self.state.column_names))
-        if not zipped:
-            return []
+        Returns:
+            BloodlineResult: 结构化的血缘结果
+        """
+        self._start_profile(statement)
+
+        # 1. 获取SQL语句类型并处理目标表，与遍历合并计时(单独计时不到遍历的百分之一)
+        with self._phase('column_walk'):
+            type_name = statement.get_type()
+            self._add_target_table(statement, type_name)
+
+            # 2. 一次遍历提取表、列、函数和别名
+            root = self.state.scope
+            self._walk(statement, top_level=True)
+            self._resolve_columns(root)
+
+        # 3. 整理列信息
+        with self._phase('alias_cleanup'):
+            if self.state.table_names:
+                self._finish_columns()
+            else:
+                # 与分步分析一致: 没有表时不保留列、函数和别名
+                self.state.column_names = []
+                self.state.function_names = []
+                self.state.alias_names = []
+                self.state.cte_tables = {}
 
-        if statement.get_type() != 'SELECT':
-            inherit_cols = zipped[0]
-            root_cols = zipped[1:]
-            return f'{inherit_cols}->{root_cols}'
-        else:
-            return self.state.column_names
+        return BloodlineResult.from_state(type_name, self.state)
+
+    def analyze_bloodline(self, statement) -> Tuple[Union[str, Set[str]],
+                                                    Union[str, List[List[str]]]]:
+        """单次遍历同时分析表血缘和字段血缘，返回原有的字符串形式
+
+        结果与依次调用 analyze_table_bloodline、analyze_column_bloodline 相同，
+        但语法树只遍历一次。
+
+        Args:
+            statement: SQL语句解析后的语法树对象
+
+        Returns:
+            (表血缘, 字段血缘)，格式分别与上述两个方法的返回值一致
+        """
+        result = self.analyze(statement)
+        return result.render_table_bloodline(), result.render_column_bloodline()
+
+    def _add_target_table(self, statement, type_name):
+        """对函数操作(INSERT/UPDATE等)，将目标表加入表名列表
+
+        SELECT语句沿用第一层的第一个标识符，其余语句见 _get_target_identifier。
+        """
+        if TokenUtils.precedes_function_name(type_name):
+            if type_name == 'SELECT':
+                idfr_list = self._get_first_level_identifiers(statement)
+                target = idfr_list[0] if idfr_list else None
+            else:
+                target = self._get_target_identifier(statement)
+            if target is not None:
+                self._add_identifier_table(target)
+                if self.state.table_names:
+                    self.state.target_token = target
+                    if type_name != 'SELECT':
+                        self.state.target_index = 0
+
+    @staticmethod
+    def _get_target_identifier(statement):
+        """目标表标识符: 跳过WITH子句，取第一个DML/DDL关键字之后的第一个标识符
+
+        "INSERT INTO t (a, b)" 这类带列清单的目标表被分组为函数，取函数名标识符。
+        """
+        after_type = False
+        for token in statement.tokens:
+            if not after_type:
+                after_type = token.ttype is Keyword.DML or token.ttype is Keyword.DDL
+            elif type(token) is Identifier:
+                return token
+            elif isinstance(token, Function):
+                return token.tokens[0] if type(token.tokens[0]) is Identifier else None
+        return None
+
+    def _finish_columns(self):
+        """按表下标生成列名列表，函数名和别名去重"""
+        table_columns = self.state.table_columns
+        self.state.column_names = [list(table_columns.get(index, ()))
+                                   for index in range(len(self.state.table_names))]
+        self.state.function_names = list(dict.fromkeys(self.state.function_names))
+        self.state.alias_names = list(dict.fromkeys(self.state.alias_names))
 
     def _get_first_level_identifiers(self, statement):
         """获取第一层标识符"""
         return [token for token in statement.tokens
-                if token._get_repr_name() == 'Identifier']
+                if type(token) is Identifier]
+
+class FastPathUnsupported(Exception):
+    """词法快速路径无法保证与语法树结果一致的语法，调用方应回退到完整解析"""
+
+
+class FastTableAnalyzer:
+    """只做词法分析的表血缘快速路径
+
+    不构建语法树，在词法流上逐层括号执行与 BloodlineAnalyzer 相同的表名状态机:
+    FROM/JOIN 之后读取 "名称[.名称...][ [AS] 别名]" 或 "(子查询)[ [AS] 别名]" 形式的表引用，
+    WITH 之后读取 "名称 AS (...)" 列表，INSERT INTO/CREATE TABLE/UPDATE 等之后的第一个名称
+    为目标表；表名前缀之后遇到其它关键字或逗号时本层不再提取表名。只进入包含表名前缀关键字
+    的括号，且只接受位置明确的子查询(关键字或比较运算符之后)。表函数、带别名的标量子查询、
+    过程块、多条语句等无法确定与完整解析一致的写法返回None，由调用方回退到完整解析。
+
+    Args:
+        max_tokens: token数上限，超过时返回None，由完整解析给出超限结果
+    """
+    def __init__(self, max_tokens: int = None):
+        self.max_tokens = max_tokens
+
+    def analyze(self, sql_text: str) -> Union[List[BloodlineResult], None]:
+        """分析一段只含一条语句的SQL文本
+
+        Args:
+            sql_text: SQL语句文本
+
+        Returns:
+            List[BloodlineResult]: 与 analyze_tables 相同的结果，空文本为空列表；
+            不支持的语法返回None
+        """
+        try:
+            return self._analyze(sql_text)
+        except FastPathUnsupported:
+            return None
+
+    def _analyze(self, sql_text):
+        # 1. 词法分析，与 parse_statements 相同地丢弃注释、合并空白
+        limit = FAST_PATH_MAX_TOKENS if self.max_tokens is None else min(
+            self.max_tokens, FAST_PATH_MAX_TOKENS)
+        stream = TokenStreamFilter().process(get_lexer().get_tokens(sql_text))
+        raw = list(itertools.islice(stream, limit + 1))  # 超长文本不必全部词法分析
+        if len(raw) > limit:
+            raise FastPathUnsupported('too many tokens')
+        self._load(raw)
+        if not self.count:
+            return []
+
+        # 2. 语句类型和函数操作(INSERT/UPDATE等)的目标表
+        self.table_names = []
+        self.alias_names = []
+        self.cte_tables = {}
+        self.defined = set()
+        type_name, index, ctes = self._statement_type()
+        if TokenUtils.precedes_function_name(type_name):
+            self.table_names.extend(self._target_tables(type_name, index, ctes))
+
+        # 3. 逐层提取表名
+        self._walk(0, self.count)
+        if len(self.defined) != len(self.definitions):
+            # WITH 列表之外的 "name AS (...)"，完整解析同样把它当作WITH子句定义
+            raise FastPathUnsupported('definition outside WITH')
+
+        alias_names = list(dict.fromkeys(self.alias_names))
+        return [BloodlineResult(type_name, self.table_names, alias_names=alias_names,
+                                cte_names=self.cte_tables.keys(),
+                                cte_tables=self.cte_tables.values())]
+
+    def _load(self, raw):
+        """记录有效token，检查不支持的语法并匹配括号"""
+        self.ttypes = ttypes = []
+        self.keys = keys = []      # 关键字为大写，其它为原值
+        self.spaced = spaced = []  # 有效token之前是否有空白
+        for index, (ttype, value) in enumerate(raw):
+            if ttype is Whitespace:
+                continue
+            ttypes.append(ttype)
+            keys.append(value.upper() if ttype in Keyword else value)
+            spaced.append(index > 0 and raw[index - 1][0] is Whitespace)
+        count = len(ttypes)
+        if count and ttypes[-1] is Punctuation and keys[-1] == ';':
+            count -= 1  # 末尾的分号不影响分组
+        self.count = count
+
+        self.match = {}        # 左右括号下标互相对应
+        self.prefixes = []     # 表名前缀关键字和 "AS (" 的下标，只有包含它们的括号才需要遍历
+        self.definitions = []  # "AS (" 的下标
+        stack = []
+        chains = [0]  # 每层括号内连续的运算符个数
+        for index in range(count):
+            ttype = ttypes[index]
+            value = keys[index]
+            if ttype is Punctuation:
+                if value == '(':
+                    stack.append(index)
+                    chains.append(0)
+                    if len(stack) > FAST_PATH_MAX_DEPTH:
+                        raise FastPathUnsupported('nesting too deep')
+                elif value == ')':
+                    if not stack:
+                        raise FastPathUnsupported('unbalanced parenthesis')
+                    start = stack.pop()
+                    self.match[start] = index
+                    self.match[index] = start
+                    chains.pop()
+                elif value == ',':
+                    chains[-1] = 0
+                elif value in FAST_PATH_PUNCTUATION or value == ';':
+                    raise FastPathUnsupported(value)
+            elif ttype in Operator:
+                if ttype is Operator and value in ('->', '->>'):
+                    raise FastPathUnsupported(value)
+                chains[-1] += 1
+                if chains[-1] + FAST_PATH_PAREN_FRAMES * len(stack) >= FAST_PATH_MAX_CHAIN:
+                    raise FastPathUnsupported('expression too deep')
+            elif ttype in Keyword:
+                chains[-1] = 0
+                if (value in FAST_PATH_BLOCK_KEYWORDS or value.startswith('END ') or
+                        (ttype is Keyword and value.split()[0] == 'GO') or
+                        ttype is Keyword.TZCast):
+                    raise FastPathUnsupported(value)
+                if index + 1 < count and ttypes[index + 1] is String.Single and (
+                        ttype is Keyword and value in ('TIMESTAMP', 'DATE', 'INTERVAL')):
+                    raise FastPathUnsupported('typed literal')
+                if TokenUtils.precedes_table_name(value) and not self._absorbed(index):
+                    self.prefixes.append(index)
+                elif value == 'AS' and index + 1 < count and keys[index + 1] == '(' and \
+                        ttypes[index + 1] is Punctuation:
+                    self.prefixes.append(index)
+                    self.definitions.append(index)
+            elif ttype is Name.Builtin:
+                if index + 1 < count and ttypes[index + 1] is String.Single:
+                    raise FastPathUnsupported('typed literal')
+            elif ttype is Assignment or ttype is Error or ttype in Generic:
+                raise FastPathUnsupported(value)
+        if stack:
+            raise FastPathUnsupported('unbalanced parenthesis')
+
+    def _absorbed(self, index):
+        """紧跟在名称或数字之后的 ASC/DESC 被并入排序标识符，不再是关键字"""
+        if self.ttypes[index] not in Keyword.Order or not index:
+            return False
+        prev = self.ttypes[index - 1]
+        return prev in Name or prev is String.Symbol or prev in Number
+
+    def _active(self, start, end):
+        """括号 (start, end) 内是否有表名前缀关键字或 "AS (" """
+        position = bisect.bisect_right(self.prefixes, start)
+        return position < len(self.prefixes) and self.prefixes[position] < end
+
+    def _is_name(self, index):
+        ttype = self.ttypes[index]
+        return ttype is Name or ttype is String.Symbol
+
+    def _is_punctuation(self, index, value):
+        return self.ttypes[index] is Punctuation and self.keys[index] == value
+
+    def _statement_type(self):
+        """与 Statement.get_type 相同的语句类型
+
+        Returns:
+            (语句类型, 类型关键字的下标, WITH子句定义个数)
+        """
+        ttype = self.ttypes[0]
+        if ttype is Keyword.DML or ttype is Keyword.DDL:
+            return self.keys[0], 0, 0
+        if ttype is Keyword.CTE:
+            index, ctes = self._definitions(1, self.count, walk=False)
+            return self.keys[index], index, ctes
+        return 'UNKNOWN', 0, 0
+
+    def _target_tables(self, type_name, index, ctes):
+        """与 BloodlineAnalyzer._add_target_table 相同地取目标表"""
+        if type_name == 'SELECT':
+            # 唯一的WITH子句定义是第一个标识符，"name AS (...)" 中取不到表名
+            return [] if ctes == 1 else self._select_target(index + 1)
+
+        # 类型关键字之后跳过 INTO/TABLE/OVERWRITE 等关键字，取第一个名称
+        count = self.count
+        index += 1
+        while index < count and self.ttypes[index] in Keyword:
+            if self.keys[index] == 'VALUES' or self.ttypes[index] in (Keyword.DML, Keyword.DDL):
+                raise FastPathUnsupported('target')
+            index += 1
+        if index == count:
+            return []
+        parts = self._qualified_name(index, count)
+        index = parts[-1] + 1
+        if index < count and self._is_punctuation(index, '('):
+            # 带列清单的目标表 "t (a, b)"，取名称
+            after = self.match[index] + 1
+            if after < count and self._is_name(after):
+                raise FastPathUnsupported('aliased target')
+            return self._name_tables(parts, None)
+        index, alias = self._alias(index, count)
+        if index < count and self.ttypes[index] not in Keyword:
+            raise FastPathUnsupported('target')
+        return self._name_tables(parts, alias)
+
+    def _select_target(self, index):
+        """SELECT语句第一层的第一个标识符: 单列的SELECT列表或第一个FROM表"""
+        count = self.count
+        while index < count and self.ttypes[index] is Keyword and \
+                self.keys[index] in ('DISTINCT', 'ALL'):
+            index += 1
+        items = []
+        while True:
+            index, item = self._select_item(index, count)
+            items.append(item)
+            if index < count and self._is_punctuation(index, ','):
+                index += 1
+                continue
+            break
+
+        if len(items) == 1:
+            kind, parts, alias = items[0]
+            if kind == 'name':
+                return self._name_tables(parts, alias)
+            if alias == 'as':
+                return []
+            if alias is not None:
+                raise FastPathUnsupported('aliased expression')
+        elif any(kind == 'paren' and alias is None for kind, _, alias in items):
+            raise FastPathUnsupported('parenthesis in list')  # 括号不能作为标识符列表成员
+
+        # 多列的SELECT列表为标识符列表，第一个标识符是第一个FROM表
+        if index == count:
+            return []
+        if not (self.ttypes[index] is Keyword and self.keys[index] == 'FROM'):
+            raise FastPathUnsupported('select target')
+        references = []
+        while True:
+            index += 1
+            if index == count:
+                raise FastPathUnsupported('missing table')
+            if self._is_punctuation(index, '('):
+                parts = None
+                index = self.match[index] + 1
+            else:
+                parts = self._qualified_name(index, count)
+                index = parts[-1] + 1
+                if index < count and self._is_punctuation(index, '('):
+                    raise FastPathUnsupported('table function')
+            index, alias = self._alias(index, count)
+            references.append((parts, alias))
+            if not (index < count and self._is_punctuation(index, ',')):
+                break
+        if len(references) == 1:
+            parts, alias = references[0]
+            if parts is not None:
+                return self._name_tables(parts, alias)
+            if alias == 'as':
+                return []
+        elif index == count or (self.ttypes[index] is Keyword and self.keys[index] == 'WHERE' and
+                                self._where_end(index, count) == count):
+            # 多个FROM表也是标识符列表，其后没有其它子句时第一层没有标识符
+            return []
+        raise FastPathUnsupported('select target')
+
+    def _select_item(self, index, end):
+        """读取一个SELECT列，返回 (其后的下标, (类型, 名称下标, 别名类型))"""
+        if index >= end:
+            raise FastPathUnsupported('empty select item')
+        ttype = self.ttypes[index]
+        parts = None
+        if self._is_punctuation(index, '('):
+            kind = 'paren'
+            index = self.match[index] + 1
+        elif ttype is Keyword and self.keys[index] == 'CASE':
+            kind = 'case'
+            index = self._case_end(index, end)
+        elif self._is_name(index) and index + 1 < end and self._is_punctuation(index + 1, '('):
+            kind = 'function'
+            index = self.match[index + 1] + 1
+            if index + 1 < end and self.ttypes[index] in Keyword and self.keys[index] == 'OVER':
+                # 窗口函数 "f(...) OVER (...)" 或 "f(...) OVER w"
+                if self._is_punctuation(index + 1, '('):
+                    index = self.match[index + 1] + 1
+                elif self._is_name(index + 1):
+                    index += 2
+                else:
+                    raise FastPathUnsupported('window')
+        elif self._is_name(index):
+            kind = 'name'
+            parts = self._qualified_name(index, end, wildcard=True)
+            index = parts[-1] + 1
+        elif ttype is Wildcard:
+            kind = 'wildcard'
+            index += 1
+        elif ttype in Number or ttype is String.Single:
+            kind = 'literal'
+            index += 1
+        else:
+            raise FastPathUnsupported('select item')
+
+        index, alias = self._alias(index, end)
+        if (alias is not None and kind == 'wildcard') or (alias == 'name' and kind == 'literal'):
+            # 字符串之后的名称不会被合并为别名
+            raise FastPathUnsupported('alias')
+        if index < end and not (self._is_punctuation(index, ',') or (
+                self.ttypes[index] in Keyword and self.keys[index] != 'AS' and
+                not self._absorbed(index))):
+            raise FastPathUnsupported('select item')
+        return index, (kind, parts, alias)
+
+    def _qualified_name(self, index, end, wildcard=False):
+        """读取 "名称[.名称[.名称]]"，返回各段的下标，wildcard为True时允许以 ".*" 结尾"""
+        if not self._is_name(index):
+            raise FastPathUnsupported(self.keys[index])
+        parts = [index]
+        while index + 1 < end and self._is_punctuation(index + 1, '.'):
+            index += 2
+            if index >= end or self.spaced[index - 1] or self.spaced[index]:
+                raise FastPathUnsupported('qualified name')
+            if not self._is_name(index):
+                if wildcard and self.ttypes[index] is Wildcard:
+                    parts.append(index)
+                    break
+                raise FastPathUnsupported('qualified name')
+            parts.append(index)
+        if len(parts) > 3:
+            raise FastPathUnsupported('qualified name')
+        return parts
+
+    def _alias(self, index, end):
+        """读取 " AS 别名" 或 " 别名"，返回 (其后的下标, 'as'/'name'/None)"""
+        if index >= end:
+            return index, None
+        if not self.spaced[index]:
+            # 与前面的名称之间没有空白时不是简单别名
+            if self.ttypes[index] in Keyword and self.keys[index] == 'AS' or self._is_name(index):
+                raise FastPathUnsupported('alias')
+            return index, None
+        if self.ttypes[index] in Keyword and self.keys[index] == 'AS':
+            if index + 1 < end and self._is_name(index + 1):
+                return index + 2, 'as'
+            if index + 1 < end and (self.ttypes[index + 1] in (Keyword.DML, Keyword.DDL,
+                                                               Keyword.CTE) or
+                                    self._is_punctuation(index + 1, '(')):
+                return index, None
+            raise FastPathUnsupported('alias')
+        if self._is_name(index):
+            return index + 1, 'name'
+        return index, None
+
+    def _name_tables(self, parts, alias):
+        """与 BloodlineAnalyzer._get_identifier_tables 相同地从名称中取表名"""
+        names = [self.keys[index] for index in parts]
+        if len(names) == 1:
+            return [] if alias == 'as' else names
+        return ['.'.join(names)]
+
+    def _case_end(self, index, end):
+        """CASE ... END 之后的下标，其中的子查询只在未加别名时遍历，不做处理"""
+        depth = 0
+        while index < end:
+            if self._is_punctuation(index, '('):
+                close = self.match[index]
+                if self._active(index, close):
+                    raise FastPathUnsupported('subquery in CASE')
+                index = close
+            elif self.ttypes[index] is Keyword:
+                if self.keys[index] == 'CASE':
+                    depth += 1
+                elif self.keys[index] == 'END':
+                    depth -= 1
+                    if not depth:
+                        return index + 1
+            index += 1
+        raise FastPathUnsupported('CASE')
+
+    def _where_end(self, index, end):
+        """WHERE 子句到下一个结束关键字(ORDER BY/GROUP BY/UNION等)或本层末尾"""
+        index += 1
+        while index < end:
+            if self._is_punctuation(index, '('):
+                index = self.match[index]
+            elif self.ttypes[index] is Keyword and self.keys[index] in WHERE_CLOSE_KEYWORDS:
+                return index
+            index += 1
+        return end
+
+    def _walk(self, start, end):
+        """与 BloodlineAnalyzer._walk_steps 相同的表名状态机，处理 [start, end) 内同一层的token
+
+        表名前缀关键字之后遇到其它关键字或逗号时，本层不再提取表名，直接返回。
+        """
+        ttypes = self.ttypes
+        keys = self.keys
+        preceding = False
+        index = start
+        while index < end:
+            ttype = ttypes[index]
+            key = keys[index]
+            if ttype is Punctuation and key == '(':
+                close = self.match[index]
+                if self._active(index, close):
+                    self._subquery(index, close, start, end)
+                index = close + 1
+                continue
+            if ttype in Keyword and not self._absorbed(index):
+                if key == 'CASE':
+                    if preceding:
+                        raise FastPathUnsupported(key)
+                    index = self._case_end(index, end)
+                    continue
+                if ttype is Keyword and key == 'WHERE':
+                    # WHERE 子句是一个分组，在其内部重新开始状态机
+                    stop = self._where_end(index, end)
+                    self._walk(index + 1, stop)
+                    index = stop
+                    continue
+                if TokenUtils.precedes_table_name(key):
+                    if index > start and (self._is_punctuation(index - 1, ',') or
+                                          self.keys[index - 1] == 'AS'):
+                        # 逗号和AS之后的关键字会被并入标识符列表或别名
+                        raise FastPathUnsupported(key)
+                    preceding = True
+                    index = self._table_references(index, end)
+                    continue
+                if preceding:
+                    if not (TokenUtils.is_result_operation(key) or key == ON_KEYWORD or
+                            ttype is Keyword.DML):
+                        return
+                    preceding = False
+            elif preceding:
+                if ttype is Punctuation and key == ',':
+                    return
+                raise FastPathUnsupported(key)
+            index += 1
+
+    def _subquery(self, start, end, level_start, level_end):
+        """遍历表名位置之外的子查询，只接受关键字或比较运算符之后、关键字或本层末尾之前的括号"""
+        prev = start - 1
+        if prev >= level_start:
+            ttype = self.ttypes[prev]
+            if ttype in Keyword:
+                if self.keys[prev] in ('AS', 'OVER'):
+                    raise FastPathUnsupported('subquery')
+            elif ttype is Operator.Comparison:
+                # 比较运算的左侧不能是标识符列表的成员
+                index = prev - 1
+                while index >= level_start and self.ttypes[index] not in Keyword:
+                    if self._is_punctuation(index, ','):
+                        raise FastPathUnsupported('subquery in list')
+                    index = self.match[index] - 1 if self._is_punctuation(index, ')') else index - 1
+            else:
+                raise FastPathUnsupported('subquery')
+        after = end + 1
+        if after < level_end and not (self.ttypes[after] in Keyword and self.keys[after] != 'AS'):
+            raise FastPathUnsupported('subquery')
+        self._walk(start + 1, end)
+
+    def _table_references(self, index, end):
+        """处理表名前缀关键字之后的表引用，返回其后第一个token的下标"""
+        key = self.keys[index]
+        ttype = self.ttypes[index]
+        index += 1
+        if ttype is Keyword.CTE:
+            return self._definitions(index, end, walk=True)[0]
+        if key != 'FROM' and 'JOIN' not in key:
+            # DESC 等其它前缀之后不是表引用时不产生表名
+            if index < end and (self._is_name(index) or self.ttypes[index] in Name or
+                                self._is_punctuation(index, '(')):
+                raise FastPathUnsupported(key)
+            return index
+
+        listed = False
+        while True:
+            if index >= end:
+                raise FastPathUnsupported('missing table')
+            if self._is_punctuation(index, '('):
+                # 派生表: 子查询以表名位置重新开始状态机
+                close = self.match[index]
+                if self._active(index, close):
+                    self._walk(index + 1, close)
+                index, alias = self._alias(close + 1, end)
+                if alias is None and (listed or (index < end and
+                                                 self._is_punctuation(index, ','))):
+                    raise FastPathUnsupported('parenthesis in list')
+            else:
+                parts = self._qualified_name(index, end)
+                index = parts[-1] + 1
+                if index < end and self._is_punctuation(index, '('):
+                    raise FastPathUnsupported('table function')
+                index, alias = self._alias(index, end)
+                self.table_names.extend(self._name_tables(parts, alias))
+            if index == end:
+                return index
+            if self._is_punctuation(index, ','):
+                listed = True
+                index += 1
+                continue
+            if self.ttypes[index] not in Keyword or self.ttypes[index] in Keyword.Order:
+                raise FastPathUnsupported(self.keys[index])
+            return index
+
+    def _definitions(self, index, end, walk):
+        """读取WITH之后的 "name AS (...)[, ...]" 列表
+
+        Args:
+            index: WITH之后的第一个下标
+            end: 本层结束下标
+            walk: 是否登记WITH子句名称并提取定义中的表名
+
+        Returns:
+            (列表之后DML关键字的下标, 定义个数)
+        """
+        ctes = 0
+        while True:
+            if not (index + 2 < end and self._is_name(index) and
+                    self.ttypes[index + 1] in Keyword and self.keys[index + 1] == 'AS' and
+                    self._is_punctuation(index + 2, '(')):
+                raise FastPathUnsupported('WITH')
+            close = self.match[index + 2]
+            if walk:
+                name = self.keys[index]
+                self.alias_names.append(name)
+                self.defined.add(index + 1)
+                start = len(self.table_names)
+                if self._active(index + 2, close):
+                    self._walk(index + 3, close)
+                self.cte_tables.setdefault(name, self.table_names[start:])
+            ctes += 1
+            index = close + 1
+            if index < end and self._is_punctuation(index, ','):
+                index += 1
+                continue
+            if index < end and self.ttypes[index] is Keyword.DML:
+                return index, ctes
+            raise FastPathUnsupported('WITH')
+
+@functools.lru_cache(maxsize=None)
+def load_pyecharts() -> types.SimpleNamespace:
+    """首次可视化时才导入pyecharts
+
+    只做血缘分析(命令行、工作进程等)时不需要导入可视化依赖，
+    可明显缩短启动时间。
+
+    Returns:
+        SimpleNamespace: 包含 opts、Tree、Sankey、CurrentConfig、FILENAMES
+    """
+    from pyecharts import options
+    from pyecharts.charts import Tree, Sankey
+    from pyecharts.datasets import FILENAMES
+    from pyecharts.globals import CurrentConfig
+    return types.SimpleNamespace(opts=options, Tree=Tree, Sankey=Sankey,
+                                 CurrentConfig=CurrentConfig, FILENAMES=FILENAMES)
+
+@functools.lru_cache(maxsize=None)
+def load_numpy() -> Union[types.ModuleType, None]:
+    """首次做影响分析时才导入NumPy
+
+    NumPy为可选依赖，缺失时影响分析使用纯Python实现。只做血缘分析时不需要导入，
+    可缩短命令行和工作进程的启动时间。
+
+    Returns:
+        module: numpy模块，未安装时返回None
+    """
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+class SankeyBuilder:
+    """桑基图数据构建
+
+    节点和链接用字典去重，同一对节点的多条链接合并并累加权重，
+    构建时间与链接数成线性关系。列和相邻表过多时只保留前若干个，
+    其余合并为一个汇总节点，保证大宽表的图仍然可读。
+
+    Args:
+        top_k: 每个表最多展示的列数，为None时不限制
+        max_tables: 最多展示的源表(或每个表的相邻表)数，为None时不限制
+    """
+    def __init__(self, top_k: int = None, max_tables: int = None):
+        self.top_k = top_k
+        self.max_tables = max_tables
+        self.nodes = {}  # 节点名 -> None，保持插入顺序
+        self.links = {}  # (源节点, 目标节点) -> 权重
+
+    def add_node(self, name: str):
+        """添加节点"""
+        self.nodes[name] = None
+
+    def add_link(self, source: str, target: str, value: int):
+        """添加链接，重复链接累加权重，自环链接忽略(桑基图不允许环)"""
+        if source == target:
+            return
+        self.nodes[source] = None
+        self.nodes[target] = None
+        key = (source, target)
+        self.links[key] = self.links.get(key, 0) + value
+
+    @staticmethod
+    def _split(items, limit):
+        """按上限拆分为展示部分和折叠部分"""
+        if limit is None or len(items) <= limit:
+            return items, ()
+        return items[:limit], items[limit:]
+
+    def add_statement(self, table_names, column_names):
+        """添加一条语句: 目标表->源表 权重10，源表->列 权重5"""
+        # 1. 添加表节点
+        for table in table_names:
+            self.add_node(table)
+        if not table_names:
+            return
+
+        # 2. 目标表到源表的链接，超出部分合并
+        target = table_names[0]
+        shown, hidden = self._split(range(1, len(table_names)), self.max_tables)
+        for i in shown:
+            self.add_link(target, table_names[i], 10)
+        if hidden:
+            self.add_link(target, f'其他 {len(hidden)} 个表', 10 * len(hidden))
+
+        # 3. 源表到列的链接，每个表只保留前top_k列
+        for i in shown:
+            columns = column_names[i] if i < len(column_names) else ()
+            kept, rest = self._split(columns, self.top_k)
+            for column in kept:
+                self.add_link(table_names[i], column, 5)
+            if rest:
+                self.add_link(table_names[i], f'{table_names[i]} 其他 {len(rest)} 列', 5 * len(rest))
+
+    def add_graph(self, graph: 'LineageGraph', table_name: str,
+                  direction: str = 'upstream', max_depth: int = None):
+        """从表血缘图中按层展开起始表的上游或下游
+
+        只保留指向更深一层的边，保证结果无环。
+
+        Args:
+            graph: 表血缘图
+            table_name: 起始表
+            direction: 'upstream' 或 'downstream'
+            max_depth: 最多展开的层数，为None时不限制
+        """
+        adjacency = graph.upstream if direction == 'upstream' else graph.downstream
+        start = graph._node(table_name)
+        self.add_node(start)
+        depths = {start: 0}
+        frontier = [start]
+        while frontier and (max_depth is None or depths[frontier[0]] < max_depth):
+            next_frontier = []
+            for node in frontier:
+                depth = depths[node] + 1
+                neighbors = sorted(neighbor for neighbor in adjacency.get(node, ())
+                                   if depths.setdefault(neighbor, depth) == depth)
+                shown, hidden = self._split(neighbors, self.max_tables)
+                for neighbor in shown:
+                    if neighbor not in self.nodes:
+                        next_frontier.append(neighbor)
+                    self._add_directed(node, neighbor, direction, 1)
+                if hidden:
+                    self._add_directed(node, f'{node} 其他 {len(hidden)} 个表', direction, len(hidden))
+            frontier = next_frontier
+
+    def _add_directed(self, node, neighbor, direction, value):
+        """按数据流向添加链接: 上游在左，下游在右"""
+        if direction == 'upstream':
+            self.add_link(neighbor, node, value)
+        else:
+            self.add_link(node, neighbor, value)
+
+    def build(self) -> Tuple[List[dict], List[dict]]:
+        """生成pyecharts桑基图所需的节点和链接列表"""
+        nodes = [{'name': name} for name in self.nodes]
+        links = [{'source': source, 'target': target, 'value': value}
+                 for (source, target), value in self.links.items()]
+        return nodes, links
 
 class BloodlineVisualizer:
     """血缘关系可视化类"""
     @staticmethod
-    def create_column_sankey(table_names, column_names):
-        """创建字段血缘桑基图"""
-        nodes = []
-        # 添加表节点
-        for table in table_names:
-            nodes.append({"name": table})
-
-        # 添加列节点
-        for i in range(1, len(column_names)):
-            for col in column_names[i]:
-                nodes.append({"name": col})
-
-        # 去重
-        nodes = [i for n, i in enumerate(nodes) if i not in nodes[:n]]
-
-        # 创建链接
-        links = []
-        # 表之间的链接
-        for i in range(1, len(table_names)):
-            links.append({
-                'source': table_names[0],
-                'target': table_names[i],
-                'value': 10
-            })
+    def create_column_sankey(table_names, column_names, profiler: BloodlineProfiler = None,
+                             statement=None):
+        """创建字段血缘桑基图，profiler不为None时计入statement的visualize阶段"""
+        with profiler.visualize_phase(statement) if profiler is not None else NULL_PHASE:
+            return BloodlineVisualizer._render_notebook(
+                BloodlineVisualizer.build_column_sankey(table_names, column_names))
 
-        # 表和列之间的链接
-        for i in range(1, len(table_names)):
-            for col in column_names[i]:
-                links.append({
-                    'source': table_names[i],
-                    'target': col,
-                    'value': 5
-                })
+    @staticmethod
+    def build_column_sankey(table_names, column_names, top_k: int = None,
+                            max_tables: int = None) -> 'Sankey':
+        """创建字段血缘桑基图对象，不加载JavaScript，可用于Notebook或批量报告
+
+        Args:
+            table_names: 表名列表，第一个为目标表
+            column_names: 与表名一一对应的列名列表
+            top_k: 每个表最多展示的列数，其余合并为 "其他 N 列"
+            max_tables: 最多展示的源表数，其余合并为 "其他 N 个表"
+        """
+        builder = SankeyBuilder(top_k, max_tables)
+        builder.add_statement(table_names, column_names)
+        return BloodlineVisualizer._build_sankey(builder, "字段血缘")
+
+    @staticmethod
+    def build_lineage_sankey(graph: 'LineageGraph', table_name: str, direction: str = 'upstream',
+                             max_depth: int = 3, max_tables: int = None) -> 'Sankey':
+        """创建跨语句表血缘桑基图对象
+
+        Args:
+            graph: 表血缘图
+            table_name: 起始表
+            direction: 'upstream' 或 'downstream'
+            max_depth: 最多展开的层数
+            max_tables: 每个表最多展示的相邻表数，其余合并为 "其他 N 个表"
+        """
+        builder = SankeyBuilder(max_tables=max_tables)
+        builder.add_graph(graph, table_name, direction, max_depth)
+        return BloodlineVisualizer._build_sankey(builder, f"表血缘-{table_name}")
+
+    @staticmethod
+    def _build_sankey(builder: 'SankeyBuilder', title: str) -> 'Sankey':
+        """由构建器的节点和链接生成桑基图"""
+        nodes, links = builder.build()
+        pyecharts = load_pyecharts()
 
         # 创建桑基图
         sankey = (
-            Sankey()
+            pyecharts.Sankey()
             .add(
                 "表与字段",
                 nodes=nodes,
                 links=links,
-                linestyle_opt=opts.LineStyleOpts(opacity=0.5, curve=0.5, color="source"),
-                label_opts=opts.LabelOpts(position="right"),
+                linestyle_opt=pyecharts.opts.LineStyleOpts(opacity=0.5, curve=0.5, color="source"),
+                label_opts=pyecharts.opts.LabelOpts(position="right"),
                 node_width=20,
                 node_gap=10,
             )
-            .set_global_opts(title_opts=opts.TitleOpts(title="字段血缘"))
+            .set_global_opts(title_opts=pyecharts.opts.TitleOpts(title=title))
         )
+        return sankey
 
-        sankey.load_javascript()
-        return sankey.render_notebook()
+    @staticmethod
+    def create_table_tree(table_names, type_name, profiler: BloodlineProfiler = None,
+                          statement=None):
+        """创建表血缘树图，profiler不为None时计入statement的visualize阶段"""
+        with profiler.visualize_phase(statement) if profiler is not None else NULL_PHASE:
+            return BloodlineVisualizer._render_notebook(
+                BloodlineVisualizer.build_table_tree(table_names, type_name))
 
     @staticmethod
-    def create_table_tree(table_names, type_name):
-        """创建表血缘树图"""
+    def build_table_tree(table_names, type_name) -> 'Tree':
+        """创建表血缘树图对象，不加载JavaScript，可用于Notebook或批量报告"""
+        pyecharts = load_pyecharts()
         table_names = list(set(table_names))
 
         if type_name != 'SELECT':
@@ -406,7 +2176,7 @@ class BloodlineVisualizer:
             title = f"查询-{type_name}"
 
         tree = (
-            Tree()
+            pyecharts.Tree()
             .add(
                 "",
                 data,
@@ -414,65 +2184,1558 @@ class BloodlineVisualizer:
                 initial_tree_depth=2
             )
             .set_global_opts(
-                title_opts=opts.TitleOpts(title=title),
-                toolbox_opts=opts.ToolboxOpts(is_show=True),
-                tooltip_opts=opts.TooltipOpts(trigger="item", trigger_on="mousemove")
+                title_opts=pyecharts.opts.TitleOpts(title=title),
+                toolbox_opts=pyecharts.opts.ToolboxOpts(is_show=True),
+                tooltip_opts=pyecharts.opts.TooltipOpts(trigger="item", trigger_on="mousemove")
             )
         )
 
-        tree.load_javascript()
-        return tree.render_notebook()
+        return tree
+
+    @staticmethod
+    def _render_notebook(chart):
+        """加载JavaScript并生成Notebook中显示的HTML"""
+        chart.load_javascript()
+        return chart.render_notebook()
+
+class BloodlineReport:
+    """批量血缘报告
+
+    将多条语句的图表写入同一个独立HTML文件: echarts只引入一次，
+    每个图表的配置以JSON保存在页面中，滚动到可见区域时才初始化，
+    不依赖Jupyter，可在无界面环境中生成。
+
+    Args:
+        title: 页面标题
+        js_host: echarts脚本所在地址，默认使用pyecharts的在线地址
+        chart_height: 每个图表的高度(像素)
+        sql_limit: 每条语句在报告中展示的SQL长度，为0时不展示
+        top_k: 桑基图中每个表最多展示的列数，其余合并
+        max_tables: 桑基图中最多展示的源表数，其余合并
+    """
+    def __init__(self, title: str = 'SQL血缘报告', js_host: str = None,
+                 chart_height: int = 500, sql_limit: int = 2000,
+                 top_k: int = None, max_tables: int = None):
+        self.title = title
+        self.top_k = top_k
+        self.max_tables = max_tables
+        self.js_host = js_host or load_pyecharts().CurrentConfig.ONLINE_HOST
+        self.chart_height = chart_height
+        self.sql_limit = sql_limit
+        self.sections = []  # (标题, SQL文本, [图表配置JSON, ...])
+
+    def add(self, result: BloodlineResult, sql_text: str = None,
+            profiler: BloodlineProfiler = None, statement=None):
+        """添加一条语句的表血缘树图和字段血缘桑基图，没有表的语句跳过
+
+        Args:
+            result: 语句的血缘结果
+            sql_text: 语句文本，用于在报告中展示
+            profiler: 可选的性能统计，计入visualize阶段
+            statement: 结果所属的语句对象，visualize耗时计入该语句
+        """
+        if not result.table_names:
+            return
+
+        with profiler.visualize_phase(statement) if profiler is not None else NULL_PHASE:
+            charts = [BloodlineVisualizer.build_table_tree(list(result.table_names),
+                                                           result.statement_type)]
+            if any(result.column_names):
+                charts.append(BloodlineVisualizer.build_column_sankey(
+                    result.table_names, result.column_names, self.top_k, self.max_tables))
+
+            title = f'#{len(self.sections) + 1} {result.statement_type}'
+            if result.target_table:
+                title += f' {result.target_table}'
+            # 只保留配置JSON，不持有图表对象
+            self.sections.append((title, (sql_text or '')[:self.sql_limit],
+                                  [chart.dump_options_with_quotes() for chart in charts]))
+
+    def render(self, file_path: str = 'bloodline_report.html') -> str:
+        """写出HTML文件
+
+        Args:
+            file_path: 输出文件路径
+
+        Returns:
+            str: 输出文件路径
+        """
+        script = f'{self.js_host}{load_pyecharts().FILENAMES["echarts"][0]}.js'
+        with open(file_path, 'w', encoding='utf-8') as file:
+            file.write(REPORT_HEAD.format(title=html.escape(self.title),
+                                          script=html.escape(script),
+                                          height=self.chart_height))
+            for title, sql_text, options in self.sections:
+                file.write(f'<section><h2>{html.escape(title)}</h2>\n')
+                if sql_text:
+                    file.write(f'<details><summary>SQL</summary><pre>{html.escape(sql_text)}</pre></details>\n')
+                for option in options:
+                    # 避免配置中的 "</" 提前结束script标签
+                    option = option.replace('</', '<\\/')
+                    file.write(f'<div class="chart"><script type="application/json">{option}</script></div>\n')
+                file.write('</section>\n')
+            file.write(REPORT_TAIL)
+        return file_path
+
+class BloodlineCache:
+    """血缘结果缓存
+
+    以规范化语句文本和分析器版本的哈希为键，内存中保留LRU层，
+    指定目录时再使用SQLite文件层在进程间持久化。
+    """
+    def __init__(self, maxsize: int = 10000, cache_dir: str = None):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._db = None
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            self._db = sqlite3.connect(os.path.join(cache_dir, CACHE_FILE_NAME), timeout=30)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS bloodline (key TEXT PRIMARY KEY, value BLOB)'
+            )
+
+    @staticmethod
+    def make_key(sql_text: str, columns: bool = True) -> str:
+        """计算语句的缓存键，忽略空白差异，只分析表血缘的结果单独缓存"""
+        normalized = ' '.join(sql_text.split()).rstrip(';')
+        version = ANALYZER_VERSION if columns else f'{ANALYZER_VERSION}:tables'
+        return hashlib.sha256(f'{version}\0{normalized}'.encode('utf-8')).hexdigest()
+
+    def get(self, key: str):
+        """查询缓存，未命中返回None"""
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return self._memory[key]
+
+        if self._db is not None:
+            row = self._db.execute(
+                'SELECT value FROM bloodline WHERE key = ?', (key,)
+            ).fetchone()
+            if row is not None:
+                value = pickle.loads(row[0])
+                self._remember(key, value)
+                self.hits += 1
+                return value
+
+        self.misses += 1
+        return None
+
+    def put(self, key: str, value):
+        """写入缓存"""
+        self._remember(key, value)
+        if self._db is not None:
+            with self._db:
+                self._db.execute(
+                    'INSERT OR REPLACE INTO bloodline (key, value) VALUES (?, ?)',
+                    (key, pickle.dumps(value))
+                )
+
+    def _remember(self, key, value):
+        """写入内存LRU层"""
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.maxsize:
+            self._memory.popitem(last=False)
+
+    def stats(self) -> dict:
+        """返回命中统计"""
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'size': len(self._memory),
+        }
+
+    def close(self):
+        """关闭持久化连接"""
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+def get_cache(cache_dir: str = None) -> BloodlineCache:
+    """获取当前进程内共享的缓存实例，供进程池工作进程复用
+
+    实例按进程号区分: fork 出的工作进程会继承父进程已打开的 SQLite 连接，
+    该连接不能跨进程使用，工作进程中总是重新打开自己的连接。
+    """
+    return _process_cache(cache_dir, os.getpid())
+
+@functools.lru_cache(maxsize=None)
+def _process_cache(cache_dir: str, pid: int) -> BloodlineCache:
+    """按 (缓存目录, 进程号) 缓存的实例，见 get_cache"""
+    return BloodlineCache(cache_dir=cache_dir)
+
+class BloodlineManifest:
+    """增量分析清单
+
+    记录每个已分析文件的路径、大小、修改时间、内容哈希及其血缘结果，
+    再次运行时只重新分析新增或变化的文件，并移除本次扫描范围内已删除文件的结果。
+    """
+    def __init__(self, manifest_path: str):
+        self.manifest_path = manifest_path
+        self.entries = {}
+        self.added = []
+        self.changed = []
+        self.removed = []
+        if os.path.exists(manifest_path):
+            with open(manifest_path, 'rb') as file:
+                data = pickle.load(file)
+            # 分析器版本变化后清单作废，全部重新分析
+            if data.get('version') == ANALYZER_VERSION:
+                self.entries = data['entries']
+
+    @staticmethod
+    def file_hash(file_path: str) -> str:
+        """计算文件内容哈希"""
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as file:
+            for chunk in iter(lambda: file.read(1 << 20), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def _is_unchanged(self, file_path: str, stat) -> bool:
+        """判断文件是否未变化，大小和修改时间一致时不再计算哈希"""
+        entry = self.entries.get(file_path)
+        if entry is None:
+            return False
+        if entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime:
+            return True
+        if entry['hash'] == self.file_hash(file_path):
+            entry['size'], entry['mtime'] = stat.st_size, stat.st_mtime
+            return True
+        return False
+
+    @staticmethod
+    def _in_scope(file_path: str, paths: List[str]) -> bool:
+        """判断文件是否位于本次扫描的路径中: 与某个文件路径相同、在某个目录之下或匹配某个通配符"""
+        for path in paths:
+            if glob.has_magic(path):
+                if fnmatch.fnmatch(file_path, path):
+                    return True
+            elif file_path == path or file_path.startswith(os.path.join(path, '')):
+                return True
+        return False
+
+    def refresh(self, paths: List[str], jobs: int = None, cache_dir: str = None) -> List[tuple]:
+        """增量分析并更新清单
+
+        Args:
+            paths: 文件或目录路径列表
+            jobs: 工作进程数
+            cache_dir: 持久化缓存目录
+
+        Returns:
+            List[tuple]: 每个文件的 (文件路径, [血缘结果, ...])，顺序与输入一致；
+                分析失败的文件不记入清单，下次运行时重新分析；无法读取文件信息时
+                保留清单中原有的结果
+        """
+        files = list(iter_sql_paths(paths))
+
+        # 1. 找出新增和变化的文件
+        stale = []
+        failed = {}
+        self.added, self.changed = [], []
+        for file_path in files:
+            try:
+                stat = os.stat(file_path)
+                if self._is_unchanged(file_path, stat):
+                    continue
+            except OSError as e:
+                failed[file_path] = [BloodlineResult.failed(f'{type(e).__name__}: {e}')]
+                continue
+            (self.changed if file_path in self.entries else self.added).append(file_path)
+            stale.append((file_path, stat))
+
+        # 2. 移除已删除文件的结果: 只移除本次扫描范围内且已不存在的文件，
+        #    未扫描的路径和暂时无法读取的文件保留原结果
+        current = set(files)
+        self.removed = [path for path in self.entries
+                        if path not in current and self._in_scope(path, paths) and
+                        not os.path.lexists(path)]
+        for file_path in self.removed:
+            del self.entries[file_path]
+
+        # 3. 只分析新增和变化的文件
+        analyzed = analyze_paths([path for path, _ in stale], jobs, cache_dir)
+        for (file_path, stat), (_, bloodline) in zip(stale, analyzed):
+            if any(result.status == 'error' for result in bloodline):
+                self.entries.pop(file_path, None)
+                failed[file_path] = bloodline
+                continue
+            try:
+                file_hash = self.file_hash(file_path)
+            except OSError as e:
+                self.entries.pop(file_path, None)
+                failed[file_path] = [BloodlineResult.failed(f'{type(e).__name__}: {e}')]
+                continue
+            self.entries[file_path] = {
+                'size': stat.st_size,
+                'mtime': stat.st_mtime,
+                'hash': file_hash,
+                'bloodline': bloodline,
+            }
+
+        self.save()
+        return [(path, failed[path] if path in failed else self.entries[path]['bloodline'])
+                for path in files]
+
+    def save(self):
+        """原子写入清单文件"""
+        directory = os.path.dirname(os.path.abspath(self.manifest_path))
+        os.makedirs(directory, exist_ok=True)
+        temp_path = f'{self.manifest_path}.tmp'
+        with open(temp_path, 'wb') as file:
+            pickle.dump({'version': ANALYZER_VERSION, 'entries': self.entries}, file)
+        os.replace(temp_path, self.manifest_path)
+
+class LineageGraph:
+    """跨语句、跨文件的表血缘图
+
+    以正向(上游->下游)和反向(下游->上游)邻接字典保存边，
+    查询某个表的上下游只需访问其邻接集合。WITH 子句名称只在语句内部有效，
+    不作为图中的节点，而是展开为其定义中引用的表。
+    """
+    def __init__(self, case_sensitive: bool = False):
+        self.case_sensitive = case_sensitive
+        self.downstream = defaultdict(set)  # 表 -> 下游表集合
+        self.upstream = defaultdict(set)    # 表 -> 上游表集合
+        self.edge_origins = defaultdict(set)  # (上游表, 下游表) -> 来源语句标识
+        self.nodes = set()
+
+    def _node(self, table_name: str) -> str:
+        """规范化表名"""
+        return table_name if self.case_sensitive else table_name.lower()
+
+    def add_edge(self, source: str, target: str, origin: str = None):
+        """添加一条 上游表->下游表 的边"""
+        source, target = self._node(source), self._node(target)
+        self.nodes.add(source)
+        self.nodes.add(target)
+        if source == target:
+            return
+        self.downstream[source].add(target)
+        self.upstream[target].add(source)
+        if origin is not None:
+            self.edge_origins[(source, target)].add(origin)
+
+    def add_result(self, result: BloodlineResult, origin: str = None):
+        """加入一条语句的血缘结果
+
+        Args:
+            result: 血缘结果
+            origin: 来源标识，如 "文件路径#语句序号"
+        """
+        ctes = {self._node(name): tables
+                for name, tables in zip(result.cte_names, result.cte_tables)}
+        sources = [source for table in result.source_tables
+                   for source in self._expand_cte(table, ctes, set())]
+
+        if result.target_table is None:
+            self.nodes.update(self._node(table) for table in sources)
+            return
+
+        self.nodes.add(self._node(result.target_table))
+        for source in sources:
+            self.add_edge(source, result.target_table, origin)
+
+    def _expand_cte(self, table_name: str, ctes: dict, expanding: set) -> List[str]:
+        """把WITH子句名称递归展开为其定义中引用的表，派生表(括号开头)忽略
+
+        Args:
+            table_name: 表名
+            ctes: 规范化的WITH子句名称 -> 定义中引用的表名
+            expanding: 正在展开的名称，定义中引用同名的表时视为真实表
+        """
+        if table_name.startswith('('):
+            return []
+        node = self._node(table_name)
+        if node not in ctes or node in expanding:
+            return [table_name]
+        expanding.add(node)
+        sources = [source for table in ctes[node]
+                   for source in self._expand_cte(table, ctes, expanding)]
+        expanding.discard(node)
+        return sources
+
+    def add_results(self, file_results: List[tuple]):
+        """加入 analyze_paths 形式的批量结果 [(文件路径, [血缘结果, ...]), ...]"""
+        for file_path, results in file_results:
+            for index, result in enumerate(results):
+                self.add_result(result, f'{file_path}#{index}')
+
+    def upstream_of(self, table_name: str) -> Set[str]:
+        """直接上游表"""
+        return set(self.upstream.get(self._node(table_name), ()))
+
+    def downstream_of(self, table_name: str) -> Set[str]:
+        """直接下游表"""
+        return set(self.downstream.get(self._node(table_name), ()))
+
+    def edges(self) -> Iterator[Tuple[str, str]]:
+        """遍历所有 (上游表, 下游表) 边"""
+        for source, targets in self.downstream.items():
+            for target in targets:
+                yield source, target
+
+    def remove_node(self, table_name: str):
+        """删除节点及其所有边"""
+        node = self._node(table_name)
+        for target in self.downstream.pop(node, ()):
+            self.upstream[target].discard(node)
+            self.edge_origins.pop((node, target), None)
+        for source in self.upstream.pop(node, ()):
+            self.downstream[source].discard(node)
+            self.edge_origins.pop((source, node), None)
+        self.nodes.discard(node)
+
+    def collapse_temporary(self, is_temporary=None) -> List[str]:
+        """消除中间表/临时表，将其上游直接连接到下游
+
+        Args:
+            is_temporary: 判断表名是否为临时表的函数，默认匹配 #、tmp_、temp_ 前缀
+
+        Returns:
+            List[str]: 被消除的表名
+        """
+        if is_temporary is None:
+            def is_temporary(name):
+                return bool(TEMPORARY_TABLE_PATTERN.match(name.rsplit('.', 1)[-1]))
+
+        removed = sorted(node for node in self.nodes if is_temporary(node))
+        for node in removed:
+            origins = {(source, target): self.edge_origins.get((source, node), set()) |
+                       self.edge_origins.get((node, target), set())
+                       for source in self.upstream.get(node, ())
+                       for target in self.downstream.get(node, ())}
+            self.remove_node(node)
+            for (source, target), edge_origins in origins.items():
+                self.add_edge(source, target)
+                if source != target:
+                    self.edge_origins[(source, target)] |= edge_origins
+        return removed
+
+class ImpactAnalyzer:
+    """基于血缘图的上下游影响分析
+
+    节点名映射为整数编号，正反两个方向的边以CSR(压缩稀疏行)数组保存。
+    闭包查询使用带记忆化的广度优先遍历，已计算的闭包在后续遍历中直接合并；
+    安装了NumPy时使用向量化遍历。
+    """
+    def __init__(self, edges, cache_size: int = 100000):
+        self.names = []  # 编号 -> 节点名
+        self.ids = {}    # 节点名 -> 编号
+        sources, targets = array('q'), array('q')
+        for source, target in edges:
+            sources.append(self._intern(source))
+            targets.append(self._intern(target))
+
+        self._forward = self._build_csr(sources, targets)
+        self._reverse = self._build_csr(targets, sources)
+        self._cache_size = cache_size
+        self._caches = {'downstream': OrderedDict(), 'upstream': OrderedDict()}
+
+    @classmethod
+    def from_graph(cls, graph: LineageGraph, **kwargs) -> 'ImpactAnalyzer':
+        """从表血缘图创建"""
+        return cls(graph.edges(), **kwargs)
+
+    @classmethod
+    def from_results(cls, file_results: List[tuple], include_columns: bool = True,
+                     **kwargs) -> 'ImpactAnalyzer':
+        """从 analyze_paths 形式的批量结果创建，可同时加入字段级的边
+
+        字段节点命名为 "表名.字段名"，指向使用它生成的目标表。
+        """
+        graph = LineageGraph()
+        graph.add_results(file_results)
+        edges = list(graph.edges())
+
+        if include_columns:
+            for _, results in file_results:
+                for result in results:
+                    if result.target_table is None:
+                        continue
+                    target = graph._node(result.target_table)
+                    cte_names = {graph._node(name) for name in result.cte_names}
+                    for table, columns in result.table_columns[1:]:
+                        table = graph._node(table)
+                        if table.startswith('(') or table in cte_names or table == target:
+                            continue
+                        for column in columns:
+                            edges.append((f'{table}.{graph._node(column)}', target))
+        return cls(edges, **kwargs)
+
+    def _intern(self, name: str) -> int:
+        """节点名转为整数编号"""
+        node_id = self.ids.get(name)
+        if node_id is None:
+            node_id = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return node_id
+
+    def _build_csr(self, sources, targets) -> tuple:
+        """按起点计数排序构建CSR数组 (indptr, indices)"""
+        count = len(self.names)
+        indptr = array('q', bytes(8 * (count + 1)))
+        for source in sources:
+            indptr[source + 1] += 1
+        for i in range(count):
+            indptr[i + 1] += indptr[i]
+
+        indices = array('q', bytes(8 * len(sources)))
+        position = array('q', indptr[:count])
+        for source, target in zip(sources, targets):
+            indices[position[source]] = target
+            position[source] += 1
+
+        np = load_numpy()
+        if np is not None:
+            return np.frombuffer(indptr, dtype=np.int64), np.frombuffer(indices, dtype=np.int64)
+        return indptr, indices
+
+    def _closure(self, start: int, direction: str):
+        """计算从start出发可达的节点编号集合"""
+        cache = self._caches[direction]
+        cached = cache.get(start)
+        if cached is not None:
+            cache.move_to_end(start)
+            return cached
+
+        indptr, indices = self._forward if direction == 'downstream' else self._reverse
+        np = load_numpy()
+        if np is not None:
+            reached = self._closure_numpy(np, start, indptr, indices)
+        else:
+            reached = self._closure_python(start, indptr, indices, cache)
+
+        cache[start] = reached
+        while len(cache) > self._cache_size:
+            cache.popitem(last=False)
+        return reached
+
+    @staticmethod
+    def _closure_python(start, indptr, indices, cache) -> frozenset:
+        """纯Python遍历，遇到已缓存闭包的节点直接合并不再展开"""
+        reached = set()
+        stack = [start]
+        while stack:
+            node = stack.pop()
+            for position in range(indptr[node], indptr[node + 1]):
+                neighbor = indices[position]
+                if neighbor in reached:
+                    continue
+                reached.add(neighbor)
+                cached = cache.get(neighbor)
+                if cached is not None:
+                    reached |= cached
+                else:
+                    stack.append(neighbor)
+        return frozenset(reached)
+
+    @staticmethod
+    def _closure_numpy(np, start, indptr, indices) -> frozenset:
+        """NumPy向量化的逐层遍历"""
+        visited = np.zeros(len(indptr) - 1, dtype=bool)
+        frontier = np.array([start], dtype=np.int64)
+        while frontier.size:
+            begins, ends = indptr[frontier], indptr[frontier + 1]
+            counts = ends - begins
+            total = int(counts.sum())
+            if not total:
+                break
+            offsets = np.repeat(begins - np.cumsum(counts) + counts, counts)
+            neighbors = indices[offsets + np.arange(total)]
+            frontier = np.unique(neighbors[~visited[neighbors]])
+            visited[frontier] = True
+        return frozenset(np.flatnonzero(visited).tolist())
+
+    def _query(self, name: str, direction: str) -> Set[str]:
+        """按节点名查询闭包"""
+        node_id = self.ids.get(name, self.ids.get(name.lower()))
+        if node_id is None:
+            return set()
+        return {self.names[node] for node in self._closure(node_id, direction)}
+
+    def downstream(self, name: str) -> Set[str]:
+        """受该表或字段影响的全部下游节点"""
+        return self._query(name, 'downstream')
+
+    def upstream(self, name: str) -> Set[str]:
+        """该表依赖的全部上游节点"""
+        return self._query(name, 'upstream')
+
+    def precompute(self, direction: str = 'downstream'):
+        """预先计算所有节点的闭包，后续查询直接命中缓存"""
+        self._cache_size = max(self._cache_size, len(self.names))
+        for node_id in range(len(self.names)):
+            self._closure(node_id, direction)
 
 # 工具函数
-def analysis_statements(sql_str: str) -> List[sqlparse.sql.Statement]:
+def iter_grouped_statements(sql, profiler: BloodlineProfiler = None, max_tokens: int = None,
+                            deadline: float = None) -> Iterator[Tuple[sqlparse.sql.Statement,
+                                                                      Union[str, None]]]:
+    """直接解析原始SQL，逐条生成语句及分组失败的原因
+
+    只做一次词法分析和分组，注释和多余空白在词法流中过滤。单条语句超过 sqlparse 的
+    分组深度或token数上限时不中断后续语句，生成未完成分组的语句和失败原因。
+
+    Args:
+        sql: SQL语句字符串或文件对象
+        profiler: 可选的性能统计，分别记录format(词法与切分)和parse(分组)耗时
+        max_tokens: token数上限，超过时在分组前抛出 StatementLimitError
+        deadline: 词法分析的截止时间(perf_counter)
+
+    Returns:
+        Iterator[tuple]: (语句, 失败原因)，分组成功时原因为None，不包含空语句
+    """
+    # 与 sqlparse 的 FilterStack 相同的流程，词法器按 get_lexer 的配置选择
+    stream = TokenStreamFilter().process(get_lexer().get_tokens(sql))
+    if max_tokens is not None or deadline is not None:
+        stream = TokenLimitFilter(max_tokens, deadline).process(stream)
+    stream = StatementSplitter().process(stream)
+
+    while True:
+        start = time.perf_counter() if profiler is not None else None
+        stmt = next(stream, None)
+        if stmt is None:
+            return
+        if profiler is not None:
+            profiler.add('format', start)
+        if stmt.is_whitespace:
+            continue
+
+        # 分组单独执行，以便与词法分析分开计时
+        phase = NULL_PHASE if profiler is None else profiler.phase(
+            'parse', profiler.begin_statement(stmt))
+        error = None
+        with phase:
+            try:
+                grouping.group(stmt)
+            except SQLParseError as err:
+                error = f'parse_error ({err})'
+            except RecursionError:
+                error = 'parse_error (Maximum recursion depth exceeded)'
+        yield stmt, error
+
+def parse_statements(sql, profiler: BloodlineProfiler = None,
+                     max_tokens: int = None, deadline: float = None):
+    """直接解析原始SQL，逐条生成语句，参数同 iter_grouped_statements
+
+    Returns:
+        Iterator[Statement]: 解析后的SQL语句，不包含空语句
+
+    Raises:
+        SQLParseError: 语句超过 sqlparse 的分组深度或token数上限
+    """
+    for stmt, error in iter_grouped_statements(sql, profiler, max_tokens, deadline):
+        if error is not None:
+            raise SQLParseError(error)
+        yield stmt
+
+def analysis_statements(sql_str: str, profiler: BloodlineProfiler = None) -> List[sqlparse.sql.Statement]:
     """解析SQL语句，排除注释
 
+    关键字按大小写无关的方式比较，因此无需先格式化再解析。
+
     Args:
         sql_str: SQL语句字符串
+        profiler: 可选的性能统计
 
     Returns:
         List[Statement]: 解析后的SQL语句列表，不包含注释
     """
-    # 1. 格式化SQL，统一大小写和缩进
-    formatted_sql = sqlparse.format(
-        sql_str,
-        strip_comments=True,  # 去除注释
-        reindent=True,       # 重新缩进
-        keyword_case='upper' # 关键字大写
-    )
+    return list(parse_statements(sql_str, profiler))
 
-    # 2. 解析SQL语句
-    statements = sqlparse.parse(formatted_sql)
-
-    # 3. 过滤掉空语句
-    return [stmt for stmt in statements if not stmt.is_whitespace]
-
-def get_sqlstr(file_path: str) -> str:
-    """从文件读取SQL语句，并进行预处理
+def get_sqlstr(file_path: str, profiler: BloodlineProfiler = None) -> str:
+    """从文件读取SQL语句
 
     Args:
         file_path: SQL文件路径
+        profiler: 可选的性能统计，读取耗时计入下一条解析的语句
 
     Returns:
-        str: 处理后的SQL语句字符串
+        str: 去除首尾空白和分号的SQL语句字符串
     """
     try:
+        start = time.perf_counter()
         with open(file_path, encoding='utf-8') as file:
-            content = file.read()
-
-            # 格式化SQL，去除注释
-            sql_str = sqlparse.format(
-                content,
-                strip_comments=True,  # 去除注释
-                reindent=True,        # 重新缩进
-                keyword_case='upper'  # 关键字大写
-            )
-
-            # 去除首尾空白和分号
-            sql_str = sql_str.strip(' \t\n;')
-
-            return textwrap.indent(sql_str, "  ")
+            sql_str = file.read().strip(' \t\n;')
+        if profiler is not None:
+            profiler.add('read', start)
+        return sql_str
 
     except Exception as e:
         print(f"读取SQL文件时发生错误: {e}")
         return ""
+
+def open_sql_file(file_path: str, encoding: str = 'utf-8') -> IO[str]:
+    """以文本方式打开SQL文件，.gz/.bz2/.xz 压缩文件自动解压
+
+    Args:
+        file_path: SQL文件路径
+        encoding: 文件编码
+
+    Returns:
+        IO[str]: 文本文件对象
+    """
+    for suffix, opener in COMPRESSED_OPENERS.items():
+        if file_path.endswith(suffix):
+            return opener(file_path, 'rt', encoding=encoding)
+    return open(file_path, encoding=encoding)
+
+def iter_sql_texts(file: IO, encoding: str = 'utf-8') -> Iterator[str]:
+    """按行读取文件，以顶层分号切分并逐条生成语句文本
+
+    字符串、美元符号引用、引号标识符、注释和括号内的分号不作为语句结束，
+    内存中只保留当前语句和当前行。语句中出现 BEGIN/DECLARE 后改由 sqlparse 的
+    切分器判断分号是否结束语句，与 sqlparse.split 对存储过程语句块的切分一致。
+
+    Args:
+        file: 文本或二进制文件对象
+        encoding: 二进制文件对象的编码
+
+    Returns:
+        Iterator[str]: 单条语句的原始文本
+    """
+    if not isinstance(file, io.TextIOBase) and 'b' in getattr(file, 'mode', ''):
+        file = io.TextIOWrapper(file, encoding=encoding)
+
+    buffer = []
+    quote = None          # 当前所在的引号字符或美元符号引用标记
+    block_comment = False
+    depth = 0             # 括号层级
+    splitter = None       # 可能位于语句块中时的 sqlparse 切分器，逐段增量输入
+    fed = 0               # buffer 中已输入切分器的片段数
+
+    for line in file:
+        start = 0
+        for match in STATEMENT_BOUNDARY.finditer(line):
+            token = match.group()
+            if block_comment:
+                block_comment = token != '*/'
+            elif quote:
+                if token == quote:
+                    quote = None
+            elif token == '--':
+                break
+            elif token == '/*':
+                block_comment = True
+            elif token in ("'", '"', '`'):
+                quote = token
+            elif token[0] == '$':
+                previous = line[match.start() - 1] if match.start() else ' '
+                if not (previous.isalnum() or previous in '_$'):
+                    quote = token
+            elif token == '(':
+                depth += 1
+            elif token == ')':
+                depth = max(0, depth - 1)
+            elif token == ';' and depth == 0:
+                buffer.append(line[start:match.end()])
+                start = match.end()
+                if splitter is None:
+                    text = ''.join(buffer)
+                    upper = text.upper()
+                    if ('BEGIN' in upper or 'DECLARE' in upper) and BLOCK_KEYWORD.search(text):
+                        splitter = StatementSplitter()
+                if splitter is not None:
+                    # 只输入上次判断之后的片段，切分器的块状态跨片段保留
+                    for _ in splitter.process(get_lexer().get_tokens(''.join(buffer[fed:]))):
+                        pass
+                    fed = len(buffer)
+                    if not splitter.consume_ws:
+                        continue
+                    text = ''.join(buffer)
+                yield text
+                buffer = []
+                splitter, fed = None, 0
+        buffer.append(line[start:])
+
+    if buffer:
+        yield ''.join(buffer)
+
+def iter_statements(source: Union[str, IO], encoding: str = 'utf-8',
+                    profiler: BloodlineProfiler = None) -> Iterator[sqlparse.sql.Statement]:
+    """从文件路径或文件对象逐条解析SQL语句
+
+    Args:
+        source: SQL文件路径(支持 .gz/.bz2/.xz)或文件对象
+        encoding: 文件编码
+        profiler: 可选的性能统计，读取和切分文本的耗时记为read
+
+    Returns:
+        Iterator[Statement]: 解析后的SQL语句，不包含空语句
+
+    Raises:
+        SQLParseError: 语句超过 sqlparse 的分组深度或token数上限
+    """
+    for stmt, error in _iter_grouped_source(source, encoding, profiler):
+        if error is not None:
+            raise SQLParseError(error)
+        yield stmt
+
+def _iter_grouped_source(source: Union[str, IO], encoding: str = 'utf-8',
+                         profiler: BloodlineProfiler = None) -> Iterator[tuple]:
+    """从文件路径或文件对象逐条生成 iter_grouped_statements 形式的 (语句, 失败原因)"""
+    if isinstance(source, str):
+        with open_sql_file(source, encoding) as file:
+            yield from _iter_grouped_source(file, encoding, profiler)
+        return
+
+    if profiler is None:
+        for sql_text in iter_sql_texts(source, encoding):
+            yield from iter_grouped_statements(sql_text)
+        return
+
+    texts = iter_sql_texts(source, encoding)
+    while True:
+        start = time.perf_counter()
+        sql_text = next(texts, None)
+        if sql_text is None:
+            return
+        profiler.add('read', start)
+        yield from iter_grouped_statements(sql_text, profiler)
+
+def stream_bloodline(source: Union[str, IO], encoding: str = 'utf-8',
+                     profiler: BloodlineProfiler = None) -> Iterator[Tuple[sqlparse.sql.Statement, BloodlineResult]]:
+    """逐条读取并立即分析SQL语句，峰值内存约为单条语句
+
+    Args:
+        source: SQL文件路径(支持 .gz/.bz2/.xz)或文件对象
+        encoding: 文件编码
+        profiler: 可选的性能统计
+
+    Returns:
+        Iterator[tuple]: (语句, 血缘结果)，超过 sqlparse 分组上限的语句结果为skipped
+    """
+    analyzer = BloodlineAnalyzer(profiler)
+    for stmt, error in _iter_grouped_source(source, encoding, profiler):
+        if error is not None:
+            yield stmt, BloodlineResult.skipped(error, stmt.get_type())
+            continue
+        analyzer.reset()
+        yield stmt, analyzer.analyze(stmt)
+
+def iter_sql_paths(paths: List[str]) -> Iterator[str]:
+    """展开文件和目录，按输入顺序生成SQL文件路径
+
+    目录会递归查找 SQL_FILE_SUFFIXES 中的文件，同一目录内按文件名排序。
+
+    Args:
+        paths: 文件、目录或通配符(如 "sql/**/*.sql")路径列表
+
+    Returns:
+        Iterator[str]: SQL文件路径
+    """
+    for path in paths:
+        if glob.has_magic(path):
+            yield from iter_sql_paths(sorted(glob.glob(path, recursive=True)))
+            continue
+        if not os.path.isdir(path):
+            yield path
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                if name.lower().endswith(SQL_FILE_SUFFIXES):
+                    yield os.path.join(root, name)
+
+def classify_statement(sql_text: str) -> Tuple[Union[str, None], Union[str, None]]:
+    """只做词法分析，按语句的首个关键字决定分析方式，不解析整条语句
+
+    跳过注释、开头的括号和WITH子句；CREATE 语句只有 "AS SELECT/WITH/(" 形式
+    (CTAS、视图)需要分析血缘，其余DDL跳过；未知语句按完整分析处理。
+
+    Args:
+        sql_text: 单条语句文本
+
+    Returns:
+        (分析方式, 首个关键字)，分析方式为 'full'、'tables' 或 'skip'，
+        文本中没有有效token时为 (None, None)
+    """
+    tokens = ((ttype, value) for ttype, value in get_lexer().get_tokens(sql_text)
+              if ttype not in Whitespace and ttype not in Comment)
+
+    # 1. 首个关键字，"CREATE OR REPLACE" 等多词关键字取第一个词
+    keyword = None
+    for ttype, value in tokens:
+        if ttype is Punctuation and value == '(':
+            continue
+        keyword = value.upper().split()[0] if ttype in Keyword or ttype in Name else 'UNKNOWN'
+        break
+    if keyword is None:
+        return None, None
+
+    # 2. WITH子句之后最外层的第一个DML关键字
+    if keyword == 'WITH':
+        depth = 0
+        for ttype, value in tokens:
+            if ttype is Punctuation:
+                depth += (value == '(') - (value == ')')
+            elif depth == 0 and ttype is Keyword.DML:
+                keyword = value.upper()
+                return STATEMENT_ROUTES.get(keyword, 'full'), keyword
+        return 'full', keyword
+
+    # 3. CREATE ... AS SELECT/WITH/(...) 才有血缘
+    if keyword == 'CREATE':
+        depth = 0
+        after_as = False
+        for ttype, value in tokens:
+            if depth == 0 and after_as and (value == '(' or value.upper() in ('SELECT', 'WITH')):
+                return 'full', keyword
+            after_as = depth == 0 and ttype in Keyword and value.upper() == 'AS'
+            if ttype is Punctuation:
+                depth += (value == '(') - (value == ')')
+        return 'skip', keyword
+
+    return STATEMENT_ROUTES.get(keyword, 'full'), keyword
+
+def analyze_sql_text(sql_text: str, cache: BloodlineCache = None,
+                     analyzer: BloodlineAnalyzer = None, columns: bool = True,
+                     limits: StatementLimits = None, fast: bool = True, lazy: bool = False,
+                     keep_trees: bool = False) -> List[BloodlineResult]:
+    """分析一段SQL文本，命中缓存时不再解析
+
+    Args:
+        sql_text: SQL语句文本
+        cache: 血缘结果缓存
+        analyzer: 复用的分析器实例
+        columns: 是否分析字段血缘，为False时只分析表血缘
+        limits: 大小和时间限制，超过限制的结果不写入缓存
+        fast: 只分析表血缘时是否先尝试词法快速路径，不支持的语法自动回退到完整解析
+        lazy: 为True时忽略columns，先只分析表血缘，字段血缘在首次访问结果的
+            column_names、function_names 或 alias_names 时再分析
+        keep_trees: 延迟分析时是否保留语法树，不保留时按需重新解析语句文本，
+            内存占用小，且表血缘可以使用词法快速路径
+
+    Returns:
+        List[BloodlineResult]: 每条语句的血缘结果
+    """
+    if lazy:
+        return _analyze_lazy(sql_text, cache, analyzer, limits, fast, keep_trees)
+
+    key = None
+    if cache is not None:
+        key = cache.make_key(sql_text, columns)
+        results = cache.get(key)
+        if results is not None:
+            return results
+
+    analyzer = analyzer or BloodlineAnalyzer()
+    results = None
+    if fast and not columns and analyzer.profiler is None and analyzer.max_depth == MAX_WALK_DEPTH:
+        results = _analyze_fast(sql_text, limits)
+    if results is None:
+        if limits is None:
+            results = []
+            for stmt, error in iter_grouped_statements(sql_text, analyzer.profiler):
+                if error is not None:
+                    # 超过 sqlparse 分组上限的语句单独跳过，不影响同一文本中的其它语句
+                    results.append(BloodlineResult.skipped(error, stmt.get_type()))
+                    continue
+                analyzer.reset()
+                results.append(analyzer.analyze(stmt) if columns else analyzer.analyze_tables(stmt))
+        else:
+            results = _analyze_limited(sql_text, analyzer, columns, limits)
+
+    if cache is not None and all(result.status == 'ok' for result in results):
+        cache.put(key, results)
+    return results
+
+def _analyze_lazy(sql_text: str, cache: BloodlineCache, analyzer: BloodlineAnalyzer,
+                  limits: StatementLimits, fast: bool, keep_trees: bool) -> List[BloodlineResult]:
+    """只分析表血缘并登记字段血缘的分析来源，参数同 analyze_sql_text
+
+    已缓存的完整结果直接返回；延迟结果的字段血缘全部分析完后写入缓存，见 StatementTexts。
+    """
+    # 1. 已有完整结果的缓存
+    key = None
+    if cache is not None:
+        key = cache.make_key(sql_text, True)
+        results = cache.get(key)
+        if results is not None:
+            return results
+
+    # 2. 保留语法树: 字段血缘从同一棵语法树分析
+    analyzer = analyzer or BloodlineAnalyzer()
+    if keep_trees and limits is None:
+        texts = StatementTexts(sql_text, cache=cache, key=key)
+        results = []
+        for stmt, error in iter_grouped_statements(sql_text, analyzer.profiler):
+            if error is not None:
+                results.append(BloodlineResult.skipped(error, stmt.get_type()))
+                continue
+            analyzer.reset()
+            result = analyzer.analyze_tables(stmt)
+            result.defer_columns(stmt, texts)
+            results.append(result)
+        texts.track(results)
+        return results
+
+    # 3. 不保留语法树: 表血缘可走快速路径，字段血缘按需只重新解析所在的语句
+    results = analyze_sql_text(sql_text, None, analyzer, False, limits, fast)
+    texts = StatementTexts(sql_text, len(results), cache, key)
+    for index, result in enumerate(results):
+        if result.status == 'ok':
+            result.defer_columns(sql_text=texts, index=index)
+    texts.track(results)
+    return results
+
+def _analyze_fast(sql_text: str, limits: StatementLimits = None) -> Union[List[BloodlineResult], None]:
+    """用词法快速路径分析表血缘，不支持的语法或超过大小限制时返回None，由完整解析处理"""
+    if limits is None:
+        return FastTableAnalyzer().analyze(sql_text)
+    if limits.check_size(sql_text) is not None:
+        return None
+    return FastTableAnalyzer(limits.max_tokens).analyze(sql_text)
+
+def _analyze_limited(sql_text: str, analyzer: BloodlineAnalyzer, columns: bool,
+                     limits: StatementLimits) -> List[BloodlineResult]:
+    """在大小和时间限制内分析SQL文本，参数同 analyze_sql_text"""
+    # 1. 超过字节数的文本不做分组解析
+    reason = limits.check_size(sql_text)
+    if reason is not None:
+        return _analyze_oversized(sql_text, limits, reason)
+
+    results = []
+    timed_out = None  # 分析阶段超时的 (语句, 原因)
+    try:
+        with limits.budget() as deadline:
+            analyzer.deadline = deadline
+            for stmt, error in iter_grouped_statements(sql_text, analyzer.profiler,
+                                                       limits.max_tokens, deadline):
+                if error is not None:
+                    results.append(BloodlineResult.skipped(error, stmt.get_type()))
+                    continue
+                analyzer.reset()
+                try:
+                    results.append(analyzer.analyze(stmt) if columns else analyzer.analyze_tables(stmt))
+                except StatementLimitError as e:
+                    # 预算已用完，同一文本中剩余的语句不再分析
+                    timed_out = (stmt, e.reason)
+                    break
+    except StatementLimitError as e:
+        # 2. 词法分析或分组阶段超过限制，token数超限且尚无结果时与超过字节数相同处理
+        if timed_out is None:
+            if e.reason != 'timeout' and not results:
+                return _analyze_oversized(sql_text, limits, e.reason)
+            results.append(BloodlineResult.skipped(e.reason))
+    finally:
+        analyzer.deadline = None
+
+    # 3. 已解析但分析超时: 按配置退化为只分析表血缘，仍然超时或配置为跳过时跳过
+    if timed_out is not None:
+        stmt, reason = timed_out
+        result = None
+        if limits.fallback == 'tables' and columns:
+            result = _analyze_tables_limited(stmt, analyzer, limits)
+        if result is None:
+            result = BloodlineResult.skipped(reason, stmt.get_type())
+        else:
+            result.status, result.reason = 'tables_only', reason
+        results.append(result)
+    return results
+
+def _analyze_tables_limited(stmt: sqlparse.sql.Statement, analyzer: BloodlineAnalyzer,
+                            limits: StatementLimits) -> Union[BloodlineResult, None]:
+    """在新的时间预算内只分析一条已解析语句的表血缘，仍然超时时返回None
+
+    先用词法快速路径分析语句文本，不支持的语法再遍历语法树，遍历同样受 timeout 限制。
+    """
+    if analyzer.profiler is None and analyzer.max_depth == MAX_WALK_DEPTH:
+        results = FastTableAnalyzer().analyze(str(stmt))
+        if results:
+            return results[0]
+
+    analyzer.reset()
+    try:
+        with limits.budget() as deadline:
+            analyzer.deadline = deadline
+            return analyzer.analyze_tables(stmt)
+    except StatementLimitError:
+        return None
+    finally:
+        analyzer.deadline = None
+
+def _analyze_oversized(sql_text: str, limits: StatementLimits,
+                       reason: str) -> List[BloodlineResult]:
+    """超过大小限制的文本不做分组解析，fallback为 'tables' 时用词法快速路径只分析表血缘
+
+    快速路径本身最多处理 FAST_PATH_MAX_TOKENS 个token，不受 max_tokens 限制；
+    不支持的语法或多条语句仍然跳过。
+    """
+    if limits.fallback == 'tables':
+        results = FastTableAnalyzer().analyze(sql_text)
+        if results:
+            for result in results:
+                result.status, result.reason = 'tables_only', reason
+            return results
+    return [BloodlineResult.skipped(reason)]
+
+def iter_text_results(file: IO, columns: bool = True, cache: BloodlineCache = None,
+                      limits: StatementLimits = None, route: bool = False, lazy: bool = False,
+                      keep_trees: bool = False) -> Iterator[Tuple[str, BloodlineResult]]:
+    """逐段读取文件对象中的语句文本并分析，各种批量接口共用的单文件流程
+
+    单段文本分析失败时生成status为error的结果，不影响后续语句。
+
+    Args:
+        file: 文本或二进制文件对象
+        columns: 是否分析字段血缘
+        cache: 血缘结果缓存
+        limits: 单条语句的大小和时间限制
+        route: 是否按语句类型分流(见 classify_statement)，跳过的语句status为skipped、
+            只分析表血缘的语句status为tables_only，reason均为 'route'
+        lazy: 字段血缘是否在首次访问时才分析，见 analyze_sql_text
+        keep_trees: 延迟分析时是否保留语法树
+
+    Returns:
+        Iterator[tuple]: (语句文本, 血缘结果)，一段文本含多条语句时文本重复出现
+    """
+    analyzer = BloodlineAnalyzer()
+    for sql_text in iter_sql_texts(file):
+        statement_columns = columns
+        if route:
+            kind, keyword = classify_statement(sql_text)
+            if kind is None:
+                continue
+            if kind == 'skip':
+                yield sql_text, BloodlineResult.skipped('route', keyword)
+                continue
+            statement_columns = columns and kind == 'full'
+
+        try:
+            results = analyze_sql_text(sql_text, cache, analyzer, statement_columns, limits,
+                                       lazy=lazy and statement_columns, keep_trees=keep_trees)
+        except Exception as e:
+            if sql_text.strip(' \t\r\n;'):
+                yield sql_text, BloodlineResult.failed(f'{type(e).__name__}: {e}')
+            continue
+
+        for result in results:
+            if columns and not statement_columns and result.status == 'ok':
+                # 缓存中的结果对象可能被共享，复制后再修改状态
+                result = BloodlineResult.from_tuple(result.to_tuple())
+                result.status, result.reason = 'tables_only', 'route'
+            yield sql_text, result
+
+def iter_file_results(file_path: str, columns: bool = True, cache_dir: str = None,
+                      limits: StatementLimits = None, route: bool = False, lazy: bool = False,
+                      keep_trees: bool = False) -> Iterator[Tuple[str, BloodlineResult]]:
+    """逐条分析单个文件，参数同 iter_text_results
+
+    文件无法读取时生成一条语句文本为None、status为error的结果。
+    """
+    cache = get_cache(cache_dir) if cache_dir is not None else None
+    try:
+        with open_sql_file(file_path) as file:
+            yield from iter_text_results(file, columns, cache, limits, route, lazy, keep_trees)
+    except (OSError, UnicodeDecodeError, EOFError, lzma.LZMAError) as e:
+        yield None, BloodlineResult.failed(f'{type(e).__name__}: {e}')
+
+def analyze_file(file_path: str, cache_dir: str = None, limits: StatementLimits = None,
+                 lazy: bool = False, keep_trees: bool = False) -> List[BloodlineResult]:
+    """分析单个SQL文件中的所有语句
+
+    Args:
+        file_path: SQL文件路径
+        cache_dir: 持久化缓存目录，为None时不使用缓存
+        limits: 单条语句的大小和时间限制
+        lazy: 字段血缘是否在首次访问时才分析，见 analyze_sql_text
+        keep_trees: 延迟分析时是否保留语法树
+
+    Returns:
+        List[BloodlineResult]: 每条语句的血缘结果，文件无法读取或语句分析失败时
+            对应位置为status为error的结果
+    """
+    return [result for _, result in iter_file_results(
+        file_path, True, cache_dir, limits, lazy=lazy, keep_trees=keep_trees)]
+
+def _map_files(worker, files: list, jobs: int = None) -> Iterator:
+    """按输入顺序对每个文件(或任务)调用worker，多个任务时使用进程池
+
+    每个进程约分到4块，兼顾负载均衡和通信开销；工作进程沿用当前的词法器配置。
+
+    Args:
+        worker: 可序列化的单任务函数
+        files: 任务列表
+        jobs: 工作进程数，默认为CPU核数，为1时在当前进程中执行
+
+    Returns:
+        Iterator: 每个任务的返回值
+    """
+    jobs = jobs or os.cpu_count() or 1
+    if jobs == 1 or len(files) <= 1:
+        yield from map(worker, files)
+        return
+
+    # 进程池只在批量分析时导入，缩短单次调用的启动时间
+    from concurrent.futures import ProcessPoolExecutor
+
+    chunksize = max(1, len(files) // (jobs * 4))
+    with ProcessPoolExecutor(max_workers=min(jobs, len(files)), initializer=set_lexer_profile,
+                             initargs=(get_lexer_profile(),)) as executor:
+        yield from executor.map(worker, files, chunksize=chunksize)
+
+def analyze_paths(paths: List[str], jobs: int = None, cache_dir: str = None,
+                  limits: StatementLimits = None, lazy: bool = False,
+                  keep_trees: bool = False) -> List[tuple]:
+    """使用进程池批量分析多个SQL文件
+
+    每个文件作为一个任务，按块分发给工作进程以减少进程间通信次数，
+    结果顺序与输入顺序一致。单个文件无法读取或解析失败时只影响该文件的结果。
+
+    Args:
+        paths: 文件或目录路径列表
+        jobs: 工作进程数，默认为CPU核数，为1时在当前进程中执行
+        cache_dir: 持久化缓存目录，为None时不使用缓存
+        limits: 单条语句的大小和时间限制，在工作进程中执行
+        lazy: 工作进程只分析表血缘，字段血缘在首次访问时才分析，见 analyze_sql_text。
+            结果跨进程传回时不带语法树，只带语句自己的文本
+        keep_trees: 单进程延迟分析时是否保留语法树
+
+    Returns:
+        List[tuple]: 每个文件的 (文件路径, [血缘结果, ...])
+    """
+    files = list(iter_sql_paths(paths))
+    worker = functools.partial(analyze_file, cache_dir=cache_dir, limits=limits, lazy=lazy,
+                               keep_trees=keep_trees)
+    return list(zip(files, _map_files(worker, files, jobs)))
+
+def _result_record(file_name: str, index: Union[int, None], sql_text: Union[str, None],
+                   result: BloodlineResult, columns: bool) -> dict:
+    """把血缘结果转为可JSON编码的记录，失败的结果转为带error字段的记录"""
+    record = {'file': file_name, 'index': index}
+    if result.status == 'error':
+        record['error'] = result.reason
+        if sql_text is not None:
+            record['sql'] = sql_text.strip()[:200]
+        return record
+    record.update(result.to_dict())
+    if not columns:
+        del record['column_names'], record['function_names']
+    return record
+
+def _iter_records(results: Iterator[tuple], file_name: str, columns: bool) -> Iterator[dict]:
+    """为 (语句文本, 血缘结果) 编号并转为记录，文件级错误的序号为None"""
+    index = 0
+    for sql_text, result in results:
+        if sql_text is None:
+            yield _result_record(file_name, None, None, result, columns)
+            continue
+        yield _result_record(file_name, index, sql_text, result, columns)
+        index += 1
+
+def iter_bloodline_records(file: IO, file_name: str, columns: bool = True,
+                           cache: BloodlineCache = None, limits: StatementLimits = None,
+                           route: bool = False) -> Iterator[dict]:
+    """逐条分析文件对象中的语句，生成可JSON编码的记录
+
+    单条语句分析失败时生成带error字段的记录，不影响后续语句。
+
+    Args:
+        file: 文本或二进制文件对象
+        file_name: 记录中的文件名
+        columns: 是否分析字段血缘
+        cache: 血缘结果缓存
+        limits: 单条语句的大小和时间限制
+        route: 是否按语句类型分流，见 iter_text_results
+
+    Returns:
+        Iterator[dict]: 包含 file、index 以及血缘结果或 error 的记录
+    """
+    results = iter_text_results(file, columns, cache, limits, route)
+    yield from _iter_records(results, file_name, columns)
+
+def iter_file_records(file_path: str, columns: bool = True, cache_dir: str = None,
+                      limits: StatementLimits = None, route: bool = False) -> Iterator[dict]:
+    """逐条分析单个文件，生成 iter_bloodline_records 形式的记录，文件无法读取时生成一条错误记录"""
+    results = iter_file_results(file_path, columns, cache_dir, limits, route)
+    yield from _iter_records(results, file_path, columns)
+
+def analyze_file_records(file_path: str, columns: bool = True, cache_dir: str = None,
+                         limits: StatementLimits = None, route: bool = False) -> List[dict]:
+    """分析单个文件，返回全部记录，供进程池调用"""
+    return list(iter_file_records(file_path, columns, cache_dir, limits, route))
+
+def iter_path_records(paths: List[str], jobs: int = None, columns: bool = True,
+                      cache_dir: str = None, limits: StatementLimits = None,
+                      route: bool = False) -> Iterator[dict]:
+    """批量分析文件，按输入顺序逐个文件生成记录
+
+    多进程时每个文件分析完即可输出，内存中只保留尚未输出的文件结果。
+
+    Args:
+        paths: 文件、目录或通配符路径列表
+        jobs: 工作进程数，默认为CPU核数，为1时在当前进程中逐条分析
+        columns: 是否分析字段血缘
+        cache_dir: 持久化缓存目录，为None时不使用缓存
+        limits: 单条语句的大小和时间限制，在工作进程中执行
+        route: 是否按语句类型分流
+
+    Returns:
+        Iterator[dict]: 每条语句一条记录
+    """
+    files = list(iter_sql_paths(paths))
+    if (jobs or os.cpu_count() or 1) == 1 or len(files) <= 1:
+        # 单进程时逐条输出，不等整个文件分析完
+        for path in files:
+            yield from iter_file_records(path, columns, cache_dir, limits, route)
+        return
+
+    worker = functools.partial(analyze_file_records, columns=columns, cache_dir=cache_dir,
+                               limits=limits, route=route)
+    for records in _map_files(worker, files, jobs):
+        yield from records
+
+def parse_log_timestamp(value) -> Union[datetime, None]:
+    """把查询日志中的执行时间统一为UTC时间，使不同格式的时间可以比较
+
+    数值为Unix时间戳(秒，超过 EPOCH_MILLIS_THRESHOLD 时为毫秒)，字符串为
+    ISO 8601 格式，不带时区的时间按UTC处理。
+
+    Args:
+        value: 日志中的执行时间，None表示没有时间
+
+    Returns:
+        datetime: 带UTC时区的时间，value为None时返回None
+
+    Raises:
+        ValueError: 无法识别的时间格式
+    """
+    if value is None:
+        return None
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        if abs(value) > EPOCH_MILLIS_THRESHOLD:
+            value = value / 1000
+        try:
+            return datetime.fromtimestamp(value, timezone.utc)
+        except (OverflowError, OSError) as e:
+            raise ValueError(f'时间戳超出范围: {value!r}') from e
+    if isinstance(value, str):
+        timestamp = datetime.fromisoformat(value.strip())
+        if timestamp.tzinfo is None:
+            return timestamp.replace(tzinfo=timezone.utc)
+        return timestamp.astimezone(timezone.utc)
+    raise ValueError(f'无法识别的时间格式: {value!r}')
+
+def fingerprint_sql(sql_text: str) -> str:
+    """在词法层计算语句指纹，只有字面量不同的语句指纹相同
+
+    字符串、数字和绑定参数替换为 "?"，只含字面量的 IN 列表折叠为 "IN (?)"，
+    丢弃注释、空白和末尾的分号，token之间统一以单个空格连接。
+    引号标识符和关键字大小写保持不变，因为它们会出现在血缘结果中。
+
+    Args:
+        sql_text: 语句文本
+
+    Returns:
+        str: 规范化文本的SHA-256十六进制摘要
+    """
+    parts = []
+    list_start = None  # IN 之后左括号在parts中的位置，列表中出现非字面量时为None
+    after_in = False
+    for ttype, value in get_lexer().get_tokens(sql_text):
+        if ttype in Whitespace or ttype in Newline or ttype in Comment:
+            continue
+        literal = ttype in String.Single or ttype in Number or ttype in Name.Placeholder
+        if literal:
+            value = '?'
+        elif ttype in Keyword:
+            value = ' '.join(value.split())  # "GROUP  BY" 等多词关键字
+        if list_start is not None:
+            if value == ')':
+                parts[list_start:] = ['(', '?', ')']
+                list_start = None
+                after_in = False
+                continue
+            if not literal and value not in (',', '-', '+'):
+                list_start = None
+        elif after_in and value == '(':
+            list_start = len(parts)
+        after_in = ttype in Keyword and value.upper() == 'IN'
+        parts.append(value)
+
+    while parts and parts[-1] == ';':
+        parts.pop()
+    return hashlib.sha256(' '.join(parts).encode('utf-8')).hexdigest()
+
+class QueryLogEntry:
+    """查询日志中同一指纹的汇总"""
+    __slots__ = ('fingerprint', 'sql_text', 'source', 'count', 'first_seen', 'last_seen')
+
+    def __init__(self, fingerprint: str, sql_text: str, source: str):
+        self.fingerprint = fingerprint
+        self.sql_text = sql_text  # 首次出现的语句，作为该指纹的分析对象
+        self.source = source      # 首次出现的位置 "文件:行号"
+        self.count = 0
+        self.first_seen = None
+        self.last_seen = None
+
+    def add(self, timestamp: datetime = None):
+        """记录一次出现，时间为 parse_log_timestamp 统一后的UTC时间"""
+        self.count += 1
+        if timestamp is None:
+            return
+        if self.first_seen is None or timestamp < self.first_seen:
+            self.first_seen = timestamp
+        if self.last_seen is None or timestamp > self.last_seen:
+            self.last_seen = timestamp
+
+    def to_dict(self) -> dict:
+        return {
+            'fingerprint': self.fingerprint,
+            'count': self.count,
+            'first_seen': self.first_seen and self.first_seen.isoformat(),
+            'last_seen': self.last_seen and self.last_seen.isoformat(),
+        }
+
+class QueryLog:
+    """查询日志(JSONL)的指纹去重汇总
+
+    每行一个JSON对象，语句文本和执行时间分别取自 sql_field 和 time_field 字段。
+    语句按 fingerprint_sql 的指纹去重，每个指纹只分析首次出现的语句一次，
+    血缘结果附带出现次数和首次/最后出现时间。字面量出现在血缘结果中时
+    (如 SELECT 1 AS x)，结果取自首次出现的语句。
+    """
+    def __init__(self, sql_field: str = QUERY_LOG_SQL_FIELD,
+                 time_field: str = QUERY_LOG_TIME_FIELD):
+        self.sql_field = sql_field
+        self.time_field = time_field
+        self.rows = 0
+        self.errors = []     # 无法读取的行 (位置, 错误)
+        self._entries = {}   # 指纹 -> QueryLogEntry，按首次出现顺序
+
+    def __len__(self):
+        return len(self._entries)
+
+    def entries(self) -> List[QueryLogEntry]:
+        """按首次出现顺序返回各指纹的汇总"""
+        return list(self._entries.values())
+
+    def add(self, sql_text: str, timestamp=None, source: str = None,
+            fingerprint: str = None) -> QueryLogEntry:
+        """记录一条日志语句
+
+        Args:
+            sql_text: 语句文本
+            timestamp: 执行时间，格式见 parse_log_timestamp
+            source: 日志中的位置
+            fingerprint: 已计算的语句指纹，默认由 fingerprint_sql 计算
+
+        Returns:
+            QueryLogEntry: 语句所属指纹的汇总
+
+        Raises:
+            ValueError: 无法识别的时间格式，此时不记录该语句
+        """
+        timestamp = parse_log_timestamp(timestamp)
+        self.rows += 1
+        if fingerprint is None:
+            fingerprint = fingerprint_sql(sql_text)
+        entry = self._entries.get(fingerprint)
+        if entry is None:
+            entry = self._entries[fingerprint] = QueryLogEntry(fingerprint, sql_text, source)
+        entry.add(timestamp)
+        return entry
+
+    def ingest(self, file: IO, file_name: str):
+        """读取JSONL查询日志，无法解析、缺少语句字段或时间格式无法识别的行记入errors
+
+        完全相同的语句文本在本次读取中复用指纹，最多缓存 FINGERPRINT_CACHE_SIZE 条，
+        读取结束后释放。
+
+        Args:
+            file: 文本或二进制文件对象
+            file_name: 位置中的文件名
+        """
+        fingerprints = {}  # 语句文本 -> 指纹
+        for line_no, line in enumerate(file, 1):
+            if isinstance(line, bytes):
+                line = line.decode('utf-8')
+            if not line.strip():
+                continue
+            source = f'{file_name}:{line_no}'
+            try:
+                row = json.loads(line)
+                sql_text = row[self.sql_field]
+            except (ValueError, KeyError, TypeError) as e:
+                self.errors.append((source, f'{type(e).__name__}: {e}'))
+                continue
+            if not isinstance(sql_text, str):
+                self.errors.append((source, f'TypeError: {self.sql_field} 不是字符串'))
+                continue
+            fingerprint = fingerprints.get(sql_text)
+            if fingerprint is None:
+                if len(fingerprints) >= FINGERPRINT_CACHE_SIZE:
+                    fingerprints.clear()
+                fingerprint = fingerprints[sql_text] = fingerprint_sql(sql_text)
+            try:
+                self.add(sql_text, row.get(self.time_field), source, fingerprint)
+            except ValueError as e:
+                self.errors.append((source, f'ValueError: {e}'))
+
+    def ingest_paths(self, paths: List[str]):
+        """读取多个日志文件，.gz/.bz2/.xz 压缩文件自动解压，"-" 为标准输入"""
+        for path in paths:
+            if path == '-':
+                self.ingest(sys.stdin, '<stdin>')
+                continue
+            try:
+                with open_sql_file(path) as file:
+                    self.ingest(file, path)
+            except (OSError, UnicodeDecodeError, EOFError, lzma.LZMAError) as e:
+                self.errors.append((path, f'{type(e).__name__}: {e}'))
+
+    def iter_records(self, jobs: int = None, columns: bool = True, cache_dir: str = None,
+                     limits: StatementLimits = None, route: bool = False) -> Iterator[dict]:
+        """分析每个指纹的语句，生成附带出现次数的记录
+
+        先生成无法读取的行的错误记录，再按指纹首次出现的顺序生成血缘记录。
+
+        Args:
+            jobs: 工作进程数，默认为CPU核数，为1时在当前进程中分析
+            columns: 是否分析字段血缘
+            cache_dir: 持久化缓存目录，为None时不使用缓存
+            limits: 单条语句的大小和时间限制
+            route: 是否按语句类型分流
+
+        Returns:
+            Iterator[dict]: iter_bloodline_records 形式的记录，file 为首次出现的位置，
+                另含 fingerprint、count、first_seen 和 last_seen
+        """
+        for source, error in self.errors:
+            yield {'file': source, 'index': None, 'error': error}
+
+        entries = self.entries()
+        items = [(entry.source, entry.sql_text) for entry in entries]
+        worker = functools.partial(analyze_query_records, columns=columns, cache_dir=cache_dir,
+                                   limits=limits, route=route)
+        yield from self._fan_out(entries, _map_files(worker, items, jobs))
+
+    @staticmethod
+    def _fan_out(entries: List[QueryLogEntry], results) -> Iterator[dict]:
+        """为每个指纹的记录附加出现次数和时间"""
+        for entry, records in zip(entries, results):
+            summary = entry.to_dict()
+            for record in records:
+                record.update(summary)
+                yield record
+
+def analyze_query_records(item: Tuple[str, str], columns: bool = True, cache_dir: str = None,
+                          limits: StatementLimits = None, route: bool = False) -> List[dict]:
+    """分析一条日志语句，返回全部记录，供进程池调用
+
+    Args:
+        item: (位置, 语句文本)
+    """
+    source, sql_text = item
+    cache = get_cache(cache_dir) if cache_dir is not None else None
+    return list(iter_bloodline_records(io.StringIO(sql_text), source, columns, cache,
+                                       limits, route))
@@ -0,0 +1,393 @@
+"""
+SQL血缘分析性能基准
+生成可调规模的合成SQL语料，分别统计解析、表血缘、字段血缘和可视化各阶段的
+耗时、吞吐量(语句/秒)和峰值内存，用于发现性能回退和超线性增长的拐点。
+
+用法:
+    python benchmark.py --statements 200 --joins 4 --width 20
+    python benchmark.py --sweep joins=1,2,4,8,16 --memory
+    python benchmark.py --import-time 10
+    python benchmark.py --conformance 20 example_complex_sql.sql
+    python benchmark.py --lexer-profiles --statements 500
+"""
+
+import argparse
+import io
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from MainDef import (LEXER_PROFILES, BloodlineAnalyzer, BloodlineReport, BloodlineVisualizer,
+                     FastTableAnalyzer, analysis_statements, get_lexer, get_lexer_profile,
+                     iter_sql_texts, open_sql_file, parse_statements, set_lexer_profile)
+
+
+# 语料规模参数及默认值
+CORPUS_DEFAULTS = {
+    'statements': 100,  # 语句数
+    'joins': 3,         # 每条语句JOIN的表数
+    'width': 10,        # SELECT列表宽度
+    'ctes': 1,          # WITH子句数量
+    'depth': 1,         # 子查询嵌套深度
+}
+PHASES = ('parse', 'table', 'fast', 'column', 'fused', 'tree', 'sankey', 'report')
+
+
+def generate_statement(index: int, joins: int = 3, width: int = 10, ctes: int = 1,
+                       depth: int = 1, rng: random.Random = None) -> str:
+    """生成一条 WITH ... INSERT INTO ... SELECT 形式的合成语句
+
+    Args:
+        index: 语句序号，用于生成目标表名
+        joins: JOIN的表数
+        width: SELECT列表宽度
+        ctes: WITH子句数量
+        depth: FROM中子查询的嵌套深度
+        rng: 随机数生成器
+
+    Returns:
+        str: SQL语句文本
+    """
+    rng = rng or random.Random(index)
+    aliases = [f't{i}' for i in range(joins + 1)]
+
+    # 1. WITH子句
+    with_parts = []
+    for i in range(ctes):
+        with_parts.append(
+            f"cte_{i} AS (SELECT b.id, b.col_{i}, SUM(b.amount) AS total_{i} "
+            f"FROM ods.base_{rng.randrange(1000)} b WHERE b.dt = '2024-01-01' "
+            f"GROUP BY b.id, b.col_{i})"
+        )
+
+    # 2. 嵌套子查询
+    inner = f"SELECT s.id, s.amount, s.col_0 FROM ods.fact_{rng.randrange(1000)} s"
+    for level in range(1, depth):
+        inner = f"SELECT q{level}.id, q{level}.amount, q{level}.col_0 FROM ({inner}) q{level}"
+    source = f"({inner}) {aliases[0]}"
+
+    # 3. JOIN
+    join_parts = [source]
+    for i in range(1, joins + 1):
+        table = f"cte_{i % ctes}" if ctes and i % 4 == 0 else f"dim.dim_{rng.randrange(1000)}"
+        join_parts.append(f"LEFT JOIN {table} {aliases[i]} ON {aliases[0]}.id = {aliases[i]}.id")
+
+    # 4. SELECT列表，混合普通列、函数和CASE表达式
+    columns = []
+    for i in range(width):
+        alias = aliases[i % len(aliases)]
+        if i % 5 == 3:
+            columns.append(f"COALESCE({alias}.col_{i}, 0) AS c_{i}")
+        elif i % 5 == 4:
+            columns.append(f"CASE WHEN {alias}.col_{i} > {i} THEN {alias}.col_{i} ELSE 0 END AS c_{i}")
+        else:
+            columns.append(f"{alias}.col_{i}")
+
+    prefix = f"WITH {', '.join(with_parts)} " if with_parts else ''
+    return (f"{prefix}INSERT INTO dw.target_{index} SELECT {', '.join(columns)} "
+            f"FROM {' '.join(join_parts)} WHERE {aliases[0]}.amount > 0;")
+
+
+def generate_corpus(statements: int = 100, seed: int = 0, **kwargs) -> str:
+    """生成多条合成语句组成的SQL脚本，kwargs 同 generate_statement"""
+    rng = random.Random(seed)
+    return '\n'.join(generate_statement(i, rng=rng, **kwargs) for i in range(statements))
+
+
+def _measure(func: Callable, memory: bool) -> Dict[str, float]:
+    """执行一次并记录耗时，可选记录峰值内存"""
+    if memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    peak = 0.0
+    if memory:
+        peak = tracemalloc.get_traced_memory()[1] / 1e6
+        tracemalloc.stop()
+    return {'seconds': elapsed, 'peak_mb': peak}
+
+
+def run_benchmark(sql_str: str, memory: bool = False, phases=PHASES) -> Dict[str, Dict[str, float]]:
+    """分阶段运行基准
+
+    Args:
+        sql_str: SQL脚本
+        memory: 是否记录峰值内存(开启后耗时会明显增加)
+        phases: 需要运行的阶段
+
+    Returns:
+        Dict: 阶段名 -> {'seconds', 'peak_mb', 'per_second'}
+    """
+    statements = analysis_statements(sql_str)
+    texts = list(iter_sql_texts(io.StringIO(sql_str)))
+    analyzer = BloodlineAnalyzer()
+    states = []
+
+    def parse():
+        analysis_statements(sql_str)
+
+    def table():
+        for stmt in statements:
+            analyzer.reset()
+            analyzer.analyze_table_bloodline(stmt)
+
+    def fast():
+        # 词法快速路径，从文本开始计时，对应 parse + table 两个阶段
+        fast_analyzer = FastTableAnalyzer()
+        for text in texts:
+            fast_analyzer.analyze(text)
+
+    def column():
+        for stmt in statements:
+            analyzer.reset()
+            analyzer.analyze_table_bloodline(stmt)
+            analyzer.analyze_column_bloodline(stmt)
+
+    def fused():
+        states.clear()
+        for stmt in statements:
+            analyzer.reset()
+            states.append(analyzer.analyze(stmt))
+
+    def tree():
+        for result in states:
+            if result.table_names:
+                BloodlineVisualizer.create_table_tree(list(result.table_names),
+                                                      result.statement_type)
+
+    def sankey():
+        for result in states:
+            if any(result.column_names):
+                BloodlineVisualizer.create_column_sankey(
+                    list(result.table_names), [list(c) for c in result.column_names])
+
+    def report():
+        # 所有语句写入同一个HTML报告
+        batch = BloodlineReport()
+        for result in states:
+            batch.add(result)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            batch.render(os.path.join(tmp_dir, 'report.html'))
+
+    steps = {'parse': parse, 'table': table, 'fast': fast, 'column': column,
+             'fused': fused, 'tree': tree, 'sankey': sankey, 'report': report}
+    if {'tree', 'sankey', 'report'} & set(phases) and 'fused' not in phases:
+        fused()
+
+    report = {}
+    for phase in phases:
+        stats = _measure(steps[phase], memory)
+        stats['per_second'] = len(statements) / stats['seconds'] if stats['seconds'] else 0.0
+        report[phase] = stats
+    return report
+
+
+def check_fast_tables(sql_texts: Iterable[str]) -> Tuple[int, int, List[tuple]]:
+    """比较词法快速路径与完整解析的表血缘结果
+
+    Args:
+        sql_texts: 单条语句文本
+
+    Returns:
+        (语句数, 快速路径不支持而回退的语句数, 结果不一致的 (文本, 快速路径结果, 完整解析结果))
+    """
+    fast_analyzer = FastTableAnalyzer()
+    analyzer = BloodlineAnalyzer()
+    total = fallbacks = 0
+    mismatches = []
+    for text in sql_texts:
+        total += 1
+        results = fast_analyzer.analyze(text)
+        if results is None:
+            fallbacks += 1
+            continue
+        expected = []
+        for stmt in parse_statements(text):
+            analyzer.reset()
+            expected.append(analyzer.analyze_tables(stmt).to_tuple())
+        actual = [result.to_tuple() for result in results]
+        if actual != expected:
+            mismatches.append((text, actual, expected))
+    return total, fallbacks, mismatches
+
+
+def iter_conformance_texts(runs: int, paths: List[str] = ()) -> Iterable[str]:
+    """一致性检查语料: 不同规模参数的合成语句，以及指定SQL文件中的语句"""
+    for seed in range(runs):
+        rng = random.Random(seed)
+        params = {'joins': rng.randrange(6), 'width': rng.randrange(1, 20),
+                  'ctes': rng.randrange(3), 'depth': rng.randrange(1, 5)}
+        yield from iter_sql_texts(io.StringIO(generate_corpus(20, seed=seed, **params)))
+    for path in paths:
+        with open_sql_file(path) as file:
+            yield from iter_sql_texts(file)
+
+
+def compare_lexer_profiles(sql_str: str, runs: int = 3) -> Dict[str, Dict[str, float]]:
+    """分别使用各词法器配置做词法分析和完整血缘分析，并检查结果是否与默认配置相同
+
+    Args:
+        sql_str: SQL脚本
+        runs: 每项运行的次数，取最短耗时
+
+    Returns:
+        Dict: 配置名 -> {'lex', 'analyze'(秒), 'same'(血缘结果是否与默认配置相同)}
+    """
+    def analyze():
+        analyzer = BloodlineAnalyzer()
+        results = []
+        for stmt in parse_statements(sql_str):
+            analyzer.reset()
+            results.append(analyzer.analyze(stmt).to_tuple())
+        return results
+
+    previous = get_lexer_profile()
+    report = {}
+    expected = None
+    try:
+        for profile in LEXER_PROFILES:
+            set_lexer_profile(profile)
+            lexer = get_lexer()
+            lex = min(_measure(lambda: list(lexer.get_tokens(sql_str)), False)['seconds']
+                      for _ in range(runs))
+            seconds = []
+            for _ in range(runs):
+                start = time.perf_counter()
+                results = analyze()
+                seconds.append(time.perf_counter() - start)
+            if expected is None:
+                expected = results
+            report[profile] = {'lex': lex, 'analyze': min(seconds), 'same': results == expected}
+    finally:
+        set_lexer_profile(previous)
+    return report
+
+
+# 在新进程中测量导入耗时，分别为只导入分析核心和导入后再加载可视化、影响分析依赖
+IMPORT_SCRIPTS = {
+    'core': 'import MainDef',
+    'core+pyecharts': 'import MainDef; MainDef.load_pyecharts()',
+    'core+numpy': 'import MainDef; MainDef.load_numpy()',
+}
+# 只导入分析核心时不应加载的可选依赖
+DEFERRED_MODULES = ('numpy', 'pyecharts')
+
+
+def measure_import_time(runs: int = 10) -> Dict[str, float]:
+    """在新的解释器中多次导入 MainDef，返回各场景耗时的中位数(秒)
+
+    Args:
+        runs: 每个场景运行的次数
+
+    Returns:
+        Dict: 场景名 -> 导入耗时中位数
+    """
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    report = {}
+    for name, script in IMPORT_SCRIPTS.items():
+        code = ('import time; start = time.perf_counter(); '
+                f'{script}; print(time.perf_counter() - start)')
+        samples = []
+        for _ in range(runs):
+            output = subprocess.run([sys.executable, '-c', code], cwd=cwd, check=True,
+                                    capture_output=True, text=True).stdout
+            samples.append(float(output))
+        report[name] = statistics.median(samples)
+    return report
+
+
+def check_deferred_imports() -> List[str]:
+    """在新的解释器中只导入 MainDef，返回被提前加载的 DEFERRED_MODULES"""
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    code = ('import sys, MainDef; '
+            f'print(" ".join(name for name in {DEFERRED_MODULES!r} if name in sys.modules))')
+    output = subprocess.run([sys.executable, '-c', code], cwd=cwd, check=True,
+                            capture_output=True, text=True).stdout
+    return output.split()
+
+
+def print_report(title: str, report: Dict[str, Dict[str, float]], memory: bool):
+    """打印单次基准结果"""
+    print(f'== {title}')
+    for phase, stats in report.items():
+        line = f"  {phase:<8}{stats['seconds']:>10.4f}s{stats['per_second']:>12.1f} stmt/s"
+        if memory:
+            line += f"{stats['peak_mb']:>10.2f} MB"
+        print(line)
+
+
+def parse_sweep(text: str):
+    """解析 "参数=值1,值2,..." 形式的扫描参数"""
+    name, values = text.split('=', 1)
+    if name not in CORPUS_DEFAULTS:
+        raise argparse.ArgumentTypeError(f'未知的语料参数: {name}')
+    return name, [int(value) for value in values.split(',')]
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description='SQL血缘分析性能基准')
+    for name, default in CORPUS_DEFAULTS.items():
+        parser.add_argument(f'--{name}', type=int, default=default)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--sweep', type=parse_sweep,
+                        help='逐个取值运行以观察增长趋势，如 joins=1,2,4,8')
+    parser.add_argument('--phases', default=','.join(PHASES),
+                        help=f'逗号分隔的阶段，可选 {",".join(PHASES)}')
+    parser.add_argument('--memory', action='store_true', help='记录各阶段峰值内存')
+    parser.add_argument('--import-time', type=int, metavar='RUNS',
+                        help='只测量冷启动导入耗时，每个场景运行RUNS次')
+    parser.add_argument('--conformance', type=int, metavar='RUNS',
+                        help='只检查词法快速路径与完整解析的表血缘是否一致，使用RUNS组合成语料')
+    parser.add_argument('--lexer-profiles', action='store_true',
+                        help='只比较各词法器配置的耗时，并检查血缘结果是否相同')
+    parser.add_argument('files', nargs='*', help='一致性检查额外使用的SQL文件')
+    args = parser.parse_args(argv)
+
+    if args.import_time:
+        for name, seconds in measure_import_time(args.import_time).items():
+            print(f'  {name:<16}{seconds * 1000:>10.1f} ms')
+        eager = check_deferred_imports()
+        if eager:
+            print(f'导入分析核心时提前加载了: {", ".join(eager)}')
+            sys.exit(1)
+        return
+
+    if args.conformance:
+        total, fallbacks, mismatches = check_fast_tables(
+            iter_conformance_texts(args.conformance, args.files))
+        for text, actual, expected in mismatches:
+            print(f'不一致: {text.strip()[:200]}\n  快速路径: {actual}\n  完整解析: {expected}')
+        print(f'共 {total} 条语句，回退 {fallbacks} 条，不一致 {len(mismatches)} 条')
+        sys.exit(1 if mismatches else 0)
+
+    params = {name: getattr(args, name) for name in CORPUS_DEFAULTS}
+    if args.lexer_profiles:
+        report = compare_lexer_profiles(generate_corpus(seed=args.seed, **params))
+        base = report['default']
+        for profile, stats in report.items():
+            print(f"  {profile:<10}lex {stats['lex']:>8.4f}s ({base['lex'] / stats['lex']:.2f}x)"
+                  f"  analyze {stats['analyze']:>8.4f}s ({base['analyze'] / stats['analyze']:.2f}x)"
+                  f"  {'结果相同' if stats['same'] else '结果不同'}")
+        sys.exit(0 if all(stats['same'] for stats in report.values()) else 1)
+    phases = [phase for phase in args.phases.split(',') if phase]
+    runs = [(None, None)]
+    if args.sweep:
+        runs = [(args.sweep[0], value) for value in args.sweep[1]]
+
+    for name, value in runs:
+        if name:
+            params[name] = value
+        sql_str = generate_corpus(seed=args.seed, **params)
+        title = ' '.join(f'{key}={val}' for key, val in params.items())
+        print_report(title, run_benchmark(sql_str, args.memory, phases), args.memory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,439 @@
+"""
+SQL血缘分析常驻服务
+服务端在Unix套接字(或本机TCP端口)上监听，预热的工作进程常驻内存，
+并发请求合并成批次分发，相同的在途语句只分析一次；客户端只依赖标准库，
+启动时不导入 sqlparse 和 pyecharts。
+
+协议为按行分隔的JSON:
+    请求: {"id": 1, "sql": "...", "columns": true} 或 {"id": 2, "op": "stats"}
+    响应: {"id": 1, "results": [...]} 或 {"id": 1, "error": "..."}
+
+用法:
+    python daemon.py serve --jobs 4
+    python daemon.py analyze a.sql b.sql
+    echo "insert into a select * from b" | python daemon.py analyze
+    python daemon.py stats
+"""
+
+import argparse
+import errno
+import io
+import json
+import os
+import socket
+import stat
+import sys
+import tempfile
+from typing import List
+
+DEFAULT_SOCKET = os.path.join(tempfile.gettempdir(), f'bloodline-{os.getuid()}.sock'
+                              if hasattr(os, 'getuid') else 'bloodline.sock')
+MAX_LINE = 64 * 1024 * 1024  # 单个请求的最大字节数
+
+def _remove_stale_socket(socket_path: str):
+    """启动前检查Unix套接字路径，只删除没有服务监听的残留套接字
+
+    Raises:
+        OSError: 已有服务在该套接字上监听，或路径已存在但不是套接字
+    """
+    try:
+        mode = os.stat(socket_path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise OSError(errno.EEXIST, '路径已存在且不是套接字', socket_path)
+
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(socket_path)
+    except (ConnectionRefusedError, FileNotFoundError):
+        # 上次服务异常退出留下的套接字文件
+        os.unlink(socket_path)
+        return
+    finally:
+        probe.close()
+    raise OSError(errno.EADDRINUSE, '血缘分析服务已在运行', socket_path)
+
+
+def _warm_worker():
+    """工作进程初始化: 导入分析模块并预热词法分析器"""
+    from MainDef import analyze_sql_text
+    analyze_sql_text('INSERT INTO a SELECT b.c FROM b')
+
+
+def _ping():
+    """空任务，用于启动时拉起全部工作进程"""
+    return os.getpid()
+
+
+def _analyze_batch(items: List[tuple], limits=None) -> List[tuple]:
+    """在工作进程中分析一批语句
+
+    Args:
+        items: [(SQL文本, 是否分析字段血缘), ...]
+        limits: 单条语句的大小和时间限制(MainDef.StatementLimits)
+
+    Returns:
+        List[tuple]: 与输入一一对应的 (True, 记录列表) 或 (False, 错误信息)，
+            单条语句失败时记录中包含error字段
+    """
+    from MainDef import iter_bloodline_records
+
+    outcomes = []
+    for sql_text, columns in items:
+        try:
+            records = []
+            for record in iter_bloodline_records(io.StringIO(sql_text), None, columns, limits=limits):
+                del record['file']
+                records.append(record)
+            outcomes.append((True, records))
+        except Exception as e:
+            outcomes.append((False, f'{type(e).__name__}: {e}'))
+    return outcomes
+
+
+class BloodlineServer:
+    """血缘分析服务端
+
+    Args:
+        jobs: 工作进程数，为0时在服务进程的线程中分析
+        batch_size: 每批最多包含的语句数，批次按工作进程数拆分后分发
+        batch_window: 等待凑批的最长时间(秒)
+        cache_size: 内存结果缓存的条目数
+        limits: 单条语句的大小和时间限制(MainDef.StatementLimits)，在工作进程中执行
+    """
+    def __init__(self, jobs: int = None, batch_size: int = 64,
+                 batch_window: float = 0.002, cache_size: int = 10000, limits=None):
+        from MainDef import BloodlineCache
+        self.jobs = (os.cpu_count() or 1) if jobs is None else jobs
+        self.limits = limits
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.cache = BloodlineCache(cache_size)
+        self.executor = None
+        self.server = None
+        self._queue = None
+        self._batcher = None
+        self._inflight = {}  # 缓存键 -> 等待结果的Future
+        self._slots = None   # 限制同时执行的批次数
+        self.counters = {'requests': 0, 'batches': 0, 'statements': 0, 'coalesced': 0}
+
+    async def start(self, socket_path: str = DEFAULT_SOCKET, host: str = None, port: int = None):
+        """预热工作进程并开始监听
+
+        Args:
+            socket_path: Unix套接字路径，指定port时忽略
+            host: TCP监听地址，默认为127.0.0.1
+            port: TCP端口
+
+        Raises:
+            OSError: 套接字上已有服务在监听或端口已被占用
+        """
+        import asyncio
+        loop = asyncio.get_running_loop()
+        if port is None:
+            # 已有服务在监听时不启动工作进程，直接报错
+            _remove_stale_socket(socket_path)
+
+        # 1. 启动并预热工作进程
+        if self.jobs > 0:
+            from concurrent.futures import ProcessPoolExecutor
+            self.executor = ProcessPoolExecutor(self.jobs, initializer=_warm_worker)
+            await asyncio.gather(*(loop.run_in_executor(self.executor, _ping)
+                                   for _ in range(self.jobs)))
+        else:
+            from concurrent.futures import ThreadPoolExecutor
+            self.executor = ThreadPoolExecutor(1, initializer=_warm_worker)
+            await loop.run_in_executor(self.executor, _ping)
+
+        # 2. 启动批处理任务
+        self._queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(max(1, self.jobs))
+        self._batcher = asyncio.create_task(self._batch_loop())
+
+        # 3. 开始监听
+        if port is not None:
+            self.server = await asyncio.start_server(self._handle, host or '127.0.0.1', port,
+                                                     limit=MAX_LINE)
+        else:
+            self.server = await asyncio.start_unix_server(self._handle, socket_path, limit=MAX_LINE)
+            os.chmod(socket_path, 0o600)
+
+    async def serve_forever(self):
+        """持续提供服务，退出时关闭工作进程"""
+        try:
+            async with self.server:
+                await self.server.serve_forever()
+        finally:
+            self._batcher.cancel()
+            self.executor.shutdown(cancel_futures=True)
+
+    async def analyze(self, sql_text: str, columns: bool = True) -> tuple:
+        """分析一段SQL文本，命中缓存直接返回，相同的在途语句共享同一结果
+
+        Returns:
+            tuple: (True, 记录列表) 或 (False, 错误信息)
+        """
+        import asyncio
+        self.counters['requests'] += 1
+        key = self.cache.make_key(sql_text, columns)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return True, cached
+
+        future = self._inflight.get(key)
+        if future is not None:
+            self.counters['coalesced'] += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            self._inflight[key] = future
+            self._queue.put_nowait((key, sql_text, columns, future))
+        # 共享的Future不随单个请求的取消而取消
+        return await asyncio.shield(future)
+
+    async def _batch_loop(self):
+        """从队列中凑批: 等待首个请求后，在时间窗口内继续收集，直到达到批大小
+
+        凑好的批次按工作进程数拆成大小相近的若干块，分别交给不同的工作进程并行分析。
+        """
+        import asyncio
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.batch_window
+            while len(batch) < self.batch_size:
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            chunks = max(1, min(self.jobs, len(batch)))
+            size = -(-len(batch) // chunks)
+            for start in range(0, len(batch), size):
+                await self._slots.acquire()
+                asyncio.create_task(self._run_batch(batch[start:start + size]))
+
+    async def _run_batch(self, batch: List[tuple]):
+        """将一批语句交给工作进程，并把结果分发给等待的请求"""
+        import asyncio
+        self.counters['batches'] += 1
+        self.counters['statements'] += len(batch)
+        try:
+            items = [(sql_text, columns) for _, sql_text, columns, _ in batch]
+            outcomes = await asyncio.get_running_loop().run_in_executor(
+                self.executor, _analyze_batch, items, self.limits)
+        except Exception as e:
+            outcomes = [(False, f'{type(e).__name__}: {e}')] * len(batch)
+        finally:
+            self._slots.release()
+
+        for (key, _, _, future), outcome in zip(batch, outcomes):
+            self._inflight.pop(key, None)
+            # 超过限制或出错的结果不缓存
+            if outcome[0] and all(record.get('status') == 'ok' for record in outcome[1]):
+                self.cache.put(key, outcome[1])
+            if not future.done():
+                future.set_result(outcome)
+
+    def stats(self) -> dict:
+        """服务统计"""
+        stats = dict(self.counters)
+        stats['jobs'] = self.jobs
+        stats['inflight'] = len(self._inflight)
+        stats['cache'] = self.cache.stats()
+        return stats
+
+    async def _handle(self, reader, writer):
+        """处理一个连接: 同一连接上的请求可以流水线发送，响应按完成顺序返回"""
+        import asyncio
+        tasks = set()
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (asyncio.LimitOverrunError, ValueError):
+                    writer.write(b'{"id": null, "error": "request too large"}\n')
+                    break
+                if not line:
+                    break
+                task = asyncio.create_task(self._respond(line, writer))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, line: bytes, writer):
+        """解析单个请求并写回响应"""
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get('id')
+            if request.get('op') == 'stats':
+                response = {'id': request_id, 'stats': self.stats()}
+            elif request.get('op') == 'ping':
+                response = {'id': request_id, 'pong': True}
+            else:
+                ok, value = await self.analyze(request['sql'], request.get('columns', True))
+                response = {'id': request_id, 'results' if ok else 'error': value}
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            response = {'id': request_id, 'error': f'无效请求: {e}'}
+        writer.write(json.dumps(response, ensure_ascii=False).encode('utf-8') + b'\n')
+        await writer.drain()
+
+
+class BloodlineClient:
+    """血缘分析服务的轻量客户端，只依赖标准库
+
+    Args:
+        socket_path: Unix套接字路径，指定port时忽略
+        host: 服务端地址
+        port: 服务端TCP端口
+        timeout: 套接字超时时间(秒)
+    """
+    def __init__(self, socket_path: str = DEFAULT_SOCKET, host: str = None,
+                 port: int = None, timeout: float = 60):
+        if port is not None:
+            self.sock = socket.create_connection((host or '127.0.0.1', port), timeout)
+        else:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.settimeout(timeout)
+            self.sock.connect(socket_path)
+        self.file = self.sock.makefile('rwb')
+        self._next_id = 0
+
+    def _send(self, request: dict) -> int:
+        self._next_id += 1
+        request['id'] = self._next_id
+        self.file.write(json.dumps(request, ensure_ascii=False).encode('utf-8') + b'\n')
+        return self._next_id
+
+    def _receive(self, count: int) -> dict:
+        """读取count个响应，返回 请求id -> 响应"""
+        self.file.flush()
+        responses = {}
+        for _ in range(count):
+            line = self.file.readline()
+            if not line:
+                raise ConnectionError('服务端已关闭连接')
+            response = json.loads(line)
+            responses[response['id']] = response
+        return responses
+
+    def analyze_many(self, sql_texts: List[str], columns: bool = True) -> List[dict]:
+        """一次发送多个请求并等待全部响应
+
+        Returns:
+            List[dict]: 与输入一一对应的响应，成功时包含results，失败时包含error
+        """
+        ids = [self._send({'sql': sql_text, 'columns': columns}) for sql_text in sql_texts]
+        responses = self._receive(len(ids))
+        return [responses[request_id] for request_id in ids]
+
+    def analyze(self, sql_text: str, columns: bool = True) -> List[dict]:
+        """分析一段SQL文本，返回每条语句的血缘记录，失败时抛出RuntimeError"""
+        response = self.analyze_many([sql_text], columns)[0]
+        if 'error' in response:
+            raise RuntimeError(response['error'])
+        return response['results']
+
+    def stats(self) -> dict:
+        """服务端统计"""
+        request_id = self._send({'op': 'stats'})
+        return self._receive(1)[request_id]['stats']
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='SQL血缘分析常驻服务')
+    parser.add_argument('command', choices=('serve', 'analyze', 'stats'))
+    parser.add_argument('paths', nargs='*', help='analyze时的SQL文件，省略时从标准输入读取')
+    parser.add_argument('--socket', default=DEFAULT_SOCKET, help='Unix套接字路径')
+    parser.add_argument('--host', help='TCP地址，默认为127.0.0.1')
+    parser.add_argument('--port', type=int, help='使用本机TCP端口代替Unix套接字')
+    parser.add_argument('-j', '--jobs', type=int, help='工作进程数，默认为CPU核数')
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--batch-window', type=float, default=2.0, help='凑批等待时间(毫秒)')
+    parser.add_argument('--no-columns', action='store_true', help='只分析表血缘')
+    parser.add_argument('--max-bytes', type=int, help='serve: 单条语句的最大字节数')
+    parser.add_argument('--max-tokens', type=int, help='serve: 单条语句的最大token数')
+    parser.add_argument('--timeout', type=float, help='serve: 单条语句的分析时间上限(秒)')
+    args = parser.parse_intermixed_args(argv)
+
+    if args.command == 'serve':
+        import asyncio
+
+        limits = None
+        if args.max_bytes or args.max_tokens or args.timeout:
+            from MainDef import StatementLimits
+            limits = StatementLimits(args.max_bytes, args.max_tokens, args.timeout)
+
+        async def serve():
+            server = BloodlineServer(args.jobs, args.batch_size, args.batch_window / 1000,
+                                     limits=limits)
+            await server.start(args.socket, args.host, args.port)
+            print(f"血缘分析服务已启动: {args.port or args.socket}", file=sys.stderr)
+            await server.serve_forever()
+
+        try:
+            asyncio.run(serve())
+        except KeyboardInterrupt:
+            pass
+        except OSError as e:
+            print(f"启动血缘分析服务失败: {e}", file=sys.stderr)
+            return 2
+        return 0
+
+    try:
+        client = BloodlineClient(args.socket, args.host, args.port)
+    except OSError as e:
+        print(f"连接血缘分析服务失败: {e}", file=sys.stderr)
+        return 2
+
+    with client:
+        if args.command == 'stats':
+            print(json.dumps(client.stats(), ensure_ascii=False))
+            return 0
+
+        names = args.paths or ['<stdin>']
+        texts = []
+        for path in args.paths:
+            with open(path, encoding='utf-8') as file:
+                texts.append(file.read())
+        if not args.paths:
+            texts.append(sys.stdin.read())
+
+        errors = 0
+        for name, response in zip(names, client.analyze_many(texts, not args.no_columns)):
+            if 'error' in response:
+                errors += 1
+                print(f"分析失败: {name}: {response['error']}", file=sys.stderr)
+                continue
+            for record in response['results']:
+                if 'error' in record:
+                    errors += 1
+                    print(f"分析失败: {name}#{record['index']}: {record['error']}", file=sys.stderr)
+                print(json.dumps(dict(file=name, **record), ensure_ascii=False))
+        return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -15,6 +15,11 @@ Copyright (c) 2024 by Shaowen He, All Rights Reserved.
 # CurrentConfig.NOTEBOOK_TYPE = NotebookType.JUPYTER_NOTEBOOK
 
 
+import argparse
+import json
+import sys
+from typing import Iterator, List, Union
+
 from MainDef import *
 
 
@@ -28,14 +33,12 @@ def process_sql_visualization(sql_str: str):
         for stmt in statements:
             analyzer.reset()
 
-            # 分析血缘关系
-            table_bloodline = analyzer.analyze_table_bloodline(stmt)
+            # 分析血缘关系(表和字段一次遍历完成)
+            table_bloodline, column_bloodline = analyzer.analyze_bloodline(stmt)
             if not table_bloodline:
                 print(f"警告: 在SQL语句中没有找到表名: {stmt}")
                 continue
 
-            column_bloodline = analyzer.analyze_column_bloodline(stmt)
-
             # 创建可视化
             table_viz = visualizer.create_table_tree(
                 analyzer.state.table_names,
@@ -58,17 +61,138 @@ def process_sql_visualization(sql_str: str):
         print(f"处理SQL可视化时发生错误: {e}")
 
 
-if __name__ == '__main__':
-
-    # 创建分析器和可视化器实例
-    analyzer = BloodlineAnalyzer()
-    visualizer = BloodlineVisualizer()
+def process_sql_report(sql_str: str, file_path: str = 'bloodline_report.html') -> str:
+    """分析SQL语句并将所有图表写入同一个HTML报告，不依赖Jupyter"""
+    try:
+        analyzer = BloodlineAnalyzer()
+        report = BloodlineReport()
 
-    # 读取SQL文件
-    sql_str = get_sqlstr('example_complex_sql.sql')
+        for stmt in parse_statements(sql_str):
+            analyzer.reset()
+            result = analyzer.analyze(stmt)
+            if not result.table_names:
+                print(f"警告: 在SQL语句中没有找到表名: {stmt}")
+                continue
+            report.add(result, str(stmt))
 
-    # 可视化
-    process_sql_visualization(sql_str)
+        return report.render(file_path)
 
+    except Exception as e:
+        print(f"生成血缘报告时发生错误: {e}")
+        return ""
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """命令行参数"""
+    parser = argparse.ArgumentParser(
+        description='分析SQL表血缘和字段血缘，每条语句输出一行JSON')
+    parser.add_argument('paths', nargs='*',
+                        help='SQL文件、目录或通配符，"-" 或省略时从标准输入读取')
+    parser.add_argument('-o', '--output', help='输出文件，默认为标准输出')
+    parser.add_argument('-j', '--jobs', type=int, help='工作进程数，默认为CPU核数')
+    parser.add_argument('--no-columns', action='store_true', help='只分析表血缘')
+    parser.add_argument('--cache-dir', help='持久化缓存目录')
+    parser.add_argument('--report', help='同时生成单页HTML血缘报告')
+    parser.add_argument('--max-bytes', type=int, help='单条语句的最大字节数，超过时跳过')
+    parser.add_argument('--max-tokens', type=int, help='单条语句的最大token数，超过时跳过')
+    parser.add_argument('--timeout', type=float, help='单条语句的分析时间上限(秒)')
+    parser.add_argument('--fallback', choices=('tables', 'skip'), default='tables',
+                        help='超过限制后只输出表血缘(tables)或跳过(skip)')
+    parser.add_argument('--lexer', choices=LEXER_PROFILES, default='default',
+                        help='词法器配置，lineage 为合并规则表的快速词法器，结果与默认相同')
+    parser.add_argument('--route', action='store_true',
+                        help='按语句类型分流: INSERT/CREATE AS/MERGE分析字段血缘，'
+                             'SELECT只分析表血缘，SET/USE/DROP等DDL跳过')
+    parser.add_argument('--query-log', action='store_true',
+                        help='输入为JSONL查询日志，只有字面量不同的语句只分析一次，'
+                             '记录附带出现次数和首次/最后出现时间')
+    parser.add_argument('--sql-field', default=QUERY_LOG_SQL_FIELD, help='查询日志中语句文本的字段')
+    parser.add_argument('--time-field', default=QUERY_LOG_TIME_FIELD, help='查询日志中执行时间的字段')
+    return parser
+
+
+def build_limits(args) -> Union[StatementLimits, None]:
+    """根据参数创建单条语句限制，未设置任何限制时返回None"""
+    if args.max_bytes is None and args.max_tokens is None and args.timeout is None:
+        return None
+    return StatementLimits(args.max_bytes, args.max_tokens, args.timeout, args.fallback)
+
+
+def iter_records(args) -> Iterator[dict]:
+    """按参数顺序分析文件和标准输入，逐条生成记录"""
+    columns = not args.no_columns
+    limits = build_limits(args)
+    paths = args.paths or ['-']
+    if args.query_log:
+        yield from iter_query_log_records(args, paths, columns, limits)
+        return
+    batch = []
+    for path in paths + [None]:
+        if path is not None and path != '-':
+            batch.append(path)
+            continue
+        if batch:
+            yield from iter_path_records(batch, args.jobs, columns, args.cache_dir, limits,
+                                         args.route)
+            batch = []
+        if path == '-':
+            cache = get_cache(args.cache_dir) if args.cache_dir else None
+            yield from iter_bloodline_records(sys.stdin, '<stdin>', columns, cache, limits,
+                                              args.route)
+
+
+def iter_query_log_records(args, paths: List[str], columns: bool,
+                           limits: Union[StatementLimits, None]) -> Iterator[dict]:
+    """读取全部查询日志并按指纹去重后逐条生成记录"""
+    log = QueryLog(args.sql_field, args.time_field)
+    log.ingest_paths(paths)
+    print(f"读取查询日志 {log.rows} 行，去重后 {len(log)} 条语句", file=sys.stderr)
+    yield from log.iter_records(args.jobs, columns, args.cache_dir, limits, args.route)
+
+
+def run_cli(argv: List[str] = None) -> int:
+    """命令行入口
+
+    Returns:
+        int: 退出码，有语句分析失败时为1
+    """
+    args = build_parser().parse_args(argv)
+    if not args.paths and sys.stdin.isatty():
+        build_parser().print_help(sys.stderr)
+        return 2
+    set_lexer_profile(args.lexer)
+
+    report = BloodlineReport() if args.report else None
+    total = errors = skipped = routed = 0
+    # 使用较大的缓冲区，减少逐行写出的系统调用
+    output = args.output or sys.stdout.fileno()
+    with open(output, 'w', encoding='utf-8', buffering=1 << 20,
+              closefd=args.output is not None) as writer:
+        for record in iter_records(args):
+            total += 1
+            if 'error' in record:
+                errors += 1
+                print(f"分析失败: {record['file']}#{record['index']}: {record['error']}",
+                      file=sys.stderr)
+            elif record['reason'] == 'route':
+                routed += 1
+            elif record['status'] != 'ok':
+                skipped += 1
+                print(f"超过限制: {record['file']}#{record['index']}: "
+                      f"{record['status']} {record['reason']}", file=sys.stderr)
+            if report is not None and 'error' not in record:
+                report.add(BloodlineResult(record['statement_type'], record['table_names'],
+                                           record.get('column_names', ())))
+            writer.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    if report is not None:
+        report.render(args.report)
+    summary = f"共分析 {total} 条语句，失败 {errors} 条，超过限制 {skipped} 条"
+    if args.route:
+        summary += f"，按类型跳过或只分析表血缘 {routed} 条"
+    print(summary, file=sys.stderr)
+    return 1 if errors else 0
 
 
+if __name__ == '__main__':
+    sys.exit(run_cli())
@@ -0,0 +1,81 @@
+"""
+多文件批量分析(analyze_paths)的测试: 结果顺序和单个文件失败的隔离
+
+运行: python -m pytest tests 或 python -m unittest discover tests
+"""
+
+import gzip
+import os
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from MainDef import analyze_paths
+
+FILES = {
+    'a.sql': 'INSERT INTO a SELECT x FROM src_a;',
+    'b.sql': 'INSERT INTO b SELECT x FROM src_b; INSERT INTO b2 SELECT y FROM b;',
+    'c.sql.gz': 'INSERT INTO c SELECT x FROM src_c;',
+    'sub/d.sql': 'INSERT INTO d SELECT x FROM src_d;',
+}
+
+
+class AnalyzePathsTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        for name, sql in FILES.items():
+            path = os.path.join(cls.directory.name, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            opener = gzip.open if name.endswith('.gz') else open
+            with opener(path, 'wt', encoding='utf-8') as file:
+                file.write(sql)
+        # 无法解码和损坏的压缩文件
+        cls.undecodable = os.path.join(cls.directory.name, 'bad.sql')
+        with open(cls.undecodable, 'wb') as file:
+            file.write(b'SELECT \xff\xfe FROM t;')
+        cls.corrupt = os.path.join(cls.directory.name, 'corrupt.sql.gz')
+        with open(cls.corrupt, 'wb') as file:
+            file.write(b'not gzip data')
+        cls.missing = os.path.join(cls.directory.name, 'missing.sql')
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.directory.cleanup()
+
+    def summarize(self, results):
+        return [(os.path.relpath(path, self.directory.name),
+                 [(result.status, result.render_table_bloodline()) for result in file_results])
+                for path, file_results in results]
+
+    def test_directory_order(self):
+        results = self.summarize(analyze_paths([self.directory.name], jobs=1))
+        self.assertEqual(['a.sql', 'b.sql', 'bad.sql', 'c.sql.gz', 'corrupt.sql.gz',
+                          os.path.join('sub', 'd.sql')], [path for path, _ in results])
+        self.assertEqual([('ok', "b->{'src_b'}"), ('ok', "b2->{'b'}")], results[1][1])
+
+    def test_process_pool_matches_serial(self):
+        paths = [self.missing, self.directory.name, self.corrupt]
+        serial = self.summarize(analyze_paths(paths, jobs=1))
+        self.assertEqual(serial, self.summarize(analyze_paths(paths, jobs=2)))
+
+    def test_failed_file_isolated(self):
+        paths = [self.missing, self.undecodable, self.corrupt,
+                 os.path.join(self.directory.name, 'a.sql')]
+        for jobs in (1, 2):
+            results = analyze_paths(paths, jobs=jobs)
+            self.assertEqual(paths, [path for path, _ in results])
+            for path, file_results in results[:3]:
+                self.assertEqual(1, len(file_results), path)
+                self.assertEqual('error', file_results[0].status, path)
+            self.assertTrue(results[0][1][0].reason.startswith('FileNotFoundError'))
+            self.assertTrue(results[1][1][0].reason.startswith('UnicodeDecodeError'))
+            self.assertEqual(['ok'], [result.status for result in results[3][1]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+"""
+血缘结果缓存(BloodlineCache)的测试: 内存LRU层、SQLite持久化层和进程内共享实例
+
+运行: python -m pytest tests 或 python -m unittest discover tests
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from MainDef import BloodlineCache, analyze_sql_text, get_cache
+
+SQL_TEXT = 'INSERT INTO a SELECT x, y FROM b'
+
+
+class BloodlineCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_key_normalization(self):
+        key = BloodlineCache.make_key(SQL_TEXT)
+        self.assertEqual(key, BloodlineCache.make_key(' INSERT INTO a\n SELECT x,  y FROM b;'))
+        self.assertNotEqual(key, BloodlineCache.make_key(SQL_TEXT, columns=False))
+        self.assertNotEqual(key, BloodlineCache.make_key('INSERT INTO a SELECT x, y FROM c'))
+
+    def test_memory_lru(self):
+        cache = BloodlineCache(maxsize=2)
+        for key in ('k1', 'k2'):
+            cache.put(key, key)
+        self.assertEqual('k1', cache.get('k1'))
+        cache.put('k3', 'k3')
+        # k2 最久未使用，被淘汰
+        self.assertIsNone(cache.get('k2'))
+        self.assertEqual(['k1', 'k3'], [cache.get('k1'), cache.get('k3')])
+        self.assertEqual({'hits': 3, 'misses': 1, 'hit_rate': 0.75, 'size': 2}, cache.stats())
+
+    def test_round_trip(self):
+        expected = [result.to_tuple() for result in analyze_sql_text(SQL_TEXT)]
+        cache = BloodlineCache(cache_dir=self.directory.name)
+        analyze_sql_text(SQL_TEXT, cache)
+        self.assertEqual((0, 1), (cache.hits, cache.misses))
+        cache.close()
+
+        # 新实例的内存层为空，结果从SQLite文件读出
+        cache = BloodlineCache(cache_dir=self.directory.name)
+        try:
+            results = analyze_sql_text(SQL_TEXT, cache)
+            self.assertEqual(expected, [result.to_tuple() for result in results])
+            self.assertEqual((1, 0), (cache.hits, cache.misses))
+        finally:
+            cache.close()
+
+    @unittest.skipUnless(hasattr(os, 'fork'), '需要 os.fork')
+    def test_fork_opens_own_connection(self):
+        parent = get_cache(self.directory.name)
+        self.addCleanup(parent.close)
+        self.assertIs(parent, get_cache(self.directory.name))
+        parent.put('parent', 'value')
+
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            status = 1
+            try:
+                os.close(read_fd)
+                child = get_cache(self.directory.name)
+                ok = (child is not parent and child._db is not parent._db
+                      and child.get('parent') == 'value')
+                child.put('child', 'value')
+                os.write(write_fd, b'ok' if ok else b'shared')
+                status = 0
+            finally:
+                os._exit(status)
+
+        os.close(write_fd)
+        with os.fdopen(read_fd, 'rb') as pipe:
+            message = pipe.read()
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual((b'ok', 0), (message, status))
+        # 父进程的连接在子进程退出后仍可用，并能读到子进程写入的结果
+        self.assertEqual('value', parent.get('child'))
+        self.assertIs(parent, get_cache(self.directory.name))
+
+
+if __name__ == '__main__':
+    unittest.main()
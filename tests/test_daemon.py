@@ -0,0 +1,64 @@
+"""
+常驻服务(daemon.py)启动时套接字处理的测试
+
+运行: python -m pytest tests 或 python -m unittest discover tests
+"""
+
+import asyncio
+import errno
+import os
+import socket
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from daemon import BloodlineServer, _remove_stale_socket
+
+
+@unittest.skipUnless(hasattr(socket, 'AF_UNIX'), 'Unix套接字不可用')
+class SocketStartupTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.socket_path = os.path.join(self.directory.name, 'bloodline.sock')
+
+    def listen(self):
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(self.socket_path)
+        listener.listen()
+        return listener
+
+    def test_live_socket_refused(self):
+        with self.listen():
+            with self.assertRaises(OSError) as context:
+                _remove_stale_socket(self.socket_path)
+            self.assertEqual(errno.EADDRINUSE, context.exception.errno)
+            self.assertTrue(os.path.exists(self.socket_path))
+
+            # 服务端在启动工作进程之前就拒绝启动
+            server = BloodlineServer(jobs=0)
+            with self.assertRaises(OSError):
+                asyncio.run(server.start(self.socket_path))
+            self.assertIsNone(server.executor)
+
+    def test_stale_socket_removed(self):
+        self.listen().close()
+        self.assertTrue(os.path.exists(self.socket_path))
+        _remove_stale_socket(self.socket_path)
+        self.assertFalse(os.path.exists(self.socket_path))
+        _remove_stale_socket(self.socket_path)
+
+    def test_regular_file_kept(self):
+        with open(self.socket_path, 'w') as file:
+            file.write('data')
+        with self.assertRaises(OSError):
+            _remove_stale_socket(self.socket_path)
+        self.assertTrue(os.path.exists(self.socket_path))
+
+
+if __name__ == '__main__':
+    unittest.main()
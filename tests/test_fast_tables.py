@@ -0,0 +1,153 @@
+"""
+词法快速路径与完整解析的一致性测试，以及依赖的 sqlparse 分组行为
+
+快速路径(FastTableAnalyzer)在词法流上用关键字状态机提取表名，无法确定的写法回退到
+完整解析；token上限(FAST_PATH_MAX_TOKENS)按 sqlparse 的分组上限设定。
+
+运行: python -m pytest tests 或 python -m unittest discover tests
+"""
+
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import sqlparse
+from sqlparse.engine import grouping
+
+from MainDef import (FAST_PATH_MAX_TOKENS, BloodlineAnalyzer, BloodlineCache,
+                     FastTableAnalyzer, LineageLexer, analyze_sql_text, parse_statements)
+from benchmark import check_fast_tables, iter_conformance_texts
+
+# 固定语料之外，逐条覆盖快速路径中容易与完整解析不一致的写法
+EDGE_CASES = [
+    'SELECT a, b FROM t1 JOIN t2 ON t1.id = t2.id WHERE t1.x > 1',
+    'SELECT * FROM db.t1 AS x LEFT JOIN db.t2 y USING (id)',
+    'INSERT INTO target SELECT a FROM src',
+    'INSERT INTO target (a, b) SELECT a, b FROM src',
+    'INSERT INTO db.target (a) VALUES (1)',
+    'INSERT OVERWRITE TABLE target SELECT * FROM src',
+    'INSERT INTO t SELECT x AS orders FROM orders',
+    'WITH c AS (SELECT a FROM src) SELECT a FROM c',
+    'WITH c AS (SELECT a FROM src) INSERT INTO target SELECT a FROM c',
+    'WITH c1 AS (SELECT a FROM s1), c2 AS (SELECT a FROM c1 JOIN s2 ON c1.a = s2.a) '
+    'SELECT * FROM c2',
+    'CREATE TABLE target AS SELECT a FROM src',
+    'CREATE TABLE target (a INT, b VARCHAR(10))',
+    'UPDATE target SET a = 1 WHERE b IN (SELECT b FROM src)',
+    'DELETE FROM target WHERE id IN (SELECT id FROM src)',
+    'SELECT a FROM (SELECT a FROM (SELECT a FROM src) s1) s2',
+    'SELECT a FROM t1 UNION ALL SELECT a FROM t2',
+    'SELECT CASE WHEN a > 1 THEN b ELSE c END AS d FROM t',
+    'SELECT count(*) FROM t GROUP BY a HAVING count(*) > 1 ORDER BY 1',
+    'SELECT a FROM t WHERE ' + ' AND '.join(f'c{i} = {i}' for i in range(120)),
+    'SELECT a FROM t1, t2 x, db.t3 AS y WHERE t1.id = x.id',
+    'SELECT a FROM t1 JOIN t2 USING (id) JOIN t3 ON t2.id = t3.id',
+    'SELECT a FROM t GROUP BY a UNION SELECT b FROM s',
+    'SELECT a FROM (t1 JOIN t2 ON t1.id = t2.id)',
+    'SELECT a FROM t WHERE x IN (SELECT x FROM s) AND NOT EXISTS (SELECT 1 FROM u)',
+    'SELECT sum(a) OVER (PARTITION BY b ORDER BY c DESC) FROM t',
+]
+
+# 快速路径回退到完整解析的写法
+UNSUPPORTED = [
+    'SELECT a FROM generate_series(1, 10) g',
+    'SELECT a, (SELECT max(b) FROM s) AS m FROM t',
+    'SELECT CASE WHEN a IN (SELECT a FROM s) THEN 1 END FROM t',
+    'SELECT a FROM t WINDOW w AS (PARTITION BY a)',
+    'SELECT a FROM t1; SELECT b FROM t2',
+]
+
+
+def nested_subqueries(depth: int) -> str:
+    """depth层嵌套子查询的INSERT语句"""
+    return ('INSERT INTO out_t SELECT a FROM ' + '(SELECT a FROM ' * depth + 'src_t'
+            + ') s' * depth)
+
+
+class FastTablesConformanceTest(unittest.TestCase):
+    """快速路径给出结果时，必须与完整解析的 analyze_tables 相同"""
+
+    def assert_conformance(self, texts):
+        total, fallbacks, mismatches = check_fast_tables(texts)
+        self.assertEqual([], [(text.strip()[:200], actual, expected)
+                              for text, actual, expected in mismatches])
+        return total, fallbacks
+
+    def test_fixed_corpus(self):
+        example = os.path.join(ROOT, 'example_complex_sql.sql')
+        total, fallbacks = self.assert_conformance(iter_conformance_texts(5, [example]))
+        self.assertGreater(total, 100)
+        # 语料以快速路径支持的写法为主，全部回退说明快速路径失效
+        self.assertLess(fallbacks, total // 2)
+
+    def test_edge_cases(self):
+        total, fallbacks = self.assert_conformance(EDGE_CASES)
+        self.assertLess(fallbacks, total)
+
+    def test_unsupported_falls_back(self):
+        for sql in UNSUPPORTED:
+            self.assertIsNone(FastTableAnalyzer().analyze(sql), sql)
+        self.assert_conformance(UNSUPPORTED)
+
+    def test_lineage_lexer_matches_default(self):
+        lexer = LineageLexer()
+        default = sqlparse.lexer.Lexer.get_default_instance()
+        for text in EDGE_CASES + ['CREATE FUNCTION f() AS $$ SELECT 1; $$; /* c */ -- x\n']:
+            self.assertEqual(list(default.get_tokens(text)), list(lexer.get_tokens(text)))
+        self.assertEqual(default.is_keyword('SELECT'), lexer.is_keyword('SELECT'))
+
+
+class SqlparseGroupingTest(unittest.TestCase):
+    """MainDef 依赖的 sqlparse 分组行为"""
+
+    def test_grouping_limits(self):
+        self.assertEqual(100, grouping.MAX_GROUPING_DEPTH)
+        self.assertEqual(FAST_PATH_MAX_TOKENS, grouping.MAX_GROUPING_TOKENS)
+
+    def test_grouping_depth_degrades_per_statement(self):
+        self.assertEqual('ok', analyze_sql_text(nested_subqueries(49))[0].status)
+        result = analyze_sql_text(nested_subqueries(50))[0]
+        self.assertEqual('skipped', result.status)
+        self.assertTrue(result.reason.startswith('parse_error'))
+
+        # 同一文本中的其它语句不受影响
+        results = analyze_sql_text(nested_subqueries(50) + '; SELECT a FROM t')
+        self.assertEqual(['skipped', 'ok'], [result.status for result in results])
+
+    def test_walk_depth_unlimited(self):
+        # 只有 sqlparse 的分组深度限制遍历，能解析的嵌套子查询都能得到完整血缘
+        for depth in (33, 49):
+            result = analyze_sql_text(nested_subqueries(depth))[0]
+            self.assertEqual('ok', result.status)
+            self.assertFalse(result.truncated)
+            self.assertEqual("out_t->{'src_t'}", result.render_table_bloodline())
+
+    def test_truncated_result_not_cached(self):
+        cache = BloodlineCache()
+        sql = nested_subqueries(10)
+        result = analyze_sql_text(sql, cache, BloodlineAnalyzer(max_depth=20))[0]
+        self.assertTrue(result.truncated)
+        self.assertEqual(('truncated', 'max_depth'), (result.status, result.reason))
+        self.assertIsNone(cache.get(cache.make_key(sql)))
+
+    def test_token_limit(self):
+        sql = 'INSERT INTO o SELECT ' + ', '.join(f'c{i}' for i in range(3400)) + ' FROM s'
+        result = analyze_sql_text(sql)[0]
+        self.assertEqual('skipped', result.status)
+        self.assertTrue(result.reason.startswith('parse_error'))
+        self.assertIsNone(FastTableAnalyzer().analyze(sql))
+
+    def test_insert_column_list_groups_as_function(self):
+        # INSERT INTO t (a, b) 分组为 Function(Identifier, Parenthesis)，目标表取函数名
+        stmt = next(parse_statements('INSERT INTO t (a, b) SELECT a, b FROM s'))
+        function = next(token for token in stmt.tokens
+                        if isinstance(token, sqlparse.sql.Function))
+        self.assertEqual('t', function.get_name())
+        self.assertEqual(('t', 's'), analyze_sql_text(str(stmt))[0].table_names)
+
+
+if __name__ == '__main__':
+    unittest.main()
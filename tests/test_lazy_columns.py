@@ -0,0 +1,58 @@
+"""
+延迟字段血缘(analyze_sql_text(lazy=True))的测试
+
+运行: python -m pytest tests 或 python -m unittest discover tests
+"""
+
+import os
+import pickle
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from MainDef import BloodlineCache, analyze_sql_text
+
+SQL_TEXT = ('INSERT INTO a SELECT x, y FROM b; '
+            'INSERT INTO c SELECT a.x, d.z FROM a JOIN d ON a.k = d.k')
+
+
+class LazyColumnsTest(unittest.TestCase):
+
+    def assert_same(self, expected, actual):
+        self.assertEqual([result.to_tuple() for result in expected],
+                         [result.to_tuple() for result in actual])
+
+    def test_matches_full_analysis(self):
+        full = analyze_sql_text(SQL_TEXT)
+        for keep_trees in (True, False):
+            results = analyze_sql_text(SQL_TEXT, lazy=True, keep_trees=keep_trees)
+            self.assertTrue(all(result.columns_pending for result in results))
+            self.assertEqual([result.table_names for result in full],
+                             [result.table_names for result in results])
+            self.assert_same(full, results)
+
+    def test_pending_result_survives_pickle(self):
+        result = analyze_sql_text(SQL_TEXT, lazy=True)[1]
+        restored = pickle.loads(pickle.dumps(result))
+        self.assertTrue(restored.columns_pending)
+        self.assertEqual(analyze_sql_text(SQL_TEXT)[1].to_tuple(), restored.to_tuple())
+
+    def test_loaded_results_written_to_cache(self):
+        for keep_trees in (True, False):
+            cache = BloodlineCache()
+            key = cache.make_key(SQL_TEXT)
+            results = analyze_sql_text(SQL_TEXT, cache, lazy=True, keep_trees=keep_trees)
+            self.assertIsNone(cache.get(key))
+
+            # 只有同一文本的结果全部分析完字段血缘后才写入
+            results[0].column_names
+            self.assertIsNone(cache.get(key))
+            results[1].column_names
+            self.assert_same(analyze_sql_text(SQL_TEXT), cache.get(key))
+            self.assertIs(results, analyze_sql_text(SQL_TEXT, cache, lazy=True))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+"""
+跨语句、跨文件表血缘图(LineageGraph)与传递影响分析(ImpactAnalyzer)的测试
+
+运行: python -m pytest tests 或 python -m unittest discover tests
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from MainDef import (FastTableAnalyzer, ImpactAnalyzer, LineageGraph, analyze_paths,
+                     analyze_sql_text)
+
+FILES = {
+    'load.sql': 'INSERT INTO dw.fact (id, v) SELECT id, amount FROM raw.orders;',
+    'report.sql': ('WITH f AS (SELECT id, v FROM dw.fact) '
+                   'INSERT INTO rpt SELECT id, sum(v) FROM f GROUP BY id;'),
+}
+
+
+class QualifiedTargetTest(unittest.TestCase):
+    """带列清单的目标表取表名，不带列清单"""
+
+    def test_target_table(self):
+        cases = {
+            'INSERT INTO fact (id, v) SELECT id, v FROM src': 'fact',
+            'INSERT INTO dw.fact (id, v) SELECT id, v FROM src': 'dw.fact',
+            'INSERT INTO dw.fact(id) VALUES (1)': 'dw.fact',
+            'INSERT INTO cat.dw.fact (id) SELECT id FROM src': 'cat.dw.fact',
+        }
+        for sql, target in cases.items():
+            self.assertEqual(target, analyze_sql_text(sql)[0].target_table)
+            self.assertEqual(target, analyze_sql_text(sql, columns=False)[0].target_table)
+            fast = FastTableAnalyzer().analyze(sql)
+            if fast is not None:
+                self.assertEqual(target, fast[0].target_table)
+
+
+class LineageGraphTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        for name, sql in FILES.items():
+            with open(os.path.join(cls.directory.name, name), 'w', encoding='utf-8') as file:
+                file.write(sql)
+        cls.graph = LineageGraph()
+        cls.graph.add_results(analyze_paths([cls.directory.name], jobs=1))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.directory.cleanup()
+
+    def test_edges_across_files(self):
+        self.assertEqual({'dw.fact'}, self.graph.downstream_of('raw.orders'))
+        # WITH子句名称展开为其定义中引用的表
+        self.assertEqual({'dw.fact'}, self.graph.upstream_of('rpt'))
+
+    def test_transitive_impact(self):
+        impact = ImpactAnalyzer.from_graph(self.graph)
+        self.assertEqual({'dw.fact', 'rpt'}, impact.downstream('raw.orders'))
+        self.assertEqual({'raw.orders', 'dw.fact'}, impact.upstream('rpt'))
+
+
+if __name__ == '__main__':
+    unittest.main()
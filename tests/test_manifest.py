@@ -0,0 +1,87 @@
+"""
+增量分析清单(BloodlineManifest)的测试
+
+运行: python -m pytest tests 或 python -m unittest discover tests
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from MainDef import BloodlineManifest
+
+
+class ManifestRefreshTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.manifest_path = os.path.join(self.directory.name, 'manifest.pkl')
+        self.sql_dir = self.make_dir('sql')
+        self.other_dir = self.make_dir('other')
+
+    def make_dir(self, name):
+        path = os.path.join(self.directory.name, name)
+        os.mkdir(path)
+        return path
+
+    def write(self, directory, name, sql):
+        path = os.path.join(directory, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(sql)
+        return path
+
+    def refresh(self, paths):
+        manifest = BloodlineManifest(self.manifest_path)
+        results = manifest.refresh(paths, jobs=1)
+        return manifest, dict(results)
+
+    def test_incremental(self):
+        a = self.write(self.sql_dir, 'a.sql', 'INSERT INTO a SELECT x FROM s')
+        b = self.write(self.sql_dir, 'b.sql', 'INSERT INTO b SELECT x FROM s')
+        manifest, _ = self.refresh([self.sql_dir])
+        self.assertEqual([a, b], manifest.added)
+
+        self.write(self.sql_dir, 'b.sql', 'INSERT INTO b SELECT y FROM u')
+        manifest, results = self.refresh([self.sql_dir])
+        self.assertEqual(([], [b]), (manifest.added, manifest.changed))
+        self.assertEqual(('b', 'u'), results[b][0].table_names)
+
+    def test_deleted_file_in_scanned_root_removed(self):
+        a = self.write(self.sql_dir, 'a.sql', 'INSERT INTO a SELECT x FROM s')
+        b = self.write(self.sql_dir, 'b.sql', 'INSERT INTO b SELECT x FROM s')
+        self.refresh([self.sql_dir])
+        os.remove(b)
+        manifest, _ = self.refresh([self.sql_dir])
+        self.assertEqual([b], manifest.removed)
+        self.assertEqual([a], list(manifest.entries))
+
+    def test_unscanned_root_kept(self):
+        a = self.write(self.sql_dir, 'a.sql', 'INSERT INTO a SELECT x FROM s')
+        c = self.write(self.other_dir, 'c.sql', 'INSERT INTO c SELECT x FROM s')
+        self.refresh([self.sql_dir, self.other_dir])
+
+        # 只扫描其中一个目录时，另一目录的结果保留
+        manifest, results = self.refresh([self.sql_dir])
+        self.assertEqual([], manifest.removed)
+        self.assertEqual({a, c}, set(manifest.entries))
+        self.assertEqual([a], list(results))
+
+    def test_stat_failure_kept(self):
+        a = self.write(self.sql_dir, 'a.sql', 'INSERT INTO a SELECT x FROM s')
+        self.refresh([a])
+        os.remove(a)
+
+        # 显式给出但无法读取的文件返回失败结果，清单中的原结果保留
+        manifest, results = self.refresh([a])
+        self.assertEqual('error', results[a][0].status)
+        self.assertEqual([], manifest.removed)
+        self.assertIn(a, manifest.entries)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+"""
+分阶段性能统计(BloodlineProfiler)的测试
+
+运行: python -m pytest tests 或 python -m unittest discover tests
+"""
+
+import gc
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from MainDef import BloodlineAnalyzer, BloodlineProfiler, parse_statements
+
+
+class ProfilerRecordTest(unittest.TestCase):
+
+    def test_statement_record_follows_object(self):
+        profiler = BloodlineProfiler()
+        analyzer = BloodlineAnalyzer(profiler=profiler)
+        stmt = next(parse_statements('SELECT a FROM t', profiler))
+        analyzer.analyze_tables(stmt)
+        self.assertEqual(1, len(profiler.statements))
+        self.assertIs(profiler.statements[0], profiler.statement(stmt))
+        self.assertIn('table_walk', profiler.statements[0].phases)
+
+    def test_released_statement_not_reused(self):
+        profiler = BloodlineProfiler()
+        for index in range(50):
+            stmt = next(parse_statements(f'SELECT a FROM t{index}', profiler))
+            # 已释放语句的记录不会被占用相同id的新语句取到
+            self.assertEqual(index, profiler.statement(stmt).index)
+            del stmt
+            gc.collect()
+        self.assertEqual(50, len(profiler.statements))
+        self.assertEqual(0, len(profiler._records))
+
+
+if __name__ == '__main__':
+    unittest.main()
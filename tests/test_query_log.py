@@ -0,0 +1,111 @@
+"""
+查询日志指纹去重(fingerprint_sql、QueryLog)的测试
+
+运行: python -m pytest tests 或 python -m unittest discover tests
+"""
+
+import io
+import json
+import os
+import sys
+import unittest
+from datetime import datetime, timezone
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import MainDef
+from MainDef import QueryLog, fingerprint_sql, parse_log_timestamp
+
+LOG_ROWS = [
+    {'query': "INSERT INTO a SELECT x FROM b WHERE id = 1", 'timestamp': '2024-01-02T00:00:00'},
+    {'query': "SELECT z FROM d"},
+    {'query': "INSERT INTO a  SELECT x FROM b\nWHERE id = 42;", 'timestamp': 1704067200},
+    {'query': "SELECT y FROM c WHERE k IN (1, 2, 3)", 'timestamp': 1704153600000},
+    {'query': "INSERT INTO a SELECT x FROM b WHERE id = 'z' -- c",
+     'timestamp': '2024-01-03T08:00:00+08:00'},
+    {'query': "SELECT y FROM c WHERE k IN ('a')"},
+]
+
+
+def log_file(rows) -> io.StringIO:
+    return io.StringIO(''.join(json.dumps(row) + '\n' for row in rows))
+
+
+class FingerprintTest(unittest.TestCase):
+
+    def test_literals_and_whitespace(self):
+        base = fingerprint_sql("SELECT a FROM t WHERE b = 1 AND c = 'x'")
+        for sql in ("SELECT a FROM t WHERE b = 2 AND c = 'y'",
+                    "SELECT  a\nFROM t /* c */ WHERE b = -3.5 AND c = ''; ",
+                    "SELECT a FROM t WHERE b = :p AND c = ?"):
+            self.assertEqual(base, fingerprint_sql(sql), sql)
+
+    def test_in_list_collapsed(self):
+        base = fingerprint_sql('SELECT a FROM t WHERE b IN (1)')
+        self.assertEqual(base, fingerprint_sql("SELECT a FROM t WHERE b IN (1, -2, 'x')"))
+        # 含非字面量的列表和子查询不折叠
+        self.assertNotEqual(base, fingerprint_sql('SELECT a FROM t WHERE b IN (1, c)'))
+        self.assertNotEqual(base, fingerprint_sql('SELECT a FROM t WHERE b IN (SELECT b FROM s)'))
+
+    def test_identifiers_kept(self):
+        base = fingerprint_sql('SELECT a FROM t')
+        self.assertNotEqual(base, fingerprint_sql('SELECT a FROM u'))
+        self.assertNotEqual(base, fingerprint_sql('SELECT a FROM "T"'))
+
+
+class QueryLogTest(unittest.TestCase):
+
+    def setUp(self):
+        self.log = QueryLog()
+        self.log.ingest(log_file(LOG_ROWS), 'q.jsonl')
+
+    def test_deduplicated_entries(self):
+        self.assertEqual(len(LOG_ROWS), self.log.rows)
+        self.assertEqual([], self.log.errors)
+        self.assertEqual([('q.jsonl:1', 3), ('q.jsonl:2', 1), ('q.jsonl:4', 2)],
+                         [(entry.source, entry.count) for entry in self.log.entries()])
+
+        entry = self.log.entries()[0]
+        self.assertEqual(LOG_ROWS[0]['query'], entry.sql_text)
+        # 不同格式的时间统一为UTC后比较
+        self.assertEqual(datetime(2024, 1, 1, tzinfo=timezone.utc), entry.first_seen)
+        self.assertEqual(datetime(2024, 1, 3, tzinfo=timezone.utc), entry.last_seen)
+        self.assertEqual((None, None), (self.log.entries()[1].first_seen,
+                                        self.log.entries()[1].last_seen))
+
+    def test_each_fingerprint_analyzed_once(self):
+        with mock.patch.object(MainDef, 'analyze_query_records',
+                               wraps=MainDef.analyze_query_records) as analyze:
+            records = list(self.log.iter_records(jobs=1, columns=False))
+        self.assertEqual(3, analyze.call_count)
+
+        insert = next(record for record in records if record['count'] == 3)
+        self.assertEqual('q.jsonl:1', insert['file'])
+        self.assertEqual('2024-01-01T00:00:00+00:00', insert['first_seen'])
+        self.assertEqual('2024-01-03T00:00:00+00:00', insert['last_seen'])
+
+    def test_bad_rows_recorded(self):
+        log = QueryLog()
+        log.ingest(io.StringIO('not json\n{"sql": "SELECT 1"}\n'
+                               '{"query": "SELECT 1", "timestamp": "yesterday"}\n\n'
+                               '{"query": "SELECT 2"}\n'), 'bad.jsonl')
+        self.assertEqual(['bad.jsonl:1', 'bad.jsonl:2', 'bad.jsonl:3'],
+                         [source for source, _ in log.errors])
+        self.assertEqual(1, len(log))
+        records = list(log.iter_records(jobs=1, columns=False))
+        self.assertEqual(3, sum(record['index'] is None for record in records))
+
+    def test_parse_log_timestamp(self):
+        expected = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        for value in (1704067200, 1704067200000, '2024-01-01T00:00:00',
+                      '2024-01-01T08:00:00+08:00'):
+            self.assertEqual(expected, parse_log_timestamp(value), value)
+        self.assertIsNone(parse_log_timestamp(None))
+        with self.assertRaises(ValueError):
+            parse_log_timestamp(True)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+"""
+单条语句大小和时间限制(StatementLimits)的测试
+
+运行: python -m pytest tests 或 python -m unittest discover tests
+"""
+
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from MainDef import (BloodlineAnalyzer, StatementLimitError, StatementLimits,
+                     analyze_sql_text, iter_grouped_statements)
+
+
+class TimeoutAnalyzer(BloodlineAnalyzer):
+    """字段血缘分析总是超时，tables 为True时表血缘分析也超时"""
+
+    def __init__(self, tables=False):
+        super().__init__()
+        self.tables = tables
+        self.table_calls = 0
+
+    def analyze(self, statement):
+        raise StatementLimitError('timeout')
+
+    def analyze_tables(self, statement):
+        self.table_calls += 1
+        # 退化分析必须在自己的时间预算内进行
+        if self.deadline is None:
+            raise AssertionError('analyze_tables without deadline')
+        if self.tables:
+            raise StatementLimitError('timeout')
+        return super().analyze_tables(statement)
+
+
+class TimeoutFallbackTest(unittest.TestCase):
+    limits = StatementLimits(timeout=30)
+
+    def test_fast_path_fallback(self):
+        analyzer = TimeoutAnalyzer()
+        result, = analyze_sql_text('INSERT INTO t SELECT a FROM s', analyzer=analyzer,
+                                   limits=self.limits)
+        self.assertEqual(('tables_only', 'timeout'), (result.status, result.reason))
+        self.assertEqual(('t', 's'), result.table_names)
+        self.assertEqual(0, analyzer.table_calls)
+
+    def test_bounded_tree_fallback(self):
+        # 快速路径不支持的语法在新的时间预算内遍历语法树
+        sql = 'INSERT INTO t SELECT a FROM generate_series(1, 10) g JOIN s ON g.a = s.a'
+        analyzer = TimeoutAnalyzer()
+        result, = analyze_sql_text(sql, analyzer=analyzer, limits=self.limits)
+        self.assertEqual('tables_only', result.status)
+        self.assertEqual(analyze_sql_text(sql, columns=False)[0].table_names,
+                         result.table_names)
+        self.assertEqual(1, analyzer.table_calls)
+
+        result, = analyze_sql_text(sql, analyzer=TimeoutAnalyzer(tables=True),
+                                   limits=self.limits)
+        self.assertEqual(('skipped', 'timeout'), (result.status, result.reason))
+
+    def test_skip_fallback(self):
+        limits = StatementLimits(timeout=30, fallback='skip')
+        result, = analyze_sql_text('INSERT INTO t SELECT a FROM s', analyzer=TimeoutAnalyzer(),
+                                   limits=limits)
+        self.assertEqual(('skipped', 'timeout'), (result.status, result.reason))
+
+
+class TokenLimitTest(unittest.TestCase):
+
+    def test_whitespace_run_counts_once(self):
+        # 注释不计数，连续空白合并为一个token
+        compact = 'SELECT a FROM t'
+        spaced = 'SELECT   a /* c */\n\tFROM   t'
+        for sql in (compact, spaced):
+            (stmt, error), = iter_grouped_statements(sql, max_tokens=7)
+            self.assertIsNone(error)
+            with self.assertRaises(StatementLimitError):
+                list(iter_grouped_statements(sql, max_tokens=6))
+
+
+if __name__ == '__main__':
+    unittest.main()
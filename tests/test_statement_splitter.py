@@ -0,0 +1,89 @@
+"""
+流式切分语句(iter_sql_texts)与 sqlparse.split 的一致性测试
+
+运行: python -m pytest tests 或 python -m unittest discover tests
+"""
+
+import bz2
+import gzip
+import io
+import lzma
+import os
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import sqlparse
+
+from MainDef import iter_sql_texts, iter_statements, open_sql_file
+
+# 容易在分号处切错的写法，每段之间以换行连接成一个文件
+SPLIT_CASES = [
+    "INSERT INTO t SELECT 'a;b' FROM s;",
+    "SELECT \"x;y\", `z;w` FROM t;",
+    "SELECT 'it''s; here' FROM t;",
+    "SELECT 'back\\'slash;' FROM t;",
+    "SELECT a -- comment; not a boundary\nFROM t;",
+    "SELECT /* block; comment\n spanning; lines */ a FROM t;",
+    "SELECT a FROM t WHERE b IN (SELECT b FROM s);",
+    "CREATE FUNCTION f() RETURNS int AS $$ SELECT 1; SELECT 2; $$ LANGUAGE sql;",
+    "CREATE FUNCTION g() RETURNS int AS $body$ BEGIN RETURN 1; END; $body$ LANGUAGE plpgsql;",
+    "SELECT a$b FROM t;",
+    "CREATE PROCEDURE p() BEGIN INSERT INTO t SELECT a FROM s; UPDATE t SET a = 1; END;",
+    "DECLARE x INT; BEGIN SELECT 1; END;",
+    "SELECT 1; SELECT 2;",
+    "SELECT a FROM t",
+]
+
+
+def split_with_sqlparse(text: str) -> list:
+    """sqlparse.split 的切分结果，去掉首尾空白和空语句"""
+    return [part.strip() for part in sqlparse.split(text) if part.strip()]
+
+
+def split_streaming(file) -> list:
+    """iter_sql_texts 的切分结果，去掉首尾空白和空语句"""
+    return [text.strip() for text in iter_sql_texts(file) if text.strip()]
+
+
+class SplitterParityTest(unittest.TestCase):
+    """逐行读取切分的语句与 sqlparse.split 一致"""
+
+    def test_each_case(self):
+        for case in SPLIT_CASES:
+            self.assertEqual(split_with_sqlparse(case), split_streaming(io.StringIO(case)),
+                             case)
+
+    def test_joined_file(self):
+        text = '\n'.join(SPLIT_CASES)
+        self.assertEqual(split_with_sqlparse(text), split_streaming(io.StringIO(text)))
+
+    def test_binary_file(self):
+        text = '\n'.join(SPLIT_CASES)
+        file = io.BytesIO(text.encode('utf-8'))
+        file.mode = 'rb'
+        self.assertEqual(split_with_sqlparse(text), split_streaming(file))
+
+
+class CompressedSourceTest(unittest.TestCase):
+    """压缩文件按扩展名解压后切分"""
+
+    def test_compressed_files(self):
+        text = '\n'.join(SPLIT_CASES)
+        with tempfile.TemporaryDirectory() as directory:
+            for suffix, opener in (('.sql', open), ('.sql.gz', gzip.open),
+                                   ('.sql.bz2', bz2.open), ('.sql.xz', lzma.open)):
+                path = os.path.join(directory, 'input' + suffix)
+                with opener(path, 'wt', encoding='utf-8') as file:
+                    file.write(text)
+                with open_sql_file(path) as file:
+                    self.assertEqual(split_with_sqlparse(text), split_streaming(file), suffix)
+                self.assertEqual(len(split_with_sqlparse(text)), len(list(iter_statements(path))),
+                                 suffix)
+
+
+if __name__ == '__main__':
+    unittest.main()